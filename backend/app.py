@@ -12,7 +12,7 @@ from backend.config import get_config
 from backend.models import User
 from backend.db import init_app_db, SessionLocal, db as flask_sqlalchemy_db
 from backend.utils import (
-    serialize_for_js, nl2br, markdown_to_html_filter, truncate_filter,
+    nl2br, markdown_to_html_filter, truncate_filter,
     zfill_filter, htmlsafe_json_filter, map_priority_to_benefit_filter
 )
 # --- Asset Imports ---
@@ -31,10 +31,13 @@ import backend.routes.review_routes as review_routes_mod
 import backend.routes.data_management_routes as data_management_routes_mod
 import backend.routes.main_routes as main_routes_mod
 import backend.routes.api_routes as api_routes_mod
+import backend.routes.job_routes as job_routes_mod
 # --- END FIX ---
 
 # --- Service Imports (now only needed by routes, but we'll leave it for now) ---
-from backend.services import step_service, dashboard_service
+from backend.services import (
+    step_service, dashboard_service, data_version_service, delta_service, tag_service, job_service
+)
 
 
 login_manager = LoginManager()
@@ -101,6 +104,28 @@ def create_app(init_session=True):
 
     db_instance, migrate_instance = init_app_db(app)
 
+    # Bump data versions on commits so per-worker caches know when to rebuild
+    data_version_service.register_listeners()
+    # Record tombstones for deleted/renamed catalog rows so delta exports can replay them
+    delta_service.register_listeners()
+    # Tag ids are resolved from a per-worker cache; publish new tags on commit and fill it now
+    tag_service.register_listeners()
+    with app.app_context():
+        try:
+            tag_service.warm_cache(SessionLocal())
+        except Exception as e:
+            # e.g. 'flask db upgrade' before the tags table exists; the cache fills on first use.
+            print(f"Tag cache not warmed at startup: {e}")
+        finally:
+            SessionLocal.remove()
+        # Jobs left queued/running by a worker that died (e.g. the one this process replaces)
+        try:
+            job_service.recover_lost_jobs(SessionLocal())
+        except Exception as e:
+            print(f"Lost background jobs not recovered at startup: {e}")
+        finally:
+            SessionLocal.remove()
+
     # Conditionally initialize Flask-Session
     if init_session:
         # Flask-Session configuration
@@ -137,6 +162,7 @@ def create_app(init_session=True):
     app.register_blueprint(data_management_routes_mod.data_management_bp)
     app.register_blueprint(main_routes_mod.main_routes)
     app.register_blueprint(api_routes_mod.api_bp)
+    app.register_blueprint(job_routes_mod.job_routes)
     # --- END FIX ---
 
     @app.route('/debug-check')
@@ -4,6 +4,7 @@ from flask_assets import Bundle
 # Define a JavaScript bundle. We will add more files to this later.
 # The order matters: main.js should come last as it executes the initializers.
 js_main_bundle = Bundle(
+    'js/entity_data.js',            # Expands the compact entity lists; used by the files below
     'js/breadcrumb_ui.js',
     'js/inline_table_edit.js',      # <-- FIX: Added for inline editing
     'js/usecase_overview.js',       # <-- FIX: Added for use case filtering
@@ -28,7 +28,12 @@ class Config:
     ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
     GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
     OLLAMA_BASE_URL = os.environ.get('OLLAMA_BASE_URL')
-    MAX_CHAT_HISTORY_LENGTH = int(os.environ.get('MAX_CHAT_HISTORY_LENGTH', 10))
+    # Chat history sent with each message is the newest turns that fit this many tokens
+    LLM_CHAT_HISTORY_TOKEN_BUDGET = int(os.environ.get('LLM_CHAT_HISTORY_TOKEN_BUDGET', 6000))
+    # Fold turns that fall out of the budget into a rolling summary (one extra LLM call, in the background)
+    LLM_CHAT_SUMMARIZE_OLDER_TURNS = os.environ.get('LLM_CHAT_SUMMARIZE_OLDER_TURNS', 'false').lower() in ('1', 'true', 'yes')
+    # Conversations untouched for this many days are deleted
+    LLM_CONVERSATION_RETENTION_DAYS = int(os.environ.get('LLM_CONVERSATION_RETENTION_DAYS', 30))
 
     # Apollo LLM API settings
     APOLLO_CLIENT_ID = os.environ.get('APOLLO_CLIENT_ID')
@@ -41,6 +46,55 @@ class Config:
         'APOLLO_LLM_API_BASE_URL',
         "https://api-gw.boehringer-ingelheim.com/apollo/llm-api"
     )
+    # Access tokens are shared by all workers through files here (default <instance>/apollo_tokens)
+    # and renewed in the background once they are this close to expiry.
+    APOLLO_TOKEN_CACHE_DIR = os.environ.get('APOLLO_TOKEN_CACHE_DIR')
+    APOLLO_TOKEN_REFRESH_MARGIN_SECONDS = int(os.environ.get('APOLLO_TOKEN_REFRESH_MARGIN_SECONDS', 300))
+
+    # Background jobs (imports/exports run outside the request, see job_service)
+    # Pool processes per web worker; artifacts default to <instance>/job_artifacts.
+    JOB_WORKER_PROCESSES = int(os.environ.get('JOB_WORKER_PROCESSES', 1))
+    JOB_ARTIFACT_DIR = os.environ.get('JOB_ARTIFACT_DIR')
+    JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 7))
+    # Jobs run in the pool of the web worker that accepted them. A running job whose heartbeat is this
+    # old, or a job queued this long, lost its worker (restart, OOM, timeout) and is marked failed.
+    JOB_HEARTBEAT_TIMEOUT_SECONDS = int(os.environ.get('JOB_HEARTBEAT_TIMEOUT_SECONDS', 300))
+    JOB_QUEUED_TIMEOUT_SECONDS = int(os.environ.get('JOB_QUEUED_TIMEOUT_SECONDS', 6 * 3600))
+
+    # Available model lists, cached per credential set and refreshed in the background
+    # once stale; a first lookup waits this long for slow providers, then answers without them.
+    LLM_MODELS_TTL_SECONDS = int(os.environ.get('LLM_MODELS_TTL_SECONDS', 300))
+    LLM_MODELS_PROBE_WAIT_SECONDS = float(os.environ.get('LLM_MODELS_PROBE_WAIT_SECONDS', 2))
+
+    # Persistent LLM response cache (see llm_cache_service); requests can bypass it with use_cache=false.
+    LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    LLM_CACHE_TTL_SECONDS = int(os.environ.get('LLM_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+    LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 5000))
+    # Usernames (comma separated) allowed to clear the shared cache; nobody by default
+    LLM_CACHE_ADMINS = os.environ.get('LLM_CACHE_ADMINS', '')
+
+    # Bulk LLM enrichment jobs (see enrichment_service): parallel calls per job,
+    # retries per entity and requests per minute per provider ("provider:rpm", 0 = no limit).
+    # The limits are global: all workers and job processes take turns through files in
+    # RATE_LIMIT_DIR (default <instance>/rate_limits), which must be on a shared local disk.
+    ENRICHMENT_CONCURRENCY = int(os.environ.get('ENRICHMENT_CONCURRENCY', 8))
+    ENRICHMENT_MAX_RETRIES = int(os.environ.get('ENRICHMENT_MAX_RETRIES', 2))
+    ENRICHMENT_RATE_LIMITS = os.environ.get(
+        'ENRICHMENT_RATE_LIMITS', 'openai:500,anthropic:50,google:60,apollo:120,ollama:0'
+    )
+    RATE_LIMIT_DIR = os.environ.get('RATE_LIMIT_DIR')
+
+    # Map-reduce questions over a data prep selection (see map_reduce_service): context window
+    # per provider ("provider:tokens"), the chunk size cap and parallel chunk calls per job.
+    # Retries and rate limits are the ENRICHMENT_* settings above.
+    LLM_CONTEXT_WINDOWS = os.environ.get(
+        'LLM_CONTEXT_WINDOWS', 'openai:128000,anthropic:200000,google:1000000,apollo:128000,ollama:8192'
+    )
+    LLM_MAP_REDUCE_CHUNK_TOKENS = int(os.environ.get('LLM_MAP_REDUCE_CHUNK_TOKENS', 30000))
+    LLM_MAP_REDUCE_CONCURRENCY = int(os.environ.get('LLM_MAP_REDUCE_CONCURRENCY', 8))
+
+    # Import previews and bulk edit selections kept server side (see draft_service)
+    DRAFT_TTL_SECONDS = int(os.environ.get('DRAFT_TTL_SECONDS', 3600 * 4))
 
     # Add other configuration variables here
     # Example: UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
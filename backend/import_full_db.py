@@ -1,9 +1,19 @@
 # UsecaseExplorer/backend/import_full_db.py
+"""
+Restores a full database export (plain or NDJSON, optionally gzip/zstd
+compressed) into the configured database, keeping the exported ids.
 
+    python backend/import_full_db.py [path] [--workers N] [--batch-size N]
+                                     [--work-dir DIR] [--no-clear] [--restart]
+
+Batches are committed one by one and recorded in a checkpoint under the work
+directory; running the same command again after a failure resumes where it
+stopped.
+"""
+
+import argparse
 import sys
 import os
-import json
-import time
 import traceback
 
 # Add the parent directory of backend to the sys.path
@@ -11,64 +21,60 @@ import traceback
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from backend.app import create_app
-from backend.services.data_management_service import import_database_from_json
-from backend.db import SessionLocal
+from backend.db import db
+from backend.services import restore_service
 
 # --- Configuration ---
-# Path inside the Docker container
+# Default path inside the Docker container
 CONTAINER_JSON_PATH = '/app/exported_db.json'
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Restore a full database export.")
+    parser.add_argument('path', nargs='?', default=CONTAINER_JSON_PATH,
+                        help=f"Export file (.json, .ndjson, optionally .gz/.zst). Default: {CONTAINER_JSON_PATH}")
+    parser.add_argument('--workers', type=int, default=restore_service.RESTORE_WORKERS,
+                        help="Tables/batches loaded concurrently (forced to 1 on SQLite).")
+    parser.add_argument('--batch-size', type=int, default=restore_service.RESTORE_BATCH_SIZE,
+                        help="Rows per committed batch.")
+    parser.add_argument('--work-dir',
+                        help="Spool and checkpoint directory. Default: <path>.restore")
+    parser.add_argument('--no-clear', action='store_true',
+                        help="Do not clear existing data; abort if the target tables are not empty.")
+    parser.add_argument('--restart', action='store_true',
+                        help="Ignore an existing checkpoint and start over.")
+    return parser.parse_args(argv)
+
+
 # --- Main Script Logic ---
 if __name__ == "__main__":
-    print("Starting full database import script...")
+    args = parse_args()
+    print("Starting full database restore...")
 
-    # 1. Load JSON data from the specified path
-    if not os.path.exists(CONTAINER_JSON_PATH):
-        print(
-            f"Error: JSON file not found at '{CONTAINER_JSON_PATH}'. "
-            "Please ensure it was copied into the container."
-        )
+    if not os.path.exists(args.path):
+        print(f"Error: export file not found at '{args.path}'.")
         sys.exit(1)
+    work_dir = args.work_dir or f"{args.path}.restore"
 
-    print(f"Loading JSON data from {CONTAINER_JSON_PATH}...")
-    try:
-        with open(CONTAINER_JSON_PATH, 'r', encoding='utf-8') as f:
-            json_data = f.read()
-        print("JSON data loaded successfully.")
-    except Exception as e:
-        print(f"Error reading JSON file: {e}")
-        sys.exit(1)
-
-    # 2. Create a Flask application context for database operations
-    print("Creating Flask application context...")
-    app = create_app()
+    app = create_app(init_session=False)
     with app.app_context():
-        print("Flask app context entered. Proceeding with database import...")
-        
-        # Optional: Give database a moment if it just started
-        # time.sleep(5)
-
-        # 3. Call the import service function directly
         try:
-            result = import_database_from_json(json_data, clear_existing_data=True)
-            
-            print("\n--- IMPORT RESULT ---")
-            print(f"Success: {result['success']}")
-            print(f"Message: {result['message']}")
-            print("---------------------")
-
-            if not result['success']:
-                print("Database import failed. Check messages above for details.")
-                sys.exit(1)
+            results = restore_service.restore_database(
+                db.engine, args.path, work_dir,
+                workers=args.workers, batch_size=args.batch_size,
+                clear=not args.no_clear, restart=args.restart
+            )
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
         except Exception as e:
-            print(f"An unexpected error occurred during database import: {e}")
+            print(f"Restore failed: {e}")
             traceback.print_exc()
+            print(f"Committed batches are kept; run the same command again to resume (checkpoint in {work_dir}).")
             sys.exit(1)
-        finally:
-            # Ensure the SQLAlchemy session is closed
-            SessionLocal.remove()
-            print("SQLAlchemy session removed.")
 
-    print("Database import script finished.")
-    sys.exit(0)
\ No newline at end of file
+    skipped = sum(skipped for _, skipped in results.values())
+    if skipped:
+        print(f"{skipped} rows were skipped because they referenced missing rows or themselves.")
+    print("Database restore finished.")
+    sys.exit(0)
@@ -1,5 +1,5 @@
 # /backend/models.py
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime, CheckConstraint, UniqueConstraint, Table
+from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime, CheckConstraint, UniqueConstraint, Table, LargeBinary
 from sqlalchemy.orm import relationship, declarative_base, sessionmaker, scoped_session
 from sqlalchemy.sql import func
 from passlib.hash import pbkdf2_sha256
@@ -73,6 +73,7 @@ class Area(Base):
     name = Column(String(255), unique=True, nullable=False)
     description = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
 
     process_steps = relationship("ProcessStep", back_populates="area", cascade="all, delete-orphan")
     usecase_relevance = relationship("UsecaseAreaRelevance", back_populates="target_area", cascade="all, delete-orphan")
@@ -368,4 +369,166 @@ class LLMSettings(Base):
     user = relationship("User", back_populates="llm_settings")
 
     def __repr__(self):
-        return f"<LLMSettings(user_id={self.user_id})>"
\ No newline at end of file
+        return f"<LLMSettings(user_id={self.user_id})>"
+
+# --- DataVersion Model ---
+class DataVersion(Base):
+    """
+    Monotonic change counters for groups of tables (e.g. 'catalog' for
+    areas, process steps and use cases). Bumped in the same transaction as
+    the change, so every worker can cheaply tell whether its caches are stale.
+    """
+    __tablename__ = 'data_versions'
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+    def __repr__(self):
+        return f"<DataVersion(name='{self.name}', version={self.version})>"
+
+
+# --- DeletedRecord Model ---
+class DeletedRecord(Base):
+    """
+    Tombstone for a deleted (or re-keyed) catalog row, used by delta exports.
+    natural_key is the JSON key that identifies the row across instances
+    (names / BI_IDs, never database ids). replaced_by holds the new key when
+    the row was renamed rather than deleted.
+    """
+    __tablename__ = 'deleted_records'
+
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String(100), nullable=False)
+    natural_key = Column(Text, nullable=False)
+    replaced_by = Column(Text, nullable=True)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<DeletedRecord(table='{self.table_name}', key={self.natural_key})>"
+
+
+class BackgroundJob(Base):
+    """
+    An import or export run outside the request by job_service. params and
+    result are JSON text; artifact_path points at the downloadable output
+    (under the instance folder) once the job has completed.
+    """
+    __tablename__ = 'background_jobs'
+
+    id = Column(Integer, primary_key=True)
+    job_type = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default='queued', index=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'), nullable=True, index=True)
+    params = Column(Text, nullable=True)
+    rows_processed = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)
+    message = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)
+    artifact_path = Column(String(500), nullable=True)
+    artifact_name = Column(String(255), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+    def __repr__(self):
+        return f"<BackgroundJob(id={self.id}, type='{self.job_type}', status='{self.status}')>"
+
+
+class Draft(Base):
+    """
+    Server-side scratch data for multi-step flows (import previews, bulk edits),
+    stored zlib-compressed by draft_service. Only the opaque token travels in
+    the Flask session; rows are deleted once used or after expires_at.
+    """
+    __tablename__ = 'drafts'
+
+    token = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=True, index=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<Draft(kind='{self.kind}', user_id={self.user_id})>"
+
+
+class LLMResponseCache(Base):
+    """
+    Completed LLM responses keyed by a hash of everything that determines them
+    (provider, model, prompts, messages, image digest, sampling parameters).
+    Maintained by llm_cache_service; rows expire after expires_at and the least
+    recently used ones are evicted beyond LLM_CACHE_MAX_ENTRIES.
+    """
+    __tablename__ = 'llm_response_cache'
+
+    key = Column(String(64), primary_key=True)
+    provider = Column(String(50), nullable=False)
+    model = Column(String(255), nullable=False)
+    response = Column(Text, nullable=False)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<LLMResponseCache(provider='{self.provider}', model='{self.model}', hits={self.hit_count})>"
+
+
+class TokenCount(Base):
+    """
+    Per-field token counts of a process step or use case as serialized for
+    LLM data prep, kept by token_count_service. A row is recounted when the
+    entity's updated_at no longer matches source_updated_at.
+    """
+    __tablename__ = 'llm_token_counts'
+
+    entity_type = Column(String(20), primary_key=True)  # 'process_step' or 'use_case'
+    entity_id = Column(Integer, primary_key=True)
+    encoding = Column(String(50), nullable=False)
+    source_updated_at = Column(DateTime(timezone=True), nullable=True)
+    counts = Column(Text, nullable=False)  # JSON object: field name -> tokens
+
+    def __repr__(self):
+        return f"<TokenCount(entity_type='{self.entity_type}', entity_id={self.entity_id})>"
+
+
+class Conversation(Base):
+    """
+    An LLM chat conversation, kept by conversation_service. Only its id is
+    stored in the Flask session. summary holds a rolling summary of the turns
+    up to summarized_through_id that no longer fit the history token budget.
+    """
+    __tablename__ = 'llm_conversations'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    summary = Column(Text, nullable=True)
+    summarized_through_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+
+    messages = relationship("ConversationMessage", back_populates="conversation",
+                            cascade="all, delete-orphan", passive_deletes=True)
+
+    def __repr__(self):
+        return f"<Conversation(id={self.id}, user_id={self.user_id})>"
+
+
+class ConversationMessage(Base):
+    """One chat turn of a Conversation with its token count, so history can be trimmed to a token budget."""
+    __tablename__ = 'llm_conversation_messages'
+
+    id = Column(Integer, primary_key=True)
+    conversation_id = Column(Integer, ForeignKey('llm_conversations.id', ondelete='CASCADE'), nullable=False, index=True)
+    role = Column(String(20), nullable=False)  # 'user' or 'assistant'
+    content = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    conversation = relationship("Conversation", back_populates="messages")
+
+    def __repr__(self):
+        return f"<ConversationMessage(conversation_id={self.conversation_id}, role='{self.role}', tokens={self.token_count})>"
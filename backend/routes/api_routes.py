@@ -1,7 +1,6 @@
 # backend/routes/api_routes.py
-from flask import Blueprint, jsonify, g
-from ..models import Area, ProcessStep, UseCase
-from ..utils import serialize_for_js
+from flask import Blueprint, Response, jsonify, request, g
+from ..services import navigation_service
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -11,21 +10,18 @@ def get_navigation_data():
     Returns a single JSON object containing all the data required for the
     frontend navigation elements like breadcrumbs. This avoids passing
     this data to every single template.
+
+    The body is a per-worker snapshot that is only rebuilt when the catalog
+    changes. It carries a strong ETag so browsers revalidate and get a
+    304 Not Modified instead of downloading the full list again.
     """
     try:
-        # These are simple queries and should be efficient enough.
-        all_areas = g.db_session.query(Area).order_by(Area.name).all()
-        all_steps = g.db_session.query(ProcessStep).order_by(ProcessStep.name).all()
-        all_usecases = g.db_session.query(UseCase).order_by(UseCase.name).all()
-
-        # Using the existing serializer for consistency.
-        data = {
-            'areas': serialize_for_js(all_areas, 'area'),
-            'steps': serialize_for_js(all_steps, 'step'),
-            'usecases': serialize_for_js(all_usecases, 'usecase'),
-        }
-        return jsonify(data)
+        etag, body = navigation_service.get_navigation_snapshot(g.db_session)
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         # In a real app, log this error.
         print(f"Error in /api/navigation_data: {e}")
-        return jsonify(error="Failed to fetch navigation data"), 500
\ No newline at end of file
+        return jsonify(error="Failed to fetch navigation data"), 500
@@ -5,7 +5,6 @@ from sqlalchemy.exc import IntegrityError
 import traceback
 
 from ..models import Area, ProcessStep, UseCase
-from ..utils import serialize_for_js
 from ..services import area_service
 
 area_routes = Blueprint('areas', __name__,
@@ -1,15 +1,12 @@
 # backend/routes/data_management_routes.py
 import json
 from flask import Blueprint, g, render_template, request, flash, redirect, url_for, session, jsonify
-from flask_login import login_required
-from sqlalchemy.orm import joinedload
-from markupsafe import Markup, escape
+from flask_login import current_user, login_required
 
 # Import services
-from ..services import data_management_service, bulk_edit_service
+from ..services import data_management_service, bulk_edit_service, directory_service, draft_service, json_stream_service, job_service
 from ..models import Area, ProcessStep, UseCase
 from ..services.data_management_service import analyze_json_import, finalize_import
-from ..utils import serialize_for_js
 
 data_management_bp = Blueprint('data_management', __name__,
                                template_folder='../templates',
@@ -44,6 +41,9 @@ PROCESS_USECASE_EDITABLE_FIELDS = {
     "usecase_type_category": "Use Case Type Category"
 }
 
+# Last file extension accepted for a full database import (e.g. export.ndjson.gz -> 'gz')
+DATABASE_IMPORT_EXTENSIONS = {'json', 'ndjson', 'gz', 'zst'}
+
 # Map string entity names to their SQLAlchemy models and unique keys
 ENTITY_MAP = {
     'use_cases': {'model': UseCase, 'key': 'bi_id'},
@@ -52,35 +52,23 @@ ENTITY_MAP = {
 }
 
 
-def flash_import_result(result):
-    """Flashes a detailed message based on the import service result."""
-    flash_category = 'success'
-    if not result.get('success'):
-        flash_category = 'danger'
-    # Consider skipped/failed items as a warning, even if the overall process "succeeded"
-    elif result.get('skipped_count', 0) > 0 or result.get('failed_count', 0) > 0 or result.get('skipped_errors_details'):
-        flash_category = 'warning'
-
-    message = result.get('message', 'File processed.')
-
-    # Check for specific details to add to the message
-    details_html = ""
-    skipped_details = result.get('skipped_errors_details')
-    if skipped_details:
-        # Use set to avoid showing the exact same error message multiple times, then sort for consistent order
-        unique_details = sorted(list(set(skipped_details)))
-        details_html += "<h6>Details on Skipped/Failed Items:</h6><ul>"
-        for detail in unique_details:
-            details_html += f"<li>{escape(detail)}</li>"
-        details_html += "</ul>"
-
-    if details_html:
-        # Construct the final HTML string, but do not wrap it in Markup().
-        # This ensures a standard string is stored in the session.
-        final_html_message = f"<p>{escape(message)}</p>{details_html}"
-        flash(final_html_message, flash_category)
-    else:
-        flash(message, flash_category)
+# Previews and bulk edit selections can be megabytes; the Flask session only keeps a draft token.
+def _stash_draft(session_key, kind, data):
+    _discard_session_draft(session_key)
+    session[session_key] = draft_service.save_draft(g.db_session, current_user.id, kind, data)
+
+
+def _load_session_draft(session_key, kind):
+    token = session.get(session_key)
+    if not token:
+        return None
+    return draft_service.load_draft(g.db_session, token, current_user.id, kind)
+
+
+def _discard_session_draft(session_key):
+    token = session.pop(session_key, None)
+    if token:
+        draft_service.discard_draft(g.db_session, token)
 
 
 @data_management_bp.route('/', methods=['GET', 'POST'])
@@ -91,16 +79,19 @@ def data_management_page():
             file = request.files['database_file']
             if file.filename == '':
                 flash('No selected database file.', 'warning')
-            elif file and '.' in file.filename and file.filename.rsplit('.', 1)[1].lower() == 'json':
+            elif file and '.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in DATABASE_IMPORT_EXTENSIONS:
                 clear_data = request.form.get('clear_existing_data') == 'on'
                 try:
-                    file_content = file.read().decode('utf-8')
-                    result = data_management_service.import_database_from_json(file_content, clear_existing_data=clear_data)
-                    flash_import_result(result)
+                    # Runs in the job worker pool; the upload is saved with the job.
+                    job = job_service.enqueue_job(
+                        g.db_session, 'database_import', current_user.id,
+                        {'clear_existing_data': clear_data}, upload=file
+                    )
+                    flash(f"Database import queued as background job #{job.id}. Progress is shown under Background Jobs.", 'info')
                 except Exception as e:
                     flash(f"An unexpected error occurred during database import: {str(e)}", 'danger')
             else:
-                flash('Invalid file type for database import. Please upload a .json file.', 'danger')
+                flash('Invalid file type for database import. Please upload a .json, .ndjson, .gz or .zst export.', 'danger')
             return redirect(url_for('data_management.data_management_page'))
 
         file_handlers = {
@@ -123,65 +114,79 @@ def data_management_page():
 
                     if file_key == 'step_file' and options.get('is_preview'):
                         try:
-                            parsed_json_data = json.loads(file.read().decode('utf-8'))
+                            parsed_json_data = list(json_stream_service.iter_json_array(file.stream))
                             result = handler(parsed_json_data)
                             if result.get('success') and result.get('preview_data'):
-                                session['step_import_preview_data'] = result['preview_data']
+                                _stash_draft('step_import_preview_token', 'step_import_preview', result['preview_data'])
                                 flash('Step file uploaded. Please review changes before finalizing import.', 'info')
                                 return redirect(url_for('data_management.preview_steps_injection'))
                             elif not result.get('preview_data'):
                                  flash('Step file uploaded but no valid steps were found for import.', 'warning')
                             else:
                                 flash(result.get('message', 'Error processing step file.'), 'danger')
-                        except json.JSONDecodeError as e:
+                        except ValueError as e:
                             flash(f'Invalid JSON in step file: {e}', 'danger')
                     else:
-                        flash_import_result(handler(file.stream))
+                        try:
+                            job = job_service.enqueue_job(
+                                g.db_session, 'entity_import', current_user.id, {'file_key': file_key}, upload=file
+                            )
+                            flash(f"Import of {file.filename} queued as background job #{job.id}. Progress is shown under Background Jobs.", 'info')
+                        except Exception as e:
+                            flash(f"Failed to queue the import of {file.filename}: {e}", 'danger')
 
                     return redirect(request.url)
 
         flash('No file submitted or unknown action.', 'warning')
         return redirect(request.url)
 
-    all_steps = g.db_session.query(ProcessStep).options(joinedload(ProcessStep.area), joinedload(ProcessStep.use_cases)).order_by(ProcessStep.area_id, ProcessStep.name).all()
-    all_usecases = g.db_session.query(UseCase).options(joinedload(UseCase.process_step).joinedload(ProcessStep.area)).order_by(UseCase.process_step_id, UseCase.name).all()
-    all_areas_for_filters = g.db_session.query(Area).order_by(Area.name).all()
-
-    detailed_usecases_for_js = [{'id': uc.id, 'name': uc.name, 'bi_id': uc.bi_id, 'process_step_id': uc.process_step_id, 'area_id': uc.area.id if uc.area else None, 'wave': uc.wave, 'effort_level': uc.effort_level, 'priority': uc.priority, 'quality_improvement_quant': uc.quality_improvement_quant} for uc in all_usecases]
+    directory = directory_service.get_directory(g.db_session)
+    # Directory lists are name-sorted; a stable sort groups them by parent like before.
+    all_steps = sorted(directory.steps, key=lambda step: step.area_id)
+    all_usecases = sorted(directory.usecases, key=lambda uc: uc.process_step_id)
 
-    all_areas_flat = serialize_for_js(all_areas_for_filters, 'area')
-    all_steps_flat_js = serialize_for_js(all_steps, 'step')
-    all_usecases_flat = serialize_for_js(all_usecases, 'usecase')
+    usecase_filter_fields = {
+        row.id: row for row in g.db_session.query(
+            UseCase.id, UseCase.wave, UseCase.effort_level, UseCase.priority, UseCase.quality_improvement_quant
+        )
+    }
+    detailed_usecases_for_js = []
+    for uc in all_usecases:
+        fields = usecase_filter_fields.get(uc.id)
+        detailed_usecases_for_js.append({
+            'id': uc.id, 'name': uc.name, 'bi_id': uc.bi_id, 'process_step_id': uc.process_step_id,
+            'area_id': directory.area_id_for_step(uc.process_step_id),
+            'wave': fields.wave if fields else None,
+            'effort_level': fields.effort_level if fields else None,
+            'priority': fields.priority if fields else None,
+            'quality_improvement_quant': fields.quality_improvement_quant if fields else None
+        })
 
     return render_template(
         'data_management.html',
         title='Data Management',
+        directory=directory,
         all_steps=all_steps,
         all_usecases=all_usecases,
-        all_areas_for_filters=all_areas_for_filters,
-        all_steps_flat=all_steps_flat_js,
+        all_areas_for_filters=directory.areas,
         all_usecases_for_js_filtering=detailed_usecases_for_js,
+        recent_jobs=job_service.list_jobs(g.db_session, current_user.id),
         current_item=None, current_area=None, current_step=None, current_usecase=None,
-        all_areas_flat=all_areas_flat, all_usecases_flat=all_usecases_flat
+        **directory_service.get_breadcrumb_data(g.db_session)
     )
 
 @data_management_bp.route('/help', methods=['GET'])
 @login_required
 def data_help_page():
-    all_areas = g.db_session.query(Area).order_by(Area.name).all()
-    all_steps = g.db_session.query(ProcessStep).order_by(ProcessStep.name).all()
+    directory = directory_service.get_directory(g.db_session)
 
-    area_names_list = "\n".join([area.name for area in all_areas])
+    area_names_list = "\n".join([area.name for area in directory.areas])
 
     step_list_lines = ["BI_ID | Name", "--------------------------------------------------"]
-    for step in all_steps:
+    for step in directory.steps:
         step_list_lines.append(f"{step.bi_id} | {step.name}")
     steps_text_block = "\n".join(step_list_lines)
 
-    all_areas_flat = serialize_for_js(all_areas, 'area')
-    all_steps_flat = serialize_for_js(all_steps, 'step')
-    all_usecases_flat = serialize_for_js(g.db_session.query(UseCase).order_by(UseCase.name).all(), 'usecase')
-
     return render_template(
         'data_help.html',
         title='Data Import/Export Help',
@@ -191,9 +196,7 @@ def data_help_page():
         current_area=None,
         current_step=None,
         current_usecase=None,
-        all_areas_flat=all_areas_flat,
-        all_steps_flat=all_steps_flat,
-        all_usecases_flat=all_usecases_flat
+        **directory_service.get_breadcrumb_data(g.db_session)
     )
 
 
@@ -207,24 +210,21 @@ def prepare_steps_for_edit():
     selected_ids = [int(id_val) for id_val in selected_ids_str.split(',') if id_val.isdigit()]
 
     prepared_data = bulk_edit_service.prepare_steps_for_bulk_edit(g.db_session, selected_ids, PROCESS_STEP_EDITABLE_FIELDS)
-    session['steps_to_edit'] = prepared_data
+    _stash_draft('steps_to_edit_token', 'steps_to_edit', prepared_data)
     return redirect(url_for('data_management.edit_multiple_steps'))
 
 
 @data_management_bp.route('/steps/edit-multiple', methods=['GET'])
 @login_required
 def edit_multiple_steps():
-    steps_data = session.get('steps_to_edit', [])
+    steps_data = _load_session_draft('steps_to_edit_token', 'steps_to_edit')
     if not steps_data:
         return redirect(url_for('data_management.data_management_page'))
 
-    all_areas = g.db_session.query(Area).order_by(Area.name).all()
     return render_template(
         'edit_multiple_steps.html', title='Bulk Edit Process Steps', steps_data=steps_data,
-        all_areas=all_areas, editable_fields=PROCESS_STEP_EDITABLE_FIELDS,
-        all_areas_flat=serialize_for_js(all_areas, 'area'),
-        all_steps_flat=serialize_for_js(g.db_session.query(ProcessStep).all(), 'step'),
-        all_usecases_flat=serialize_for_js(g.db_session.query(UseCase).all(), 'usecase')
+        all_areas=directory_service.get_directory(g.db_session).areas, editable_fields=PROCESS_STEP_EDITABLE_FIELDS,
+        **directory_service.get_breadcrumb_data(g.db_session)
     )
 
 
@@ -234,7 +234,7 @@ def save_all_steps_changes():
     changes = request.get_json()
     try:
         message = bulk_edit_service.save_bulk_step_changes(g.db_session, changes)
-        session.pop('steps_to_edit', None)
+        _discard_session_draft('steps_to_edit_token')
         return jsonify(success=True, message=message)
     except Exception as e:
         g.db_session.rollback()
@@ -251,24 +251,21 @@ def prepare_usecases_for_edit():
     selected_ids = [int(id_val) for id_val in selected_ids_str.split(',') if id_val.isdigit()]
 
     prepared_data = bulk_edit_service.prepare_usecases_for_bulk_edit(g.db_session, selected_ids, PROCESS_USECASE_EDITABLE_FIELDS)
-    session['usecases_to_edit'] = prepared_data
+    _stash_draft('usecases_to_edit_token', 'usecases_to_edit', prepared_data)
     return redirect(url_for('data_management.edit_multiple_usecases'))
 
 
 @data_management_bp.route('/usecases/edit-multiple', methods=['GET'])
 @login_required
 def edit_multiple_usecases():
-    usecases_data = session.get('usecases_to_edit', [])
+    usecases_data = _load_session_draft('usecases_to_edit_token', 'usecases_to_edit')
     if not usecases_data:
         return redirect(url_for('data_management.data_management_page'))
 
-    all_steps = g.db_session.query(ProcessStep).order_by(ProcessStep.name).all()
     return render_template(
         'edit_multiple_usecases.html', title='Bulk Edit Use Cases', usecases_data=usecases_data,
-        all_steps=all_steps, editable_fields=PROCESS_USECASE_EDITABLE_FIELDS,
-        all_areas_flat=serialize_for_js(g.db_session.query(Area).all(), 'area'),
-        all_steps_flat=serialize_for_js(all_steps, 'step'),
-        all_usecases_flat=serialize_for_js(g.db_session.query(UseCase).all(), 'usecase')
+        all_steps=directory_service.get_directory(g.db_session).steps, editable_fields=PROCESS_USECASE_EDITABLE_FIELDS,
+        **directory_service.get_breadcrumb_data(g.db_session)
     )
 
 
@@ -278,7 +275,7 @@ def save_all_usecases_changes():
     changes = request.get_json()
     try:
         message = bulk_edit_service.save_bulk_usecase_changes(g.db_session, changes)
-        session.pop('usecases_to_edit', None)
+        _discard_session_draft('usecases_to_edit_token')
         return jsonify(success=True, message=message)
     except Exception as e:
         g.db_session.rollback()
@@ -288,18 +285,16 @@ def save_all_usecases_changes():
 @data_management_bp.route('/steps/injection-preview')
 @login_required
 def preview_steps_injection():
-    preview_data = session.get('step_import_preview_data')
+    preview_data = _load_session_draft('step_import_preview_token', 'step_import_preview')
     if not preview_data:
         flash("No step data found for preview. Please upload a file again.", "warning")
         return redirect(url_for('data_management.data_management_page'))
 
-    all_areas = g.db_session.query(Area).order_by(Area.name).all()
     return render_template(
         'step_injection_preview.html', title='Process Step Import Preview',
-        preview_data=preview_data, all_areas=all_areas, step_detail_fields=STEP_DETAIL_FIELDS,
-        all_areas_flat=serialize_for_js(all_areas, 'area'),
-        all_steps_flat=serialize_for_js(g.db_session.query(ProcessStep).all(), 'step'),
-        all_usecases_flat=serialize_for_js(g.db_session.query(UseCase).all(), 'usecase')
+        preview_data=preview_data, all_areas=directory_service.get_directory(g.db_session).areas,
+        step_detail_fields=STEP_DETAIL_FIELDS,
+        **directory_service.get_breadcrumb_data(g.db_session)
     )
 
 
@@ -312,7 +307,7 @@ def finalize_steps_import():
 
     result = data_management_service.finalize_step_import(resolved_steps_data)
     if result['success']:
-        session.pop('step_import_preview_data', None)
+        _discard_session_draft('step_import_preview_token')
     return jsonify(result)
 
 
@@ -335,11 +330,9 @@ def analyze_json_upload():
         return redirect(url_for('data_management.data_management_page'))
 
     try:
-        json_data = json.load(file.stream)
-        if not isinstance(json_data, list):
-            flash("Invalid JSON format. File must contain a list of objects.", "danger")
-            return redirect(url_for('data_management.data_management_page'))
-
+        json_data = json_stream_service.iter_json_array(
+            file.stream, "Invalid JSON format. File must contain a list of objects."
+        )
         analysis_result = analyze_json_import(
             json_data,
             ENTITY_MAP[entity_type]['model'],
@@ -347,7 +340,7 @@ def analyze_json_upload():
         )
 
         if analysis_result['success']:
-            session['import_preview_data'] = analysis_result['preview_data']
+            _stash_draft('import_preview_token', 'import_preview', analysis_result['preview_data'])
             session['import_entity_type'] = entity_type
             return redirect(url_for('data_management.import_preview'))
         else:
@@ -357,6 +350,9 @@ def analyze_json_upload():
     except json.JSONDecodeError:
         flash("Invalid JSON file. Please check the file content and format.", "danger")
         return redirect(url_for('data_management.data_management_page'))
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('data_management.data_management_page'))
     except Exception as e:
         flash(f"An unexpected error occurred during analysis: {e}", "danger")
         return redirect(url_for('data_management.data_management_page'))
@@ -365,7 +361,7 @@ def analyze_json_upload():
 @data_management_bp.route('/import/preview', methods=['GET'])
 @login_required
 def import_preview():
-    preview_data = session.get('import_preview_data')
+    preview_data = _load_session_draft('import_preview_token', 'import_preview')
     entity_type = session.get('import_entity_type')
 
     if not preview_data or not entity_type:
@@ -396,7 +392,7 @@ def finalize_json_import():
     )
 
     if result['success']:
-        session.pop('import_preview_data', None)
+        _discard_session_draft('import_preview_token')
         session.pop('import_entity_type', None)
 
     return jsonify(result)
\ No newline at end of file
@@ -1,30 +1,74 @@
 # backend/routes/export_routes.py
-from flask import Blueprint, Response, flash, redirect, url_for, g
-from flask_login import login_required
+from flask import Blueprint, Response, flash, redirect, url_for, g, request, stream_with_context
+from flask_login import current_user, login_required
 # CORRECTED IMPORT PATH
-from ..services import export_service
+from ..services import export_service, delta_service, job_service
 from ..models import Area
-import datetime
 
 export_routes = Blueprint('export', __name__, url_prefix='/export')
 
+def _database_export_args(args):
+    """
+    (format, compression, since) from request args. Compressed NDJSON is the
+    default (machine-to-machine transfers and backups); format=json and
+    compression=none give the plain JSON document, and since=<watermark>
+    exports only the changes (and deletions) after it. Raises ValueError.
+    """
+    export_format = args.get('format', 'ndjson')
+    compression = args.get('compression', 'gzip')
+    if export_format not in export_service.EXPORT_FORMATS or compression not in export_service.EXPORT_COMPRESSIONS:
+        raise ValueError(f"Unsupported export format '{export_format}' / compression '{compression}'.")
+    since = delta_service.parse_watermark(args['since']) if args.get('since') else None
+    return export_format, compression, since
+
+
 @export_routes.route('/database/json')
 @login_required
 def export_db_json():
-    # This function call remains the same
-    json_string = export_service.export_database_to_json_string()
-    if json_string:
-        timestamp = datetime.datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        filename = f"usecase_explorer_db_export_{timestamp}.json"
-        return Response(
-            json_string,
-            mimetype="application/json",
-            headers={"Content-Disposition": f"attachment;filename={filename}"}
-        )
-    else:
-        flash("Failed to export database.", "danger")
+    try:
+        export_format, compression, since = _database_export_args(request.args)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('data_management.data_management_page'))
+
+    # Stream the export so the download starts at once and memory stays flat.
+    stream = export_service.iter_database_export(export_format, compression, since)
+    try:
+        first_chunk = next(stream)
+    except Exception as e:
+        flash(f"Failed to export database: {e}", "danger")
         return redirect(url_for('main.index'))
 
+    def generate():
+        yield first_chunk
+        yield from stream
+
+    _, mimetype = export_service.export_file_info(export_format, compression)
+    filename = export_service.export_filename(export_format, compression, since)
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment;filename={filename}"}
+    )
+
+
+@export_routes.route('/database/job', methods=['POST'])
+@login_required
+def export_db_job():
+    """Runs the database export as a background job; the file is downloaded from the job list."""
+    try:
+        export_format, compression, since = _database_export_args(request.form)
+        params = {"format": export_format, "compression": compression}
+        if since is not None:
+            params["since"] = delta_service.format_watermark(since)
+        job = job_service.enqueue_job(g.db_session, 'database_export', current_user.id, params)
+        flash(f"Database export queued as background job #{job.id}. Download it from Background Jobs when it is done.", "info")
+    except ValueError as e:
+        flash(str(e), "danger")
+    except Exception as e:
+        flash(f"Failed to queue the database export: {e}", "danger")
+    return redirect(url_for('data_management.data_management_page'))
+
 @export_routes.route('/area/<int:area_id>/markdown')
 @login_required
 def export_area_md(area_id):
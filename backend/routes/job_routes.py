@@ -0,0 +1,94 @@
+# backend/routes/job_routes.py
+import json
+import os
+import time
+
+from flask import Blueprint, Response, abort, g, jsonify, send_file, stream_with_context, url_for
+from flask_login import current_user, login_required
+
+from ..db import SessionLocal
+from ..services import job_service
+
+job_routes = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+# An event stream holds a (sync) worker, so it is closed after this long;
+# EventSource reconnects on its own after the advertised retry delay.
+EVENTS_MAX_SECONDS = 30
+EVENTS_POLL_SECONDS = 1.0
+EVENTS_RETRY_MS = 2000
+
+
+def _job_payload(job):
+    payload = job_service.job_to_dict(job)
+    payload['status_url'] = url_for('jobs.job_status', job_id=job.id)
+    payload['artifact_url'] = url_for('jobs.job_artifact', job_id=job.id) if payload['artifact_name'] else None
+    return payload
+
+
+def _get_job_or_404(job_id):
+    job = job_service.get_job_for_user(g.db_session, job_id, current_user.id)
+    if job is None:
+        abort(404)
+    return job
+
+
+@job_routes.route('/')
+@login_required
+def list_jobs():
+    jobs = job_service.list_jobs(g.db_session, current_user.id)
+    return jsonify(jobs=[_job_payload(job) for job in jobs])
+
+
+@job_routes.route('/<int:job_id>')
+@login_required
+def job_status(job_id):
+    """Polling endpoint: current status, rows processed and errors so far."""
+    return jsonify(_job_payload(_get_job_or_404(job_id)))
+
+
+@job_routes.route('/<int:job_id>/events')
+@login_required
+def job_events(job_id):
+    """Server-sent events with the job status whenever it changes, until it finishes."""
+    _get_job_or_404(job_id)
+    user_id = current_user.id
+
+    def generate():
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        deadline = time.monotonic() + EVENTS_MAX_SECONDS
+        last_payload = None
+        while True:
+            # A short-lived session per poll, so each read sees the latest commit.
+            session = SessionLocal.session_factory()
+            try:
+                job = job_service.get_job_for_user(session, job_id, user_id)
+                payload = _job_payload(job) if job else None
+            finally:
+                session.close()
+            if payload is None:
+                return
+            encoded = json.dumps(payload)
+            if encoded != last_payload:
+                yield f"data: {encoded}\n\n"
+                last_payload = encoded
+            if payload['finished']:
+                yield "event: done\ndata: {}\n\n"
+                return
+            if time.monotonic() >= deadline:
+                return
+            time.sleep(EVENTS_POLL_SECONDS)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@job_routes.route('/<int:job_id>/artifact')
+@login_required
+def job_artifact(job_id):
+    job = _get_job_or_404(job_id)
+    if not job.artifact_path or not os.path.isfile(job.artifact_path):
+        abort(404)
+    return send_file(job.artifact_path, as_attachment=True, download_name=job.artifact_name)
@@ -3,14 +3,17 @@
 import json
 import traceback
 
-from flask import Blueprint, g, request, flash, redirect, url_for, render_template, jsonify, current_app
+from flask import (
+    Blueprint, g, request, flash, redirect, url_for, render_template, jsonify, current_app,
+    Response, stream_with_context
+)
 from flask_login import login_required, current_user
-from sqlalchemy.orm import joinedload
-from sqlalchemy import distinct, or_
 
-from ..services import llm_service
-from ..models import ProcessStep, Area, User, UseCase, UsecaseStepRelevance
-from ..utils import serialize_for_js
+from ..services import (
+    llm_service, llm_cache_service, compact_format_service, directory_service, enrichment_service, job_service,
+    map_reduce_service
+)
+from ..models import User, UseCase, UsecaseStepRelevance
 
 llm_routes = Blueprint(
     'llm',
@@ -130,6 +133,7 @@ MOST IMPORTANT OF ALL: Output ONLY the JSON object and nothing else!!!!!
 def llm_data_prep_page():
     try:
         prepared_data = {"process_steps": [], "use_cases": []}
+        prepared_text = None
         total_tokens = 0
         form_data_for_template = {
             'selected_area_ids': [],
@@ -138,13 +142,16 @@ def llm_data_prep_page():
             'selected_step_fields_form': [],
             'selected_usecase_fields_form': [],
             'selected_wave_values_form': [],
-            'export_uc_step_relevance': False
+            'export_uc_step_relevance': False,
+            'output_format': 'json'
         }
 
         if request.method == 'POST':
             prepared_data, total_tokens = llm_service.prepare_data_for_llm(
                 g.db_session, request.form, SELECTABLE_STEP_FIELDS.keys(), SELECTABLE_USECASE_FIELDS.keys()
             )
+            if request.form.get('output_format') == 'compact':
+                prepared_text = compact_format_service.encode(prepared_data)
             # Store selections to re-render the form state
             form_data_for_template = {
                 'selected_area_ids': [int(id_str) for id_str in request.form.getlist('area_ids') if id_str.isdigit()],
@@ -153,36 +160,38 @@ def llm_data_prep_page():
                 'selected_step_fields_form': request.form.getlist('step_fields'),
                 'selected_usecase_fields_form': request.form.getlist('usecase_fields'),
                 'selected_wave_values_form': request.form.getlist('wave_values'),
-                'export_uc_step_relevance': request.form.get('export_uc_step_relevance') == 'on'
+                'export_uc_step_relevance': request.form.get('export_uc_step_relevance') == 'on',
+                'output_format': request.form.get('output_format', 'json')
             }
 
         # Data for initial page load and for re-rendering the form filters
-        areas = g.db_session.query(Area).order_by(Area.name).all()
-        all_steps_db = g.db_session.query(ProcessStep).options(joinedload(ProcessStep.area)).order_by(ProcessStep.name).all()
-        all_usecases_db = g.db_session.query(UseCase).options(
-            joinedload(UseCase.process_step).joinedload(ProcessStep.area)
-        ).order_by(UseCase.name).all()
-
-        distinct_waves_query = g.db_session.query(distinct(UseCase.wave)).filter(UseCase.wave.isnot(None)).filter(UseCase.wave != '').order_by(UseCase.wave).all()
-        all_wave_values_for_filter = [w[0] for w in distinct_waves_query if w[0]]
-        if g.db_session.query(UseCase).filter(or_(UseCase.wave.is_(None), UseCase.wave == '')).first():
+        directory = directory_service.get_directory(g.db_session)
+        # Wave is the only per-use-case field the filters need beyond the directory.
+        usecase_waves = dict(g.db_session.query(UseCase.id, UseCase.wave).all())
+
+        all_wave_values_for_filter = sorted({wave for wave in usecase_waves.values() if wave})
+        if any(not wave for wave in usecase_waves.values()):
             if "N/A" not in all_wave_values_for_filter:
                 all_wave_values_for_filter.append("N/A")
 
-        all_areas_flat = serialize_for_js(g.db_session.query(Area).order_by(Area.name).all(), 'area')
-        all_steps_flat = serialize_for_js(g.db_session.query(ProcessStep).order_by(ProcessStep.name).all(), 'step')
-        all_usecases_flat = serialize_for_js(g.db_session.query(UseCase).order_by(UseCase.name).all(), 'usecase')
+        breadcrumb_data = directory_service.get_breadcrumb_data(g.db_session)
+        all_areas_flat = breadcrumb_data['all_areas_flat']
+        all_steps_flat = breadcrumb_data['all_steps_flat']
+        all_usecases_flat = breadcrumb_data['all_usecases_flat']
 
         return render_template(
             'llm_data_prep.html',
             title="Data Mining",
-            areas=areas,
-            all_steps=all_steps_db,
-            all_usecases=all_usecases_db,
+            directory=directory,
+            areas=directory.areas,
+            all_steps=directory.steps,
+            all_usecases=directory.usecases,
+            usecase_waves=usecase_waves,
             all_wave_values=all_wave_values_for_filter,
             selectable_fields_steps=SELECTABLE_STEP_FIELDS,
             selectable_fields_usecases=SELECTABLE_USECASE_FIELDS,
             prepared_data=prepared_data,
+            prepared_text=prepared_text,
             total_tokens=total_tokens,
             current_item=None,
             current_area=None,
@@ -214,7 +223,7 @@ def llm_data_prep_page():
             all_areas_flat=[], all_steps_flat=[], all_usecases_flat=[],
             selected_area_ids=[], selected_step_ids=[], selected_usecase_ids=[],
             selected_step_fields_form=[], selected_usecase_fields_form=[],
-            selected_wave_values_form=[], export_uc_step_relevance=False,
+            selected_wave_values_form=[], export_uc_step_relevance=False, output_format='json',
         )
 
 
@@ -226,6 +235,43 @@ def analyze_usecase(usecase_id):
     return redirect(url_for('usecases.view_usecase', usecase_id=usecase_id))
 
 
+@llm_routes.route('/data-prep/token-estimate', methods=['POST'])
+@login_required
+def llm_data_prep_token_estimate():
+    """Token estimate for the data prep form's current selection (same fields as the form)."""
+    try:
+        estimate = llm_service.estimate_data_prep_tokens(g.db_session, request.form)
+        return jsonify({"success": True, **estimate})
+    except Exception as e:
+        g.db_session.rollback()
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"Could not estimate tokens: {e}"}), 500
+
+
+@llm_routes.route('/data-prep/ask', methods=['POST'])
+@login_required
+def llm_data_prep_ask():
+    """
+    Queues a map-reduce job answering 'question' with 'model' over the data
+    prep form's selection, however large: the data is split into chunks that
+    fit the model's context window and the partial answers are merged.
+    """
+    try:
+        params = map_reduce_service.build_params(request.form, current_user.id)
+        job = job_service.enqueue_job(g.db_session, 'llm_map_reduce', current_user.id, params)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"Failed to queue the question: {e}"}), 500
+    return jsonify({
+        "success": True,
+        "message": f"Question queued as background job #{job.id}.",
+        "job_id": job.id,
+        "status_url": url_for('jobs.job_status', job_id=job.id)
+    }), 202
+
+
 @llm_routes.route('/chat', methods=['POST'])
 @login_required
 def llm_chat():
@@ -234,6 +280,7 @@ def llm_chat():
     model_name = data.get('model')
     image_base64 = data.get('image_base64')
     image_mime_type = data.get('image_mime_type')
+    use_cache = llm_cache_service.use_cache_requested(data.get('use_cache', True))
 
     system_prompt = current_user.system_prompt if current_user.is_authenticated else None
 
@@ -243,7 +290,7 @@ def llm_chat():
         return jsonify({"success": False, "message": "Model is required."}), 400
 
     try:
-        chat_history = llm_service.get_chat_history()
+        conversation_id, system_prompt, chat_history = llm_service.get_chat_context(system_prompt, create=True)
 
         response = llm_service.generate_chat_response(
             model_name=model_name,
@@ -251,13 +298,14 @@ def llm_chat():
             system_prompt=system_prompt,
             image_base64=image_base64,
             image_mime_type=image_mime_type,
-            chat_history=chat_history
+            chat_history=chat_history,
+            use_cache=use_cache
         )
 
         if response.get("success"):
-            user_message_for_history = user_message or "Image provided."
-            llm_service.add_message_to_history('user', user_message_for_history)
-            llm_service.add_message_to_history('assistant', response["message"])
+            llm_service.record_chat_exchange(
+                conversation_id, user_message or "Image provided.", response["message"], model_name
+            )
 
         return jsonify(response)
 
@@ -266,6 +314,69 @@ def llm_chat():
         return jsonify({"success": False, "message": f"An unexpected error occurred in the chat route: {e}"}), 500
 
 
+def _sse(payload, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+
+@llm_routes.route('/chat/stream', methods=['POST'])
+@login_required
+def llm_chat_stream():
+    """
+    Same request as /chat, answered as Server-Sent Events: one 'data' event
+    per text delta ({"delta": ...}), then 'done' with the full message or
+    'error'. The exchange is added to the chat history once the stream completes.
+    """
+    data = request.json
+    user_message = data.get('message')
+    model_name = data.get('model')
+    image_base64 = data.get('image_base64')
+    image_mime_type = data.get('image_mime_type')
+    use_cache = llm_cache_service.use_cache_requested(data.get('use_cache', True))
+
+    system_prompt = current_user.system_prompt if current_user.is_authenticated else None
+
+    if not user_message and not image_base64:
+        return jsonify({"success": False, "message": "Message or image is required."}), 400
+    if not model_name:
+        return jsonify({"success": False, "message": "Model is required."}), 400
+
+    # Started before the body streams: the session (holding the conversation id) is saved with the headers.
+    conversation_id, system_prompt, chat_history = llm_service.get_chat_context(system_prompt, create=True)
+
+    def generate():
+        parts = []
+        try:
+            for delta in llm_service.stream_chat_response(
+                model_name=model_name,
+                user_message=user_message,
+                system_prompt=system_prompt,
+                image_base64=image_base64,
+                image_mime_type=image_mime_type,
+                chat_history=chat_history,
+                use_cache=use_cache
+            ):
+                parts.append(delta)
+                yield _sse({"delta": delta})
+        except ValueError as e:
+            yield _sse({"success": False, "message": str(e)}, event='error')
+            return
+        except Exception as e:
+            traceback.print_exc()
+            yield _sse({"success": False, "message": f"An unexpected error occurred in the chat route: {e}"}, event='error')
+            return
+
+        assistant_message = ''.join(parts)
+        llm_service.record_chat_exchange(conversation_id, user_message or "Image provided.", assistant_message, model_name)
+        yield _sse({"success": True, "message": assistant_message}, event='done')
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @llm_routes.route('/system-prompt', methods=['POST'])
 @login_required
 def save_system_prompt():
@@ -300,6 +411,7 @@ def analyze_usecase_image_with_llm():
         image_mime_type = data.get('image_mime_type')
         selected_model_name = data.get('model')
         system_prompt_override = data.get('system_prompt_override')
+        use_cache = llm_cache_service.use_cache_requested(data.get('use_cache', True))
 
         if not all([usecase_id, image_base64, image_mime_type, selected_model_name]):
             return jsonify({
@@ -342,7 +454,8 @@ def analyze_usecase_image_with_llm():
             system_prompt=final_llm_prompt_text,
             image_base64=image_base64,
             image_mime_type=image_mime_type,
-            chat_history=[]  # This is a one-off request, so no history is needed
+            chat_history=[],  # This is a one-off request, so no history is needed
+            use_cache=use_cache
         )
         # --- END FIX ---
 
@@ -386,7 +499,7 @@ def analyze_usecase_image_with_llm():
 @llm_routes.route('/get_llm_models', methods=['GET'])
 @login_required
 def get_llm_models_api():
-    models = llm_service.get_all_available_llm_models()
+    models = llm_service.get_all_available_llm_models(force_refresh=request.args.get('refresh') == '1')
     return jsonify({"success": True, "models": models})
 
 
@@ -405,18 +518,88 @@ def summarize_step_with_llm():
     step_id = data.get('step_id')
     model_name = data.get('model')
     system_prompt = data.get('prompt')
+    use_cache = llm_cache_service.use_cache_requested(data.get('use_cache', True))
 
     if not all([step_id, model_name, system_prompt]):
         return jsonify({"success": False, "message": "Missing step_id, model, or prompt."}), 400
 
     try:
-        result = llm_service.generate_step_summary(g.db_session, step_id, model_name, system_prompt)
+        result = llm_service.generate_step_summary(g.db_session, step_id, model_name, system_prompt, use_cache=use_cache)
         return jsonify(result)
     except Exception as e:
         traceback.print_exc()
         return jsonify({"success": False, "message": f"An unexpected error occurred: {e}"}), 500
 
 
+@llm_routes.route('/cache/stats')
+@login_required
+def llm_cache_stats():
+    """Response cache counters of this worker and the size of the shared cache."""
+    try:
+        return jsonify({"success": True, "stats": llm_cache_service.stats()})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"Could not read the response cache: {e}"}), 500
+
+
+@llm_routes.route('/cache/clear', methods=['POST'])
+@login_required
+def llm_cache_clear():
+    if not llm_cache_service.can_clear(current_user):
+        return jsonify({"success": False, "message": "Only cache administrators may clear the shared response cache."}), 403
+    try:
+        removed = llm_cache_service.clear()
+        return jsonify({"success": True, "message": f"Removed {removed} cached response(s)."})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"Could not clear the response cache: {e}"}), 500
+
+
+@llm_routes.route('/enrich', methods=['POST'])
+@login_required
+def enrich_entities():
+    """
+    Queues a bulk enrichment job: fills target_field of the process steps or
+    use cases matching the filters (area_id, wave, ids) from a prompt template.
+    """
+    try:
+        params = enrichment_service.build_params(request.json or {}, current_user.id)
+        job = job_service.enqueue_job(g.db_session, 'llm_enrichment', current_user.id, params)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"Failed to queue the enrichment job: {e}"}), 500
+    return jsonify({
+        "success": True,
+        "message": f"Enrichment queued as background job #{job.id}.",
+        "job_id": job.id,
+        "status_url": url_for('jobs.job_status', job_id=job.id)
+    }), 202
+
+
+@llm_routes.route('/enrich/<int:job_id>/resume', methods=['POST'])
+@login_required
+def resume_enrichment(job_id):
+    """Runs a finished enrichment job again, skipping the entities it already enriched."""
+    job = job_service.get_job_for_user(g.db_session, job_id, current_user.id)
+    if job is None or job.job_type != 'llm_enrichment':
+        return jsonify({"success": False, "message": "Enrichment job not found."}), 404
+    try:
+        new_job = job_service.resume_job(g.db_session, job, current_user.id)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 409
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"Failed to resume the enrichment job: {e}"}), 500
+    return jsonify({
+        "success": True,
+        "message": f"Job #{job.id} resumed as background job #{new_job.id}.",
+        "job_id": new_job.id,
+        "status_url": url_for('jobs.job_status', job_id=new_job.id)
+    }), 202
+
+
 @llm_routes.route('/save-step-summary-prompt', methods=['POST'])
 @login_required
 def save_step_summary_prompt():
@@ -1,11 +1,9 @@
 # backend/routes/main_routes.py
 from flask import Blueprint, render_template, redirect, url_for, g, request
 from flask_login import current_user
-from sqlalchemy.orm import joinedload
 
-from ..models import Area, ProcessStep, UseCase
-from ..services import step_service, dashboard_service
-from ..utils import serialize_for_js
+from ..models import ProcessStep, UseCase
+from ..services import step_service, dashboard_service, directory_service
 
 main_routes = Blueprint('main', __name__)
 
@@ -13,15 +11,14 @@ main_routes = Blueprint('main', __name__)
 def index():
     if current_user.is_authenticated:
         all_steps = step_service.get_all_steps_with_details(g.db_session)
-        areas_with_steps = g.db_session.query(Area).options(
-            joinedload(Area.process_steps)
-        ).order_by(Area.name).all()
-        all_areas_query = g.db_session.query(Area).order_by(Area.name).all()
-        
+        directory = directory_service.get_directory(g.db_session)
+        areas_with_steps = directory.areas
+
         # Data needed for this page's JavaScript (e.g., inline editing, filtering).
+        breadcrumb_data = directory_service.get_breadcrumb_data(g.db_session)
         page_data = {
-            "all_areas_for_select": serialize_for_js(all_areas_query, 'area'),
-            "all_steps_for_js_filtering": serialize_for_js(all_steps, 'step')
+            "all_areas_for_select": breadcrumb_data['all_areas_flat'],
+            "all_steps_for_js_filtering": breadcrumb_data['all_steps_flat']
         }
 
         # Handle filter_area_id URL parameter for pre-filtering when coming from another page.
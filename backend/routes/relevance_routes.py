@@ -1,9 +1,7 @@
 # backend/routes/relevance_routes.py
 from flask import Blueprint, request, flash, redirect, url_for, render_template, g
 from flask_login import login_required
-from ..services import relevance_service
-from ..utils import serialize_for_js
-from ..models import Area, ProcessStep, UseCase
+from ..services import relevance_service, directory_service
 
 
 relevance_routes = Blueprint('relevance', __name__, url_prefix='/relevance')
@@ -298,11 +296,7 @@ def delete_step_to_step_relevance(relevance_id):
 # --- EDIT ROUTES ---
 
 def _get_breadcrumb_data():
-    return {
-        'all_areas_flat': serialize_for_js(g.db_session.query(Area).order_by(Area.name).all(), 'area'),
-        'all_steps_flat': serialize_for_js(g.db_session.query(ProcessStep).order_by(ProcessStep.name).all(), 'step'),
-        'all_usecases_flat': serialize_for_js(g.db_session.query(UseCase).order_by(UseCase.name).all(), 'usecase')
-    }
+    return directory_service.get_breadcrumb_data(g.db_session)
 
 def handle_edit_relevance(relevance_id, link_type, view_name_for_redirect, id_name_for_redirect):
     try:
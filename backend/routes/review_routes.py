@@ -4,9 +4,8 @@ from flask_login import login_required
 from sqlalchemy.orm import joinedload, aliased
 from sqlalchemy import or_, and_, exc as sqlalchemy_exc
 
-from ..utils import serialize_for_js
-from ..models import Area, ProcessStep, ProcessStepProcessStepRelevance, UseCase
-from ..services import review_service
+from ..models import ProcessStep, ProcessStepProcessStepRelevance
+from ..services import review_service, directory_service, delta_service
 
 import io
 import csv
@@ -21,9 +20,10 @@ review_routes = Blueprint('review', __name__,
 @login_required
 def review_dashboard():
     try:
-        all_areas_flat = serialize_for_js(g.db_session.query(Area).order_by(Area.name).all(), 'area')
-        all_steps_flat = serialize_for_js(g.db_session.query(ProcessStep).order_by(ProcessStep.name).all(), 'step')
-        all_usecases_flat = serialize_for_js(g.db_session.query(UseCase).order_by(UseCase.name).all(), 'usecase')
+        breadcrumb_data = directory_service.get_breadcrumb_data(g.db_session)
+        all_areas_flat = breadcrumb_data['all_areas_flat']
+        all_steps_flat = breadcrumb_data['all_steps_flat']
+        all_usecases_flat = breadcrumb_data['all_usecases_flat']
     except Exception as e:
         flash(f"Error loading dashboard data: {e}", "danger")
         return redirect(url_for('main.index'))
@@ -43,11 +43,12 @@ def review_dashboard():
 @login_required
 def review_process_links_page():
     try:
-        areas = g.db_session.query(Area).order_by(Area.name).all()
+        areas = directory_service.get_directory(g.db_session).areas
 
-        all_areas_flat = serialize_for_js(areas, 'area')
-        all_steps_flat = serialize_for_js(g.db_session.query(ProcessStep).order_by(ProcessStep.name).all(), 'step')
-        all_usecases_flat = serialize_for_js(g.db_session.query(UseCase).order_by(UseCase.name).all(), 'usecase')
+        breadcrumb_data = directory_service.get_breadcrumb_data(g.db_session)
+        all_areas_flat = breadcrumb_data['all_areas_flat']
+        all_steps_flat = breadcrumb_data['all_steps_flat']
+        all_usecases_flat = breadcrumb_data['all_usecases_flat']
 
         return render_template('review_process_links.html',
                                title="Review Process Step Links",
@@ -364,6 +365,8 @@ def delete_process_link(link_id):
 @login_required
 def delete_all_process_links():
     try:
+        # The bulk delete skips the tombstone hook, so record the deletions for delta exports first.
+        delta_service.record_bulk_deletion(g.db_session, 'process_step_process_step_relevance')
         num_deleted = g.db_session.query(ProcessStepProcessStepRelevance).delete()
         g.db_session.commit()
 
@@ -385,17 +388,15 @@ general_api_routes = Blueprint('general_api', __name__, url_prefix='/api')
 @login_required
 def get_all_steps_for_select():
     try:
-        steps_query = g.db_session.query(ProcessStep).options(
-            joinedload(ProcessStep.area)
-        ).order_by(ProcessStep.name).all()
+        directory = directory_service.get_directory(g.db_session)
 
         steps_data = []
-        for step in steps_query:
+        for step in directory.steps:
             steps_data.append({
                 "id": step.id,
                 "name": step.name,
                 "bi_id": step.bi_id,
-                "area_name": step.area.name if step.area else "N/A"
+                "area_name": directory.area_name(step.area_id)
             })
         return jsonify(steps_data)
     except Exception as e:
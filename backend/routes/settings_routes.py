@@ -1,9 +1,8 @@
 # backend/routes/settings_routes.py
 from flask import Blueprint, g, render_template, request, flash, redirect, url_for
 from flask_login import login_required, current_user
-from ..models import User, Area, ProcessStep, UseCase
-from ..utils import serialize_for_js
-from ..services import settings_service  # <-- Import the new service
+from ..models import User
+from ..services import settings_service, directory_service
 
 settings_routes = Blueprint('settings', __name__,
                             template_folder='../templates',
@@ -22,16 +21,14 @@ def manage_settings():
             return redirect(url_for('settings.manage_settings'))
 
         # Data for breadcrumbs
-        all_areas_flat = serialize_for_js(g.db_session.query(Area).order_by(Area.name).all(), 'area')
-        all_steps_flat = serialize_for_js(g.db_session.query(ProcessStep).order_by(ProcessStep.name).all(), 'step')
-        all_usecases_flat = serialize_for_js(g.db_session.query(UseCase).order_by(UseCase.name).all(), 'usecase')
+        breadcrumb_data = directory_service.get_breadcrumb_data(g.db_session)
 
         return render_template(
             'settings.html',
             title='Application Settings',
             settings=user_settings,
             current_item=None, current_area=None, current_step=None, current_usecase=None,
-            all_areas_flat=all_areas_flat, all_steps_flat=all_steps_flat, all_usecases_flat=all_usecases_flat
+            **breadcrumb_data
         )
     except Exception as e:
         flash(f"An error occurred: {e}", "danger")
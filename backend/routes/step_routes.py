@@ -3,9 +3,8 @@ from flask import Blueprint, render_template, flash, redirect, url_for, request,
 from flask_login import login_required
 from sqlalchemy.exc import IntegrityError
 
-from ..models import ProcessStep, UseCase, Area
-from ..utils import serialize_for_js
-from ..services import step_service  # <-- Use the new service
+from ..models import ProcessStep, UseCase
+from ..services import step_service, directory_service
 
 step_routes = Blueprint('steps', __name__,
                         template_folder='../templates',
@@ -47,7 +46,7 @@ def view_step(step_id):
     
     # Data needed for the template
     other_steps = step_service.get_all_other_steps(g.db_session, step_id)
-    all_areas = g.db_session.query(Area).order_by(Area.name).all()
+    all_areas = directory_service.get_directory(g.db_session).areas
 
     return render_template(
         'step_detail.html',
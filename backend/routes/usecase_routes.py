@@ -5,13 +5,12 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 import traceback
 
-from ..utils import serialize_for_js
 from ..services.llm_service import get_all_available_llm_models
 # Corrected import: only import what's actually in llm_routes
 from ..routes.llm_routes import AI_ASSIST_IMAGE_SYSTEM_PROMPT_TEMPLATE
 
-from ..models import UseCase, ProcessStep, Area
-from ..services import usecase_service, step_service, area_service
+from ..models import UseCase
+from ..services import usecase_service, step_service, area_service, directory_service
 
 usecase_routes = Blueprint('usecases', __name__, template_folder='../templates', url_prefix='/usecases')
 
@@ -28,21 +27,20 @@ PROCESS_USECASE_EDITABLE_FIELDS_FOR_AI_SUGGESTIONS = [
 @login_required
 def list_usecases():
     usecases = usecase_service.get_all_usecases_with_details(g.db_session)
-    all_areas_for_filters = g.db_session.query(Area).order_by(Area.name).all()
-    all_steps_for_filters = g.db_session.query(ProcessStep).order_by(ProcessStep.name).all()
+    directory = directory_service.get_directory(g.db_session)
     
     all_usecases_for_js_filtering = [ { 'id': uc.id, 'name': uc.name, 'bi_id': uc.bi_id, 'process_step_id': uc.process_step_id, 'area_id': uc.process_step.area.id if uc.process_step and uc.process_step.area else None, 'wave': uc.wave, 'effort_level': uc.effort_level, 'priority': uc.priority, 'quality_improvement_quant': uc.quality_improvement_quant } for uc in usecases ]
     
     page_data = {
         "usecases": all_usecases_for_js_filtering,
-        "steps": serialize_for_js(all_steps_for_filters, 'step')
+        "steps": directory_service.get_breadcrumb_data(g.db_session)['all_steps_flat']
     }
     
     return render_template(
         'usecase_overview.html',
         title="All Use Cases",
         usecases=usecases,
-        all_areas_for_filters=all_areas_for_filters,
+        all_areas_for_filters=directory.areas,
         page_data=page_data,
         current_item=None,
         current_area=None,
@@ -65,7 +63,7 @@ def view_usecase(usecase_id):
             flash(message, 'success' if success else 'danger')
             return redirect(url_for('usecases.view_usecase', usecase_id=usecase.id))
 
-        all_steps_db = g.db_session.query(ProcessStep).order_by(ProcessStep.name).all()
+        all_steps_db = directory_service.get_directory(g.db_session).steps
         current_step_for_template = usecase.process_step 
         current_area_for_template = usecase.process_step.area if usecase.process_step else None
 
@@ -93,7 +91,7 @@ def edit_usecase_with_ai(usecase_id):
         flash(f"Use Case with ID {usecase_id} not found.", "warning")
         return redirect(url_for('usecases.list_usecases'))
 
-    all_steps_db = g.db_session.query(ProcessStep).order_by(ProcessStep.name).all()
+    all_steps_db = directory_service.get_directory(g.db_session).steps
     usecase_data_for_js = { "id": usecase.id, "name": usecase.name, "bi_id": usecase.bi_id, "process_step_id": usecase.process_step_id, "priority": usecase.priority, "raw_content": usecase.raw_content, "summary": usecase.summary, "inspiration": usecase.inspiration, "wave": usecase.wave, "effort_level": usecase.effort_level, "status": usecase.status, "business_problem_solved": usecase.business_problem_solved, "target_solution_description": usecase.target_solution_description, "technologies_text": usecase.technologies_text, "requirements": usecase.requirements, "relevants_text": usecase.relevants_text, "reduction_time_transfer": usecase.reduction_time_transfer, "reduction_time_launches": usecase.reduction_time_launches, "reduction_costs_supply": usecase.reduction_costs_supply, "quality_improvement_quant": usecase.quality_improvement_quant, "ideation_notes": usecase.ideation_notes, "further_ideas": usecase.further_ideas, "effort_quantification": usecase.effort_quantification, "potential_quantification": usecase.potential_quantification, "dependencies_text": usecase.dependencies_text, "contact_persons_text": usecase.contact_persons_text, "related_projects_text": usecase.related_projects_text, "process_step_name": usecase.process_step.name if usecase.process_step else "N/A", "area_name": usecase.process_step.area.name if usecase.process_step and usecase.process_step.area else "N/A", "pilot_site_factory_text": usecase.pilot_site_factory_text, "usecase_type_category": usecase.usecase_type_category, }
     
     return render_template( 'edit_usecase_with_ai.html', title=f"AI Edit: {usecase.name}", usecase=usecase, usecase_data_for_js=usecase_data_for_js, all_steps=all_steps_db, default_ai_system_prompt=AI_ASSIST_IMAGE_SYSTEM_PROMPT_TEMPLATE, ai_suggestible_fields=PROCESS_USECASE_EDITABLE_FIELDS_FOR_AI_SUGGESTIONS, current_usecase=usecase, current_step=usecase.process_step, current_area=usecase.process_step.area, current_item=usecase, available_llm_models=get_all_available_llm_models() )
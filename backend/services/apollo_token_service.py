@@ -0,0 +1,166 @@
+# backend/services/apollo_token_service.py
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import requests
+from flask import current_app
+
+from ..utils import file_lock
+from . import llm_client_service
+
+# Used when the token response has no expires_in.
+DEFAULT_EXPIRES_IN = 3500
+
+# Per worker copy of the shared file: key -> (access_token, expires_at, issued_at), epoch seconds.
+_tokens = {}
+_tokens_lock = threading.Lock()
+# One refresh per key at a time within this worker; the file lock covers other workers.
+_refresh_locks = {}
+_refreshing = set()
+
+
+def _cache_dir(app):
+    return app.config.get('APOLLO_TOKEN_CACHE_DIR') or os.path.join(app.instance_path, 'apollo_tokens')
+
+
+def _cache_key(token_url, client_id, client_secret):
+    # The secret is part of the key: client ids are not secret, so a token must
+    # only be handed to callers that hold the secret it was issued for.
+    return hashlib.sha256(f"{token_url}\n{client_id}\n{client_secret}".encode('utf-8')).hexdigest()
+
+
+def _paths(app, key):
+    directory = _cache_dir(app)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    return os.path.join(directory, f"{key}.json"), os.path.join(directory, f"{key}.lock")
+
+
+def _read_token_file(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return data['access_token'], float(data['expires_at']), float(data['issued_at'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_token_file(path, access_token, expires_at, issued_at):
+    # Atomic replace, so other workers never read a half-written file.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({"access_token": access_token, "expires_at": expires_at, "issued_at": issued_at}, f)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _fetch_token(token_url, client_id, client_secret):
+    try:
+        response = llm_client_service.get_http_session('apollo', token_url).post(
+            token_url,
+            data={"grant_type": "client_credentials", "client_id": client_id, "client_secret": client_secret},
+            timeout=10
+        )
+        response.raise_for_status()
+        json_response = response.json()
+        now = time.time()
+        return json_response['access_token'], now + json_response.get('expires_in', DEFAULT_EXPIRES_IN), now
+    except requests.exceptions.HTTPError as e:
+        raise ValueError(f"Apollo Token Error: {e.response.text}") from e
+    except requests.exceptions.RequestException as e:
+        raise ValueError(f"Apollo Token Error: Network request failed: {e}") from e
+
+
+def _is_fresh(entry, margin, now=None):
+    """True while the token is outside its refresh window (margin, at most half its lifetime)."""
+    if not entry:
+        return False
+    _, expires_at, issued_at = entry
+    window = min(margin, (expires_at - issued_at) / 2)
+    return (now or time.time()) < expires_at - window
+
+
+def _is_usable(entry, now=None):
+    # A few seconds of slack for the request that is about to use it.
+    return bool(entry) and (now or time.time()) < entry[1] - 5
+
+
+def _refresh(app, key, token_url, client_id, client_secret, margin, blocking=True):
+    """
+    Single-flight refresh: under the worker lock and the file lock, re-reads
+    the shared file and only calls the token endpoint if the token there is
+    due for renewal. Returns the entry, or None if non-blocking and another
+    process is refreshing.
+    """
+    token_path, lock_path = _paths(app, key)
+    with _tokens_lock:
+        refresh_lock = _refresh_locks.setdefault(key, threading.Lock())
+    with refresh_lock:
+        cached = _tokens.get(key)
+        if _is_fresh(cached, margin):
+            return cached
+        with file_lock(lock_path, blocking=blocking) as acquired:
+            if not acquired:
+                return None
+            cached = _read_token_file(token_path)
+            if not _is_fresh(cached, margin):
+                cached = _fetch_token(token_url, client_id, client_secret)
+                _write_token_file(token_path, *cached)
+                print(f"Apollo access token renewed (valid for {int(cached[1] - cached[2])}s).")
+        with _tokens_lock:
+            _tokens[key] = cached
+        return cached
+
+
+def _refresh_in_background(app, key, token_url, client_id, client_secret, margin):
+    with _tokens_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            _refresh(app, key, token_url, client_id, client_secret, margin, blocking=False)
+        except Exception as e:
+            print(f"Background Apollo token refresh failed: {e}")
+        finally:
+            with _tokens_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=run, name='apollo-token-refresh', daemon=True).start()
+
+
+def get_access_token(token_url, client_id, client_secret):
+    """
+    Access token for client_id, shared by all workers through a file in
+    APOLLO_TOKEN_CACHE_DIR. Within APOLLO_TOKEN_REFRESH_MARGIN_SECONDS of
+    expiry the current token is returned and a new one is fetched in the
+    background; only an expired or missing token blocks the caller.
+    """
+    app = current_app._get_current_object()
+    margin = app.config.get('APOLLO_TOKEN_REFRESH_MARGIN_SECONDS', 300)
+    key = _cache_key(token_url, client_id, client_secret)
+
+    cached = _tokens.get(key)
+    if not _is_fresh(cached, margin):
+        # Another worker may have renewed it already.
+        from_file = _read_token_file(_paths(app, key)[0])
+        if from_file and (not cached or from_file[1] > cached[1]):
+            cached = from_file
+            with _tokens_lock:
+                _tokens[key] = cached
+
+    if _is_fresh(cached, margin):
+        return cached[0]
+    if _is_usable(cached):
+        _refresh_in_background(app, key, token_url, client_id, client_secret, margin)
+        return cached[0]
+    return _refresh(app, key, token_url, client_id, client_secret, margin)[0]
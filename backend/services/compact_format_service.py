@@ -0,0 +1,111 @@
+# backend/services/compact_format_service.py
+import json
+from collections import Counter
+
+from . import token_count_service
+
+SECTIONS = ('process_steps', 'use_cases', 'usecase_step_relevance')
+REF_PREFIX = '@'
+# Shorter strings never save enough to be worth a reference.
+MIN_REF_LENGTH = 8
+
+LEGEND = (
+    "Compact tables: each section name is followed by a header row of field names and one JSON array "
+    "per record, values in header order. A string \"@N\" stands for the value of ref \"@N\" in the refs "
+    "section; a string that really starts with \"@\" is written with one extra \"@\"."
+)
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, default=str, separators=(',', ':'))
+
+
+def _escape(value):
+    return REF_PREFIX + value if isinstance(value, str) and value.startswith(REF_PREFIX) else value
+
+
+def cell(value, refs):
+    """A value as written into a row: its ref if it has one, else the (escaped) value."""
+    if isinstance(value, str):
+        return refs.get(value, _escape(value))
+    return value
+
+
+def row_tokens(values, refs):
+    """Tokens of a row holding values, including its brackets and line break."""
+    return token_count_service.count_tokens(_dumps([cell(value, refs) for value in values]) + "\n")
+
+
+def ref_savings(repeats, refs):
+    """Tokens saved by writing refs for repeated values ({value: occurrences}) that were counted inline."""
+    saved = 0
+    for value, count in repeats.items():
+        ref = refs.get(value)
+        if ref is not None:
+            saved += count * (
+                token_count_service.count_tokens(token_count_service.compact_fragment(_escape(value)))
+                - token_count_service.count_short_tokens(token_count_service.compact_fragment(ref))
+            )
+    return saved
+
+
+def choose_refs(occurrences):
+    """
+    {string: occurrences} -> {string: ref} for the repeated strings where a
+    reference saves tokens, counting the refs table row it costs. The most
+    frequent strings get the shortest refs.
+    """
+    candidates = sorted(
+        ((count, value) for value, count in occurrences.items() if count > 1 and len(value) >= MIN_REF_LENGTH),
+        key=lambda item: -item[0]
+    )
+    refs = {}
+    for count, value in candidates:
+        ref = f"{REF_PREFIX}{len(refs) + 1}"
+        value_tokens = token_count_service.count_tokens(_dumps(_escape(value)))
+        ref_tokens = token_count_service.count_short_tokens(_dumps(ref))
+        if (value_tokens - ref_tokens) * count > value_tokens + ref_tokens + 2:
+            refs[value] = ref
+    return refs
+
+
+def sections_of(data):
+    """(section, fields) of a data prep dict, fields in first-seen order."""
+    return [
+        (section, list(dict.fromkeys(field for record in data[section] for field in record)))
+        for section in SECTIONS if section in data
+    ]
+
+
+def overhead_tokens(sections, refs):
+    """Tokens of everything encode() writes besides the record rows: legend, section names, headers and refs."""
+    text = [LEGEND]
+    if refs:
+        text += ["refs", _dumps(["ref", "value"])] + [_dumps([ref, _escape(value)]) for value, ref in refs.items()]
+    for section, fields in sections:
+        text += [section, _dumps(fields)]
+    return token_count_service.count_tokens("\n".join(text) + "\n")
+
+
+def encode(data):
+    """
+    Compact text for a data prep dict ({'process_steps': [...], 'use_cases':
+    [...], optional 'usecase_step_relevance': [...]}): per section a header
+    row and one JSON array per record, with strings that repeat often enough
+    replaced by refs into a refs table. Field names are written once instead
+    of once per record.
+    """
+    sections = sections_of(data)
+    rows = {section: [[record.get(field) for field in fields] for record in data[section]] for section, fields in sections}
+    refs = choose_refs(Counter(
+        value for section_rows in rows.values() for row in section_rows for value in row if isinstance(value, str)
+    ))
+
+    lines = [LEGEND]
+    if refs:
+        lines += ["refs", _dumps(["ref", "value"])]
+        lines += [_dumps([ref, _escape(value)]) for value, ref in refs.items()]
+    for section, fields in sections:
+        lines += [section, _dumps(fields)]
+        lines += [_dumps([cell(value, refs) for value in row]) for row in rows[section]]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,179 @@
+# backend/services/conversation_service.py
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import func
+
+from ..db import SessionLocal
+from ..models import Conversation, ConversationMessage
+from . import token_count_service
+
+# Messages fetched per round trip while walking a conversation back from its newest turn.
+HISTORY_BATCH_SIZE = 50
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _purge_idle_conversations(session):
+    days = current_app.config.get('LLM_CONVERSATION_RETENTION_DAYS', 30)
+    idle = session.query(Conversation.id).filter(Conversation.updated_at < _utcnow() - timedelta(days=days))
+    # Messages first: SQLite only honours ON DELETE CASCADE with its foreign key pragma on.
+    session.query(ConversationMessage).filter(ConversationMessage.conversation_id.in_(idle.scalar_subquery())) \
+        .delete(synchronize_session=False)
+    removed = session.query(Conversation).filter(Conversation.id.in_(idle.scalar_subquery())) \
+        .delete(synchronize_session=False)
+    session.commit()
+    return removed
+
+
+def create_conversation(user_id):
+    """Starts an empty conversation and returns its id. Idle conversations are purged on the way."""
+    # Private sessions throughout: the chat stream writes history after the request's session is gone.
+    session = SessionLocal.session_factory()
+    try:
+        try:
+            _purge_idle_conversations(session)
+        except Exception:
+            session.rollback()
+            traceback.print_exc()
+        conversation = Conversation(user_id=user_id)
+        session.add(conversation)
+        session.commit()
+        return conversation.id
+    finally:
+        session.close()
+
+
+def _get_conversation(session, conversation_id, user_id):
+    conversation = session.get(Conversation, conversation_id) if conversation_id else None
+    if conversation is None or conversation.user_id != user_id:
+        return None
+    return conversation
+
+
+def _recent_messages(session, conversation, token_budget):
+    """
+    Newest messages not yet folded into the summary whose token counts fit
+    token_budget, oldest first. Only reads as far back as the budget reaches.
+    The window always starts with a user turn, as some providers require.
+    """
+    query = session.query(ConversationMessage).filter(ConversationMessage.conversation_id == conversation.id)
+    if conversation.summarized_through_id:
+        query = query.filter(ConversationMessage.id > conversation.summarized_through_id)
+    selected, used = [], 0
+    for message in query.order_by(ConversationMessage.id.desc()).yield_per(HISTORY_BATCH_SIZE):
+        if used + message.token_count > token_budget:
+            break
+        selected.append(message)
+        used += message.token_count
+    selected.reverse()
+    while selected and selected[0].role != 'user':
+        selected.pop(0)
+    return selected
+
+
+def get_history(conversation_id, user_id, token_budget):
+    """
+    {'summary', 'messages', 'tokens'} for the next prompt: the rolling summary
+    (or None) and the newest turns within token_budget as role/content dicts.
+    None if the conversation does not exist or belongs to another user.
+    """
+    session = SessionLocal.session_factory()
+    try:
+        conversation = _get_conversation(session, conversation_id, user_id)
+        if conversation is None:
+            return None
+        messages = _recent_messages(session, conversation, token_budget)
+        return {
+            "summary": conversation.summary,
+            "messages": [{'role': m.role, 'content': m.content} for m in messages],
+            "tokens": sum(m.token_count for m in messages),
+        }
+    finally:
+        session.close()
+
+
+def add_messages(conversation_id, user_id, messages):
+    """Appends (role, content) pairs with their token counts. Returns False if the conversation is gone."""
+    session = SessionLocal.session_factory()
+    try:
+        conversation = _get_conversation(session, conversation_id, user_id)
+        if conversation is None:
+            return False
+        for role, content in messages:
+            session.add(ConversationMessage(
+                conversation_id=conversation.id,
+                role=role,
+                content=content,
+                token_count=token_count_service.count_tokens(content)
+            ))
+        conversation.updated_at = func.now()
+        session.commit()
+        return True
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def summarization_batch(conversation_id, token_budget):
+    """
+    Turns that fell out of the history window and are not summarized yet,
+    oldest first, at most token_budget tokens of them (at least one).
+    Returns (summary, summarized_through_id, [{'id', 'role', 'content'}]);
+    the list is empty when there is nothing to summarize.
+    """
+    session = SessionLocal.session_factory()
+    try:
+        conversation = session.get(Conversation, conversation_id)
+        if conversation is None:
+            return None, None, []
+        window = _recent_messages(session, conversation, token_budget)
+        query = session.query(ConversationMessage).filter(ConversationMessage.conversation_id == conversation.id)
+        if conversation.summarized_through_id:
+            query = query.filter(ConversationMessage.id > conversation.summarized_through_id)
+        if window:
+            query = query.filter(ConversationMessage.id < window[0].id)
+        batch, used = [], 0
+        for message in query.order_by(ConversationMessage.id).yield_per(HISTORY_BATCH_SIZE):
+            if batch and used + message.token_count > token_budget:
+                break
+            batch.append({'id': message.id, 'role': message.role, 'content': message.content})
+            used += message.token_count
+        return conversation.summary, conversation.summarized_through_id, batch
+    finally:
+        session.close()
+
+
+def store_summary(conversation_id, summary, previous_through_id, through_id):
+    """Saves a new rolling summary unless another worker already moved it past previous_through_id."""
+    session = SessionLocal.session_factory()
+    try:
+        updated = session.query(Conversation).filter(
+            Conversation.id == conversation_id,
+            (Conversation.summarized_through_id == previous_through_id) if previous_through_id
+            else Conversation.summarized_through_id.is_(None)
+        ).update({'summary': summary, 'summarized_through_id': through_id}, synchronize_session=False)
+        session.commit()
+        return bool(updated)
+    finally:
+        session.close()
+
+
+def delete_conversation(conversation_id, user_id):
+    session = SessionLocal.session_factory()
+    try:
+        conversation = _get_conversation(session, conversation_id, user_id)
+        if conversation is None:
+            return False
+        session.query(ConversationMessage).filter(ConversationMessage.conversation_id == conversation.id) \
+            .delete(synchronize_session=False)
+        session.delete(conversation)
+        session.commit()
+        return True
+    finally:
+        session.close()
@@ -1,18 +1,30 @@
 # backend/services/data_management_service.py
+import gzip
+import io
+import itertools
 import json
 import traceback
-from sqlalchemy import text
+try:
+    import zstandard
+except ImportError:  # Optional; only needed to import zstd-compressed exports.
+    zstandard = None
+from sqlalchemy import DateTime, insert, text, update
 from passlib.hash import pbkdf2_sha256
 from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.orm import Session, selectinload
 
 from ..db import SessionLocal, db as flask_sqlalchemy_db
+from . import data_version_service, delta_service, json_stream_service, tag_service
+from .export_service import NDJSON_TABLE_KEY, NDJSON_METADATA_TABLE
 from ..models import (
     Base, User, Area, ProcessStep, UseCase, LLMSettings,
     UsecaseAreaRelevance, UsecaseStepRelevance, UsecaseUsecaseRelevance,
-    ProcessStepProcessStepRelevance, Tag
+    ProcessStepProcessStepRelevance
 )
-from datetime import datetime
+from datetime import datetime, timezone
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
 
 
 def datetime_serializer(obj):
@@ -20,52 +32,31 @@ def datetime_serializer(obj):
         return obj.isoformat()
     raise TypeError(f"Type {type(obj)} not serializable")
 
-def _get_or_create_tags(db_session: Session, tag_input, category: str, tag_cache: dict):
+def _get_or_create_tags(db_session: Session, tag_input, category: str):
     """
-    Efficiently gets or creates tags from a comma-separated string OR a list, 
-    using a per-request cache to avoid duplicate creation.
+    Gets or creates tags from a comma-separated string OR a list. Ids come
+    from the per-worker tag cache, so known tags cost no query.
     """
-    tag_names = set()
-    if isinstance(tag_input, str):
-        tag_names = {name.strip() for name in tag_input.split(',') if name.strip()}
-    elif isinstance(tag_input, list):
-        tag_names = {str(name).strip() for name in tag_input if str(name).strip()}
-
-    if not tag_names:
-        return []
-
-    tags_to_return = []
-    tags_to_query = []
-
-    for name in tag_names:
-        cache_key = (name, category)
-        if cache_key in tag_cache:
-            tags_to_return.append(tag_cache[cache_key])
-        else:
-            tags_to_query.append(name)
-    
-    if tags_to_query:
-        existing_tags_from_db = db_session.query(Tag).filter(
-            Tag.category == category,
-            Tag.name.in_(tags_to_query)
-        ).all()
-        for tag in existing_tags_from_db:
-            cache_key = (tag.name, tag.category)
-            tag_cache[cache_key] = tag
-            tags_to_return.append(tag)
-        existing_names_from_db = {t.name for t in existing_tags_from_db}
-        for name in tags_to_query:
-            if name not in existing_names_from_db:
-                new_tag = Tag(name=name, category=category)
-                db_session.add(new_tag)
-                cache_key = (name, category)
-                tag_cache[cache_key] = new_tag
-                tags_to_return.append(new_tag)
-
-    return tags_to_return
-
-
-def process_area_file(file_stream):
+    return tag_service.get_or_create_tags(db_session, tag_input, category)
+
+
+def _with_progress(items, progress, error_details):
+    """
+    Passes items through, reporting progress(items handled, len(error_details))
+    as the loop advances when a progress callback (e.g. a background job) is given.
+    """
+    if progress is None:
+        yield from items
+        return
+    handled = 0
+    for item in items:
+        progress(handled, len(error_details))
+        yield item
+        handled += 1
+    progress(handled, len(error_details))
+
+
+def process_area_file(file_stream, progress=None):
     session = SessionLocal()
     added_count = 0
     updated_count = 0
@@ -78,16 +69,12 @@ def process_area_file(file_stream):
 
     try:
         print("Processing area file (with update logic)")
-        try:
-            data = json.load(file_stream)
-        except UnicodeDecodeError:
-            file_stream.seek(0)
-            data = json.loads(file_stream.read().decode('utf-8'))
-
-        if not isinstance(data, list):
-            raise ValueError("Invalid JSON format: Top level must be a list of area objects.")
+        # Items are parsed one at a time as the loop pulls them from the upload.
+        data = json_stream_service.iter_json_array(
+            file_stream, "Invalid JSON format: Top level must be a list of area objects."
+        )
 
-        for i, item in enumerate(data):
+        for i, item in enumerate(_with_progress(data, progress, skipped_errors_details)):
             item_identifier = f"Item {i+1}"
             if isinstance(item, dict) and 'name' in item and isinstance(item['name'], str) and item['name'].strip():
                 area_name = item['name'].strip()
@@ -186,20 +173,41 @@ def process_area_file(file_stream):
     }
 
 
+# Keys per IN (...) lookup when matching uploaded items against the database.
+IN_QUERY_CHUNK_SIZE = 500
+
+
+def _query_in_chunks(query, column, keys):
+    """Yields the rows of query whose column is in keys, using one IN lookup per chunk."""
+    keys = list(dict.fromkeys(key for key in keys if isinstance(key, (str, int))))
+    for start in range(0, len(keys), IN_QUERY_CHUNK_SIZE):
+        yield from query.filter(column.in_(keys[start:start + IN_QUERY_CHUNK_SIZE]))
+
+
+def _load_items_by_key(session: Session, model_class, unique_key_field, keys):
+    """{key: object} for the rows matching keys; use cases come with their tags."""
+    query = session.query(model_class)
+    if model_class == UseCase:
+        query = query.options(selectinload(UseCase.tags))
+    return {
+        getattr(item, unique_key_field): item
+        for item in _query_in_chunks(query, getattr(model_class, unique_key_field), keys)
+    }
+
+
 def analyze_json_import(json_data, model_class, unique_key_field='bi_id'):
     """
     Analyzes a list of JSON objects against existing data in the database.
     This function performs the comparison and generates a detailed preview.
+    Only the rows whose keys appear in json_data are loaded.
     """
     session = SessionLocal()
     preview_data = []
 
-    if model_class == UseCase:
-        existing_items_query = session.query(UseCase).options(selectinload(UseCase.tags)).all()
-    else:
-        existing_items_query = session.query(model_class).all()
-    
-    existing_items_map = {getattr(item, unique_key_field): item for item in existing_items_query}
+    json_data = list(json_data)
+    existing_items_map = _load_items_by_key(
+        session, model_class, unique_key_field, [item.get(unique_key_field) for item in json_data]
+    )
     
     for json_item in json_data:
         entry = {
@@ -298,13 +306,25 @@ def finalize_import(resolved_data, model_class, unique_key_field='bi_id'):
     session = SessionLocal()
     added_count, updated_count, skipped_count, failed_count = 0, 0, 0, 0
     error_messages = []
-    tag_cache = {}
-
-    step_lookup = {}
-    if model_class == UseCase:
-        step_lookup = {step.bi_id: step.id for step in session.query(ProcessStep.bi_id, ProcessStep.id).all()}
 
     try:
+        # Everything the items refer to is fetched up front with chunked IN lookups.
+        pending_items = [item for item in resolved_data if item.get('action') in ('add', 'update')]
+        existing_items = _load_items_by_key(
+            session, model_class, unique_key_field, [item.get('identifier') for item in pending_items]
+        )
+        step_lookup = {}
+        if model_class == UseCase:
+            step_bi_ids = [
+                value for item in pending_items
+                for key, value in (item.get('data') or {}).items() if key.lower() == 'process_step_bi_id'
+            ]
+            step_lookup = {
+                step.bi_id: step.id
+                for step in _query_in_chunks(session.query(ProcessStep.bi_id, ProcessStep.id), ProcessStep.bi_id, step_bi_ids)
+            }
+        added_identifiers = set()
+
         for item in resolved_data:
             action = item.get('action')
             identifier = item.get('identifier')
@@ -336,7 +356,7 @@ def finalize_import(resolved_data, model_class, unique_key_field='bi_id'):
                         tags_to_update_from_json[category] = normalized_data[key]
                 
                 for category, tag_input in tags_to_update_from_json.items():
-                    tags_from_json.extend(_get_or_create_tags(session, tag_input, category, tag_cache))
+                    tags_from_json.extend(_get_or_create_tags(session, tag_input, category))
 
             creation_data = {k: v for k, v in normalized_data.items() if k not in list(tag_fields.keys()) + ['process_step_bi_id']}
             
@@ -352,13 +372,20 @@ def finalize_import(resolved_data, model_class, unique_key_field='bi_id'):
                     continue
 
             if action == 'add':
+                if identifier in existing_items or identifier in added_identifiers:
+                    failed_count += 1
+                    msg = f"Failed to add item {identifier}: An item with this {unique_key_field} already exists."
+                    print(msg)
+                    error_messages.append(msg)
+                    continue
                 try:
                     new_obj = model_class(**creation_data)
                     if model_class == UseCase:
                         new_obj.tags = tags_from_json
                     
+                    # Inserted with the other new items in one flush below.
                     session.add(new_obj)
-                    session.flush() 
+                    added_identifiers.add(identifier)
                     added_count += 1
                 except Exception as e:
                     failed_count += 1
@@ -369,7 +396,7 @@ def finalize_import(resolved_data, model_class, unique_key_field='bi_id'):
             
             elif action == 'update':
                 try:
-                    obj_to_update = session.query(model_class).filter(getattr(model_class, unique_key_field) == identifier).first()
+                    obj_to_update = existing_items.get(identifier)
                     if obj_to_update:
                         if model_class == UseCase and tags_to_update_from_json:
                             categories_in_json = tags_to_update_from_json.keys()
@@ -393,6 +420,16 @@ def finalize_import(resolved_data, model_class, unique_key_field='bi_id'):
                     error_messages.append(msg)
                     session.rollback()
 
+        if failed_count == 0:
+            try:
+                # One flush sends the inserts and updates as batched statements.
+                session.flush()
+            except Exception as e:
+                failed_count += 1
+                msg = f"Failed to save the imported items: {e}"
+                print(msg)
+                error_messages.append(msg)
+
         if failed_count > 0:
             session.rollback()
             return {"success": False, "message": f"Import failed. {failed_count} errors occurred. No changes were saved. Details: {'; '.join(error_messages)}"}
@@ -409,7 +446,7 @@ def finalize_import(resolved_data, model_class, unique_key_field='bi_id'):
     finally:
         session.close()
 
-def process_usecase_file(file_stream):
+def process_usecase_file(file_stream, progress=None):
     session = SessionLocal()
     added_count = 0
     updated_count = 0
@@ -452,22 +489,16 @@ def process_usecase_file(file_stream):
 
     try:
         print("Processing use case file (with update logic)")
-        tag_cache = {}
         step_lookup = {
             step.bi_id: step.id
             for step in session.query(ProcessStep.bi_id, ProcessStep.id).all()
         }
 
-        try:
-            data = json.load(file_stream)
-        except UnicodeDecodeError:
-            file_stream.seek(0)
-            data = json.loads(file_stream.read().decode('utf-8'))
-
-        if not isinstance(data, list):
-            raise ValueError("Invalid JSON format: Top level must be a list of use case objects.")
+        data = json_stream_service.iter_json_array(
+            file_stream, "Invalid JSON format: Top level must be a list of use case objects."
+        )
 
-        for i, item in enumerate(data):
+        for i, item in enumerate(_with_progress(data, progress, skipped_errors_details)):
             item_identifier = f"Item {i+1}"
             uc_bi_id_from_json = item.get('bi_id', 'N/A')
             uc_name_from_json = item.get('name', 'N/A')
@@ -551,7 +582,7 @@ def process_usecase_file(file_stream):
                     final_tags = [tag for tag in current_tags if tag.category not in tags_to_update.values()]
                     for json_key, category in tags_to_update.items():
                          if json_key in item:
-                            new_tags_for_category = _get_or_create_tags(session, item[json_key], category, tag_cache)
+                            new_tags_for_category = _get_or_create_tags(session, item[json_key], category)
                             final_tags.extend(new_tags_for_category)
                     
                     existing_usecase.tags = final_tags
@@ -583,8 +614,8 @@ def process_usecase_file(file_stream):
                 
                 new_uc = UseCase(**new_uc_data)
                 
-                it_system_tags = _get_or_create_tags(session, item.get('it_systems', ''), 'it_system', tag_cache)
-                data_type_tags = _get_or_create_tags(session, item.get('data_types', ''), 'data_type', tag_cache)
+                it_system_tags = _get_or_create_tags(session, item.get('it_systems', ''), 'it_system')
+                data_type_tags = _get_or_create_tags(session, item.get('data_types', ''), 'data_type')
                 new_uc.tags = it_system_tags + data_type_tags
 
                 session.add(new_uc)
@@ -636,7 +667,51 @@ def process_usecase_file(file_stream):
     }
 
 
-def process_ps_ps_relevance_file(file_stream):
+
+# New relevance links are written with one multi-row INSERT per batch.
+RELEVANCE_INSERT_BATCH_SIZE = 2000
+
+
+class _RelevanceLinkWriter:
+    """
+    Existence checks and batched inserts for one relevance model. The
+    existing (source id, target id) pairs are loaded in a single query, so
+    each item of an uploaded file is checked in memory.
+    """
+
+    def __init__(self, session: Session, model, source_column, target_column):
+        self._session = session
+        self._table = model.__table__
+        self._source_column = source_column
+        self._target_column = target_column
+        self._pending = []
+        self._pairs = {
+            (source_id, target_id)
+            for source_id, target_id in session.query(getattr(model, source_column), getattr(model, target_column))
+        }
+
+    def exists(self, source_id, target_id):
+        """True if the link is in the database or was already added from this file."""
+        return (source_id, target_id) in self._pairs
+
+    def add(self, source_id, target_id, relevance_score, relevance_content):
+        self._pairs.add((source_id, target_id))
+        self._pending.append({
+            self._source_column: source_id,
+            self._target_column: target_id,
+            "relevance_score": relevance_score,
+            "relevance_content": relevance_content,
+        })
+        if len(self._pending) >= RELEVANCE_INSERT_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self._session.execute(insert(self._table), self._pending)
+            self._pending = []
+
+
+def process_ps_ps_relevance_file(file_stream, progress=None):
     session = SessionLocal()
     added_count = 0
     skipped_count_total = 0
@@ -656,17 +731,15 @@ def process_ps_ps_relevance_file(file_stream):
             step.bi_id: step.id
             for step in session.query(ProcessStep.bi_id, ProcessStep.id).all()
         }
+        links = _RelevanceLinkWriter(
+            session, ProcessStepProcessStepRelevance, 'source_process_step_id', 'target_process_step_id'
+        )
 
-        try:
-            data = json.load(file_stream)
-        except UnicodeDecodeError:
-            file_stream.seek(0)
-            data = json.loads(file_stream.read().decode('utf-8'))
-
-        if not isinstance(data, list):
-            raise ValueError("Invalid JSON format: Top level must be a list of relevance objects.")
+        data = json_stream_service.iter_json_array(
+            file_stream, "Invalid JSON format: Top level must be a list of relevance objects."
+        )
 
-        for i, item in enumerate(data):
+        for i, item in enumerate(_with_progress(data, progress, skipped_errors_details)):
             source_bi_id_log = item.get('source_process_step_bi_id', 'N/A')
             target_bi_id_log = item.get('target_process_step_bi_id', 'N/A')
             item_log_string = f"Link {i+1} ('{source_bi_id_log}' -> '{target_bi_id_log}')"
@@ -733,28 +806,18 @@ def process_ps_ps_relevance_file(file_stream):
                 skipped_errors_details.append(f"{item_log_string} (SourceID: {source_id}, TargetID: {target_id}): Link already processed from this file. Skipped duplicate entry.")
                 continue
 
-            existing_link_in_db = session.query(ProcessStepProcessStepRelevance).filter_by(
-                source_process_step_id=source_id,
-                target_process_step_id=target_id
-            ).first()
-
-            if existing_link_in_db:
+            if links.exists(source_id, target_id):
                 skipped_existing_link += 1
                 skipped_count_total += 1
                 skipped_errors_details.append(f"{item_log_string} (SourceID: {source_id}, TargetID: {target_id}): Link already exists in the database. Skipped.")
                 processed_pairs_in_file.add(current_pair)
                 continue
 
-            new_link = ProcessStepProcessStepRelevance(
-                source_process_step_id=source_id,
-                target_process_step_id=target_id,
-                relevance_score=score,
-                relevance_content=relevance_content
-            )
-            session.add(new_link)
+            links.add(source_id, target_id, score, relevance_content)
             processed_pairs_in_file.add(current_pair)
             added_count += 1
 
+        links.flush()
         session.commit()
         success = True
 
@@ -796,7 +859,7 @@ def process_ps_ps_relevance_file(file_stream):
     }
 
 
-def process_usecase_area_relevance_file(file_stream):
+def process_usecase_area_relevance_file(file_stream, progress=None):
     session = SessionLocal()
     added_count = 0
     skipped_count_total = 0
@@ -811,17 +874,13 @@ def process_usecase_area_relevance_file(file_stream):
         print("Processing Use Case-Area relevance links file...")
         usecase_lookup = {uc.bi_id: uc.id for uc in session.query(UseCase.bi_id, UseCase.id).all()}
         area_lookup = {area.name: area.id for area in session.query(Area.name, Area.id).all()}
+        links = _RelevanceLinkWriter(session, UsecaseAreaRelevance, 'source_usecase_id', 'target_area_id')
 
-        try:
-            data = json.load(file_stream)
-        except UnicodeDecodeError:
-            file_stream.seek(0)
-            data = json.loads(file_stream.read().decode('utf-8'))
-
-        if not isinstance(data, list):
-            raise ValueError("Invalid JSON format: Top level must be a list.")
+        data = json_stream_service.iter_json_array(
+            file_stream, "Invalid JSON format: Top level must be a list."
+        )
 
-        for i, item in enumerate(data):
+        for i, item in enumerate(_with_progress(data, progress, skipped_errors_details)):
             source_uc_bi_id_log = item.get('source_usecase_bi_id', 'N/A')
             target_area_name_log = item.get('target_area_name', 'N/A')
             item_log_string = f"Link {i+1} ('{source_uc_bi_id_log}' -> '{target_area_name_log}')"
@@ -876,26 +935,16 @@ def process_usecase_area_relevance_file(file_stream):
                 skipped_errors_details.append(f"{item_log_string}: Non-integer score '{relevance_score_raw}'.")
                 continue
 
-            existing_link = session.query(UsecaseAreaRelevance).filter_by(
-                source_usecase_id=source_uc_id,
-                target_area_id=target_area_id
-            ).first()
-
-            if existing_link:
+            if links.exists(source_uc_id, target_area_id):
                 skipped_existing_link += 1
                 skipped_count_total += 1
                 skipped_errors_details.append(f"{item_log_string}: Link already exists. Skipped.")
                 continue
 
-            new_link = UsecaseAreaRelevance(
-                source_usecase_id=source_uc_id,
-                target_area_id=target_area_id,
-                relevance_score=score,
-                relevance_content=relevance_content
-            )
-            session.add(new_link)
+            links.add(source_uc_id, target_area_id, score, relevance_content)
             added_count += 1
 
+        links.flush()
         session.commit()
         success = True
 
@@ -936,7 +985,7 @@ def process_usecase_area_relevance_file(file_stream):
         "skipped_errors_details": skipped_errors_details
     }
 
-def process_usecase_step_relevance_file(file_stream):
+def process_usecase_step_relevance_file(file_stream, progress=None):
     session = SessionLocal()
     added_count = 0
     skipped_count_total = 0
@@ -951,17 +1000,13 @@ def process_usecase_step_relevance_file(file_stream):
         print("Processing Use Case-Step relevance links file...")
         usecase_lookup = {uc.bi_id: uc.id for uc in session.query(UseCase.bi_id, UseCase.id).all()}
         step_lookup = {step.bi_id: step.id for step in session.query(ProcessStep.bi_id, ProcessStep.id).all()}
+        links = _RelevanceLinkWriter(session, UsecaseStepRelevance, 'source_usecase_id', 'target_process_step_id')
 
-        try:
-            data = json.load(file_stream)
-        except UnicodeDecodeError:
-            file_stream.seek(0)
-            data = json.loads(file_stream.read().decode('utf-8'))
-
-        if not isinstance(data, list):
-            raise ValueError("Invalid JSON format: Top level must be a list.")
+        data = json_stream_service.iter_json_array(
+            file_stream, "Invalid JSON format: Top level must be a list."
+        )
 
-        for i, item in enumerate(data):
+        for i, item in enumerate(_with_progress(data, progress, skipped_errors_details)):
             source_uc_bi_id_log = item.get('source_usecase_bi_id', 'N/A')
             target_ps_bi_id_log = item.get('target_process_step_bi_id', 'N/A')
             item_log_string = f"Link {i+1} ('{source_uc_bi_id_log}' -> '{target_ps_bi_id_log}')"
@@ -1016,26 +1061,16 @@ def process_usecase_step_relevance_file(file_stream):
                 skipped_errors_details.append(f"{item_log_string}: Non-integer score '{relevance_score_raw}'.")
                 continue
 
-            existing_link = session.query(UsecaseStepRelevance).filter_by(
-                source_usecase_id=source_uc_id,
-                target_process_step_id=target_ps_id
-            ).first()
-
-            if existing_link:
+            if links.exists(source_uc_id, target_ps_id):
                 skipped_existing_link += 1
                 skipped_count_total += 1
                 skipped_errors_details.append(f"{item_log_string}: Link already exists. Skipped.")
                 continue
 
-            new_link = UsecaseStepRelevance(
-                source_usecase_id=source_uc_id,
-                target_process_step_id=target_ps_id,
-                relevance_score=score,
-                relevance_content=relevance_content
-            )
-            session.add(new_link)
+            links.add(source_uc_id, target_ps_id, score, relevance_content)
             added_count += 1
 
+        links.flush()
         session.commit()
         success = True
 
@@ -1076,7 +1111,7 @@ def process_usecase_step_relevance_file(file_stream):
         "skipped_errors_details": skipped_errors_details
     }
 
-def process_usecase_usecase_relevance_file(file_stream):
+def process_usecase_usecase_relevance_file(file_stream, progress=None):
     session = SessionLocal()
     added_count = 0
     skipped_count_total = 0
@@ -1091,17 +1126,13 @@ def process_usecase_usecase_relevance_file(file_stream):
     try:
         print("Processing Use Case-Use Case relevance links file...")
         usecase_lookup = {uc.bi_id: uc.id for uc in session.query(UseCase.bi_id, UseCase.id).all()}
+        links = _RelevanceLinkWriter(session, UsecaseUsecaseRelevance, 'source_usecase_id', 'target_usecase_id')
 
-        try:
-            data = json.load(file_stream)
-        except UnicodeDecodeError:
-            file_stream.seek(0)
-            data = json.loads(file_stream.read().decode('utf-8'))
-
-        if not isinstance(data, list):
-            raise ValueError("Invalid JSON format: Top level must be a list.")
+        data = json_stream_service.iter_json_array(
+            file_stream, "Invalid JSON format: Top level must be a list."
+        )
 
-        for i, item in enumerate(data):
+        for i, item in enumerate(_with_progress(data, progress, skipped_errors_details)):
             source_uc_bi_id_log = item.get('source_usecase_bi_id', 'N/A')
             target_uc_bi_id_log = item.get('target_usecase_bi_id', 'N/A')
             item_log_string = f"Link {i+1} ('{source_uc_bi_id_log}' -> '{target_uc_bi_id_log}')"
@@ -1162,26 +1193,16 @@ def process_usecase_usecase_relevance_file(file_stream):
                 skipped_errors_details.append(f"{item_log_string}: Non-integer score '{relevance_score_raw}'.")
                 continue
 
-            existing_link = session.query(UsecaseUsecaseRelevance).filter_by(
-                source_usecase_id=source_uc_id,
-                target_usecase_id=target_uc_id
-            ).first()
-
-            if existing_link:
+            if links.exists(source_uc_id, target_uc_id):
                 skipped_existing_link += 1
                 skipped_count_total += 1
                 skipped_errors_details.append(f"{item_log_string}: Link already exists. Skipped.")
                 continue
 
-            new_link = UsecaseUsecaseRelevance(
-                source_usecase_id=source_uc_id,
-                target_usecase_id=target_uc_id,
-                relevance_score=score,
-                relevance_content=relevance_content
-            )
-            session.add(new_link)
+            links.add(source_uc_id, target_uc_id, score, relevance_content)
             added_count += 1
 
+        links.flush()
         session.commit()
         success = True
 
@@ -1223,33 +1244,427 @@ def process_usecase_usecase_relevance_file(file_stream):
     }
 
 
-def import_database_from_json(json_string, clear_existing_data=False):
+def _open_export_stream(content):
+    """
+    File-like view of an uploaded export with gzip/zstd compression (detected
+    from the magic bytes) undone on the fly. Accepts bytes, str or a seekable
+    binary/text stream.
+    """
+    if isinstance(content, str):
+        return io.StringIO(content)
+    stream = io.BytesIO(content) if isinstance(content, (bytes, bytearray)) else content
+    head = stream.read(4)
+    stream.seek(0)
+    if isinstance(head, str):
+        return stream
+    if head[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=stream)
+    if head[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError("This export is zstd-compressed; install the 'zstandard' package to import it.")
+        return zstandard.ZstdDecompressor().stream_reader(stream)
+    return stream
+
+
+def _iter_ndjson_tables(records):
+    """Groups consecutive NDJSON records into (table, row iterator) pairs."""
+    records = (record for record in records if isinstance(record, dict) and record.get(NDJSON_TABLE_KEY))
+    for table, rows in itertools.groupby(records, key=lambda record: record[NDJSON_TABLE_KEY]):
+        yield table, ({k: v for k, v in row.items() if k != NDJSON_TABLE_KEY} for row in rows)
+
+
+def _iter_json_tables(reader, keys, first_key):
+    """(table, row iterator) pairs from the "data" object of a JSON export."""
+    key = first_key
+    while key is not None:
+        if key == "data":
+            for table in reader.iter_object_keys():
+                rows = reader.iter_array()
+                yield table, rows
+                for _ in rows:  # skip whatever the consumer left unread
+                    pass
+        else:
+            reader.read_value()
+        key = next(keys, None)
+    reader.expect_end()
+
+
+def read_database_export(content):
+    """
+    Opens a full-database export in any layout the exporter produces (plain
+    JSON or NDJSON, optionally gzip/zstd compressed) for streaming.
+    Returns (metadata, tables): tables yields (table key, row iterator) pairs
+    in file order, and each row iterator must be consumed before advancing,
+    so only one row at a time is held in memory.
+    """
+    reader = json_stream_service.JsonStreamReader(_open_export_stream(content))
+    if reader.peek() != '{':
+        raise ValueError("Invalid export: expected a JSON object.")
+    keys = reader.iter_object_keys()
+    first_key = next(keys, None)
+
+    if first_key == NDJSON_TABLE_KEY:
+        # NDJSON: the first line is the tagged metadata record.
+        first_record = {first_key: reader.read_value()}
+        for key in keys:
+            first_record[key] = reader.read_value()
+        records = itertools.chain([first_record], reader.iter_values())
+        if first_record[NDJSON_TABLE_KEY] == NDJSON_METADATA_TABLE:
+            metadata = {k: v for k, v in next(records).items() if k != NDJSON_TABLE_KEY}
+        else:
+            metadata = {}
+        return metadata, _iter_ndjson_tables(records)
+
+    metadata = {}
+    if first_key == "metadata":
+        metadata = reader.read_value()
+        first_key = next(keys, None)
+    return metadata, _iter_json_tables(reader, keys, first_key)
+
+
+def parse_database_export(content):
+    """
+    Parses a whole export into the {"metadata", "data"} document. Accepts
+    anything read_database_export does, or an already parsed dict.
+    """
+    if isinstance(content, dict):
+        return content
+    metadata, tables = read_database_export(content)
+    # The NDJSON table list lets an empty table be told apart from a missing one.
+    data = {table: [] for table in metadata.get("tables", [])}
+    for table, rows in tables:
+        data.setdefault(table, []).extend(rows)
+    return {"metadata": metadata, "data": data}
+
+
+def _import_database_delta(session_local, imported_data):
+    """Applies a delta export on top of the existing data (never clears anything)."""
+    counts, skipped = delta_service.apply_delta(session_local, imported_data)
+    session_local.commit()
+    message = (
+        f"Delta import applied: {counts['created']} created, {counts['updated']} updated, "
+        f"{counts['renamed']} renamed, {counts['deleted']} deleted, {counts['skipped']} skipped."
+    )
+    return {
+        "success": True,
+        "message": message,
+        "skipped_count": counts['skipped'],
+        "skipped_errors_details": skipped
+    }
+
+
+# --- Bulk import (full restore) ---
+
+IMPORT_BATCH_SIZE = 1000
+
+
+def _parse_datetime_value(value):
+    """Exported timestamps are ISO strings; drivers other than psycopg2 need datetimes."""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return value
+
+
+def _stamped_columns(table):
+    """Timestamp columns the database fills itself (server default)."""
+    return {c.name for c in table.columns if isinstance(c.type, DateTime) and c.server_default is not None}
+
+
+def _parse_datetimes(mapping, datetime_columns, stamped_columns, now):
+    """
+    Parses a mapping's exported timestamps in place. Stamped columns left
+    empty get now instead of the server default: a batch binds a row without
+    the column as NULL when another row has it (see _normalize_keys).
+    """
+    for column in datetime_columns.intersection(mapping):
+        mapping[column] = _parse_datetime_value(mapping[column])
+    for column in stamped_columns:
+        if mapping.get(column) is None:
+            mapping[column] = now
+
+
+def _prepare_rows(model, rows, exclude=(), only=None, **overrides):
+    """
+    Turns exported row dicts into insert mappings for model's table: unknown keys
+    are dropped, timestamps parsed, and overrides(row) applied per column.
+    Returns (old_ids, mappings); rows an override maps to None are skipped.
+    """
+    table = model.__table__
+    columns = set(only) if only is not None else {c.name for c in table.columns}
+    columns -= set(exclude) | {'id'}
+    datetime_columns = {c.name for c in table.columns if isinstance(c.type, DateTime)}
+    stamped_columns = _stamped_columns(table) & columns
+    now = datetime.now(timezone.utc)
+
+    old_ids, mappings = [], []
+    for row in rows:
+        mapping = {k: v for k, v in row.items() if k in columns}
+        skip = False
+        for column, resolve in overrides.items():
+            value = resolve(row)
+            if value is None:
+                skip = True
+                break
+            mapping[column] = value
+        if skip:
+            continue
+        _parse_datetimes(mapping, datetime_columns, stamped_columns, now)
+        old_ids.append(row.get('id'))
+        mappings.append(mapping)
+    return old_ids, mappings
+
+
+def _normalize_keys(mappings):
+    # executemany needs every row in a batch to bind the same parameters.
+    keys = set()
+    for mapping in mappings:
+        keys.update(mapping)
+    return [{k: mapping.get(k) for k in keys} if len(mapping) != len(keys) else mapping for mapping in mappings]
+
+
+def _bulk_insert(session: Session, model, old_ids, mappings, id_map=None):
+    """
+    Inserts mappings in batches of IMPORT_BATCH_SIZE. When id_map is given the
+    generated primary keys are recorded as id_map[old_id] = new_id.
+    On PostgreSQL this is a multi-row INSERT ... RETURNING per batch; other
+    dialects go through bulk_insert_mappings.
+    """
+    if not mappings:
+        return 0
+    table = model.__table__
+    use_returning = session.get_bind().dialect.name == 'postgresql'
+
+    for start in range(0, len(mappings), IMPORT_BATCH_SIZE):
+        batch = _normalize_keys(mappings[start:start + IMPORT_BATCH_SIZE])
+        batch_old_ids = old_ids[start:start + IMPORT_BATCH_SIZE]
+        if id_map is None:
+            session.execute(insert(table), batch)
+        elif use_returning:
+            new_ids = session.execute(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True), batch
+            ).scalars().all()
+            id_map.update(zip(batch_old_ids, new_ids))
+        else:
+            session.bulk_insert_mappings(model, batch, return_defaults=True)
+            id_map.update((old_id, mapping['id']) for old_id, mapping in zip(batch_old_ids, batch))
+    return len(mappings)
+
+
+# Tables a full import empties, children first. Listed explicitly rather than
+# cascading from users: that would also empty background_jobs (locking the
+# running import job's own row until the import commits), drafts and
+# llm_conversations. Users are merged by username instead (see _bulk_import_tables).
+IMPORT_CLEARED_TABLES = [
+    'usecase_tag_association', 'process_step_process_step_relevance', 'usecase_usecase_relevance',
+    'usecase_step_relevance', 'usecase_area_relevance', 'use_cases', 'process_steps', 'areas', 'llm_settings'
+]
+
+
+def truncate_tables(executor, dialect_name, table_names):
+    """
+    Empties table_names through executor (a session or connection). On
+    PostgreSQL this is one TRUNCATE without CASCADE, so every table that
+    references one of them must be in the list too; elsewhere plain DELETEs.
+    """
+    if dialect_name == 'postgresql':
+        print(f"Executing TRUNCATE TABLE {', '.join(table_names)} RESTART IDENTITY;")
+        executor.execute(
+            text(f"TRUNCATE TABLE {', '.join(table_names)} RESTART IDENTITY").execution_options(timeout=30)
+        )
+    else:
+        for table_name in table_names:
+            executor.execute(text(f"DELETE FROM {table_name}"))
+
+
+# Tables whose id maps must be complete before a table can be imported.
+_IMPORT_DEPENDENCIES = {
+    "users": (),
+    "areas": (),
+    "process_steps": ("areas",),
+    "use_cases": ("process_steps",),
+    "llm_settings": ("users",),
+    "usecase_area_relevance": ("use_cases", "areas"),
+    "usecase_step_relevance": ("use_cases", "process_steps"),
+    "usecase_usecase_relevance": ("use_cases",),
+    "process_step_process_step_relevance": ("process_steps",),
+}
+
+
+def _batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _bulk_import_tables(session: Session, tables, progress=None):
+    """
+    Restores a full export into freshly cleared tables, remapping exported ids
+    to the ones the database hands out. Users are matched by username: known
+    accounts keep their id (and get the exported password), others are added,
+    and none are removed. tables yields (table key, rows) pairs
+    as read_database_export does; rows are inserted batch by batch as they
+    stream in. A table that arrives before the tables it references is held
+    in memory until they are done (exports list them in dependency order).
+    progress(rows) is called after every batch with the running row count.
+    """
+    id_maps = {key: {} for key in ("users", "areas", "process_steps", "use_cases")}
+    default_password = []
+    settings_users = set()
+
+    def user_password(u_data):
+        if u_data.get("password"):
+            return u_data["password"]
+        if not default_password:
+            default_password.append(pbkdf2_sha256.hash("imported_default_password"))
+        return default_password[0]
+
+    def prepare_users(batch):
+        old_ids, mappings = _prepare_rows(User, batch, only=('username', 'password'), password=user_password)
+        existing = dict(session.query(User.username, User.id).filter(
+            User.username.in_([mapping['username'] for mapping in mappings])
+        ))
+        new_old_ids, new_mappings = [], []
+        for old_id, mapping in zip(old_ids, mappings):
+            user_id = existing.get(mapping['username'])
+            if user_id is None:
+                new_old_ids.append(old_id)
+                new_mappings.append(mapping)
+                continue
+            id_maps["users"][old_id] = user_id
+            session.execute(update(User.__table__).where(User.__table__.c.id == user_id)
+                            .values(password=mapping['password']))
+        return new_old_ids, new_mappings
+
+    def prepare_llm_settings(batch):
+        # One settings row per user (unique user_id); the first exported row wins.
+        rows = []
+        for ls_data in batch:
+            new_user_id = id_maps["users"].get(ls_data.get("user_id"))
+            if new_user_id is not None and new_user_id not in settings_users:
+                settings_users.add(new_user_id)
+                rows.append(ls_data)
+        return _prepare_rows(LLMSettings, rows, user_id=lambda ls: id_maps["users"].get(ls["user_id"]))
+
+    def prepare_relevance(model, source_col, source_map, target_col, target_map):
+        def prepare(batch):
+            rows = []
+            for r_data in batch:
+                new_source_id = source_map.get(r_data.get(source_col))
+                new_target_id = target_map.get(r_data.get(target_col))
+                if new_source_id is None or new_target_id is None:
+                    continue
+                if source_map is target_map and new_source_id == new_target_id:
+                    continue
+                rows.append({
+                    source_col: new_source_id,
+                    target_col: new_target_id,
+                    "relevance_score": r_data["relevance_score"],
+                    "relevance_content": r_data.get("relevance_content"),
+                })
+            return [None] * len(rows), rows
+        return model, prepare, None
+
+    importers = {
+        "users": (User, prepare_users, id_maps["users"]),
+        "areas": (Area, lambda batch: _prepare_rows(
+            Area, batch, only=('name', 'description')
+        ), id_maps["areas"]),
+        "process_steps": (ProcessStep, lambda batch: _prepare_rows(
+            ProcessStep, batch, area_id=lambda ps: id_maps["areas"].get(ps.get("area_id"))
+        ), id_maps["process_steps"]),
+        "use_cases": (UseCase, lambda batch: _prepare_rows(
+            UseCase, batch, process_step_id=lambda uc: id_maps["process_steps"].get(uc.get("process_step_id"))
+        ), id_maps["use_cases"]),
+        "llm_settings": (LLMSettings, prepare_llm_settings, None),
+        "usecase_area_relevance": prepare_relevance(
+            UsecaseAreaRelevance, "source_usecase_id", id_maps["use_cases"], "target_area_id", id_maps["areas"]),
+        "usecase_step_relevance": prepare_relevance(
+            UsecaseStepRelevance, "source_usecase_id", id_maps["use_cases"],
+            "target_process_step_id", id_maps["process_steps"]),
+        "usecase_usecase_relevance": prepare_relevance(
+            UsecaseUsecaseRelevance, "source_usecase_id", id_maps["use_cases"], "target_usecase_id", id_maps["use_cases"]),
+        "process_step_process_step_relevance": prepare_relevance(
+            ProcessStepProcessStepRelevance, "source_process_step_id", id_maps["process_steps"],
+            "target_process_step_id", id_maps["process_steps"]),
+    }
+
+    done = set()
+    held = {}
+    rows_read = 0
+
+    def import_table(key, rows):
+        nonlocal rows_read
+        model, prepare, id_map = importers[key]
+        count = 0
+        for batch in _batched(rows, IMPORT_BATCH_SIZE):
+            old_ids, mappings = prepare(batch)
+            count += _bulk_insert(session, model, old_ids, mappings, id_map)
+            rows_read += len(batch)
+            if progress is not None:
+                progress(rows_read)
+        done.add(key)
+        print(f"Imported {count} rows into {key}.")
+
+    def ready(key):
+        return all(dependency in done for dependency in _IMPORT_DEPENDENCIES[key])
+
+    for key, rows in tables:
+        if key not in importers or key in done:
+            print(f"Skipping table '{key}' in import file.")
+            continue
+        if not ready(key):
+            held[key] = list(rows)
+            continue
+        import_table(key, rows)
+        for held_key in [k for k in _IMPORT_DEPENDENCIES if k in held]:
+            if ready(held_key):
+                import_table(held_key, held.pop(held_key))
+
+    # Tables whose dependencies were missing from the file; their rows find no parents.
+    for key in [k for k in _IMPORT_DEPENDENCIES if k in held]:
+        import_table(key, held.pop(key))
+
+
+def import_database_from_json(json_string, clear_existing_data=False, progress=None):
+    """
+    json_string may be any export layout accepted by read_database_export,
+    including an open (binary) file; it is parsed incrementally while rows
+    are inserted. Delta exports are applied incrementally; clear_existing_data
+    is ignored for them. progress(rows) reports restore progress (background jobs).
+    """
     session_local = SessionLocal()
 
     try:
         print("import_database_from_json service function called.")
-        data_to_import = json.loads(json_string)
-        print(f"JSON content loaded. Found {len(data_to_import.get('data', {}).keys())} top-level data keys.")
+        metadata, tables = read_database_export(json_string)
+        print(f"Export opened (format: {metadata.get('format', 'json')}, exported: {metadata.get('export_date', 'unknown')}).")
 
-        imported_data = data_to_import.get("data", {})
-
-        if not imported_data:
+        tables = iter(tables)
+        first_table = next(tables, None)
+        if first_table is None:
             print("No 'data' key found or data is empty in JSON.")
             return {
                 "success": False,
                 "message": "No 'data' key found in JSON file or data is empty."
             }
+        tables = itertools.chain([first_table], tables)
+
+        if metadata.get("delta"):
+            print("Delta export detected; applying changes incrementally.")
+            # Deltas only carry changed rows, so they are small enough to load whole.
+            imported_data = {key: list(rows) for key, rows in tables}
+            return _import_database_delta(session_local, imported_data)
 
         if clear_existing_data:
             print("Clearing existing data...")
 
             try:
-                table_names = [
-                    'process_step_process_step_relevance', 'usecase_usecase_relevance', 
-                    'usecase_step_relevance', 'usecase_area_relevance', 
-                    'use_cases', 'process_steps', 'areas', 'llm_settings', 'users'
-                ]
-                
                 # Truncate flask_sessions if it exists
                 inspector = flask_sqlalchemy_db.inspect(flask_sqlalchemy_db.engine)
                 if inspector.has_table('flask_sessions'):
@@ -1257,10 +1672,9 @@ def import_database_from_json(json_string, clear_existing_data=False):
                     session_local.commit()
                     print("Deleted all records from flask_sessions successfully.")
 
-                for table in table_names:
-                    print(f"Executing TRUNCATE TABLE {table} RESTART IDENTITY CASCADE;")
-                    session_local.execute(text(f"TRUNCATE TABLE {table} RESTART IDENTITY CASCADE;").execution_options(timeout=30))
-                session_local.commit()
+                truncate_tables(session_local, session_local.get_bind().dialect.name, IMPORT_CLEARED_TABLES)
+                # Not committed yet: the file is parsed while importing, so a
+                # malformed export rolls back to the old data.
                 print("Data cleared.")
 
             except OperationalError as oe:
@@ -1273,81 +1687,11 @@ def import_database_from_json(json_string, clear_existing_data=False):
                 traceback.print_exc()
                 return {"success": False, "message": f"Unexpected error during data clearing: {e}. Import rolled back."}
 
-            user_id_map, area_id_map, process_step_id_map, usecase_id_map = {}, {}, {}, {}
-
-            if "users" in imported_data:
-                for u_data in imported_data["users"]:
-                    user = User(username=u_data["username"], password=u_data.get("password", pbkdf2_sha256.hash("imported_default_password")))
-                    session_local.add(user)
-                    session_local.flush()
-                    user_id_map[u_data["id"]] = user.id
-            print("Users import complete.")
-
-            if "areas" in imported_data:
-                for a_data in imported_data["areas"]:
-                    area = Area(name=a_data["name"], description=a_data.get("description"))
-                    session_local.add(area)
-                    session_local.flush()
-                    area_id_map[a_data["id"]] = area.id
-            print("Areas import complete.")
-            
-            if "process_steps" in imported_data:
-                for ps_data in imported_data["process_steps"]:
-                    new_area_id = area_id_map.get(ps_data["area_id"])
-                    if new_area_id is None: continue
-                    step = ProcessStep(bi_id=ps_data["bi_id"], name=ps_data["name"], area_id=new_area_id, **{k:v for k,v in ps_data.items() if k not in ['id', 'bi_id', 'name', 'area_id']})
-                    session_local.add(step)
-                    session_local.flush()
-                    process_step_id_map[ps_data["id"]] = step.id
-            print("Process Steps import complete.")
-
-            if "use_cases" in imported_data:
-                for uc_data in imported_data["use_cases"]:
-                    new_process_step_id = process_step_id_map.get(uc_data["process_step_id"])
-                    if new_process_step_id is None: continue
-                    use_case = UseCase(bi_id=uc_data["bi_id"], name=uc_data["name"], process_step_id=new_process_step_id, **{k:v for k,v in uc_data.items() if k not in ['id', 'bi_id', 'name', 'process_step_id']})
-                    session_local.add(use_case)
-                    session_local.flush()
-                    usecase_id_map[uc_data["id"]] = use_case.id
-            print("Use Cases import complete.")
-
-            if "llm_settings" in imported_data:
-                for ls_data in imported_data["llm_settings"]:
-                    new_user_id = user_id_map.get(ls_data["user_id"])
-                    if new_user_id is None or session_local.query(LLMSettings).filter_by(user_id=new_user_id).first(): continue
-                    ls = LLMSettings(user_id=new_user_id, **{k:v for k,v in ls_data.items() if k not in ['id', 'user_id']})
-                    session_local.add(ls)
-            print("LLM Settings import complete.")
-
-            if "usecase_area_relevance" in imported_data:
-                for r_data in imported_data["usecase_area_relevance"]:
-                    new_source_id = usecase_id_map.get(r_data["source_usecase_id"])
-                    new_target_id = area_id_map.get(r_data["target_area_id"])
-                    if new_source_id is None or new_target_id is None: continue
-                    session_local.add(UsecaseAreaRelevance(source_usecase_id=new_source_id, target_area_id=new_target_id, relevance_score=r_data["relevance_score"], relevance_content=r_data.get("relevance_content")))
-            
-            if "usecase_step_relevance" in imported_data:
-                for r_data in imported_data["usecase_step_relevance"]:
-                    new_source_id = usecase_id_map.get(r_data["source_usecase_id"])
-                    new_target_id = process_step_id_map.get(r_data["target_process_step_id"])
-                    if new_source_id is None or new_target_id is None: continue
-                    session_local.add(UsecaseStepRelevance(source_usecase_id=new_source_id, target_process_step_id=new_target_id, relevance_score=r_data["relevance_score"], relevance_content=r_data.get("relevance_content")))
-
-            if "usecase_usecase_relevance" in imported_data:
-                for r_data in imported_data["usecase_usecase_relevance"]:
-                    new_source_id = usecase_id_map.get(r_data["source_usecase_id"])
-                    new_target_id = usecase_id_map.get(r_data["target_usecase_id"])
-                    if new_source_id is None or new_target_id is None or new_source_id == new_target_id: continue
-                    session_local.add(UsecaseUsecaseRelevance(source_usecase_id=new_source_id, target_usecase_id=new_target_id, relevance_score=r_data["relevance_score"], relevance_content=r_data.get("relevance_content")))
-
-            if "process_step_process_step_relevance" in imported_data:
-                for r_data in imported_data["process_step_process_step_relevance"]:
-                    new_source_id = process_step_id_map.get(r_data["source_process_step_id"])
-                    new_target_id = process_step_id_map.get(r_data["target_process_step_id"])
-                    if new_source_id is None or new_target_id is None or new_source_id == new_target_id: continue
-                    session_local.add(ProcessStepProcessStepRelevance(source_process_step_id=new_source_id, target_process_step_id=new_target_id, relevance_score=r_data["relevance_score"], relevance_content=r_data.get("relevance_content")))
-            print("Relevance Links import complete.")
-            
+            _bulk_import_tables(session_local, tables, progress)
+
+            data_version_service.mark_changed(
+                session_local, data_version_service.CATALOG, data_version_service.LLM_SETTINGS
+            )
             session_local.commit()
             return {"success": True, "message": "Database import successful."}
         else:
@@ -0,0 +1,119 @@
+# backend/services/data_version_service.py
+import threading
+
+from sqlalchemy import event, select, update, insert, func
+from sqlalchemy.orm import Session
+
+from ..models import DataVersion, Area, ProcessStep, UseCase, LLMSettings
+
+# Version scopes. A scope groups the tables whose changes invalidate the same caches.
+CATALOG = 'catalog'
+LLM_SETTINGS = 'llm_settings'
+
+# Model class -> scopes that must be bumped when an instance is added, changed or deleted.
+TRACKED_MODELS = {
+    Area: (CATALOG,),
+    ProcessStep: (CATALOG,),
+    UseCase: (CATALOG,),
+    LLMSettings: (LLM_SETTINGS,),
+}
+
+_PENDING_SCOPES_KEY = 'data_version_pending_scopes'
+_COMMITTED_SCOPES_KEY = 'data_version_committed_scopes'
+
+_listeners_lock = threading.Lock()
+_listeners_registered = False
+
+# Callables invoked with the set of committed scopes after a successful commit.
+_commit_callbacks = []
+
+
+def _scopes_for(objects):
+    scopes = set()
+    for obj in objects:
+        scopes.update(TRACKED_MODELS.get(type(obj), ()))
+    return scopes
+
+
+def mark_changed(db_session: Session, *scopes):
+    """
+    Flags scopes as changed in the current transaction. Needed for writes that
+    bypass the ORM unit of work (Core inserts, TRUNCATE, raw SQL), which the
+    flush listener cannot see.
+    """
+    db_session.info.setdefault(_PENDING_SCOPES_KEY, set()).update(scopes)
+
+
+def on_commit(callback):
+    """
+    Registers callback(scopes) to run after any commit that bumped a scope, so
+    the committing worker can drop its own caches without waiting for the next
+    version check.
+    """
+    if callback not in _commit_callbacks:
+        _commit_callbacks.append(callback)
+
+
+def get_version(db_session: Session, scope: str = CATALOG):
+    """Returns the committed version of a scope (0 if it was never bumped)."""
+    table = DataVersion.__table__
+    version = db_session.execute(select(table.c.version).where(table.c.name == scope)).scalar()
+    return version or 0
+
+
+def _bump(db_session: Session, scope: str):
+    table = DataVersion.__table__
+    result = db_session.execute(
+        update(table).where(table.c.name == scope).values(version=table.c.version + 1, updated_at=func.now())
+    )
+    if result.rowcount == 0:
+        db_session.execute(insert(table).values(name=scope, version=1))
+
+
+# --- Session event listeners ---
+
+def _after_flush(session, flush_context):
+    # new/dirty/deleted still reflect the pre-flush state at this point.
+    scopes = _scopes_for(session.new) | _scopes_for(session.dirty) | _scopes_for(session.deleted)
+    if scopes:
+        mark_changed(session, *scopes)
+
+
+def _before_commit(session):
+    # Objects still pending here are flushed after this hook, so include them too.
+    scopes = session.info.pop(_PENDING_SCOPES_KEY, set())
+    scopes |= _scopes_for(session.new) | _scopes_for(session.dirty) | _scopes_for(session.deleted)
+    for scope in sorted(scopes):
+        _bump(session, scope)
+    if scopes:
+        session.info[_COMMITTED_SCOPES_KEY] = scopes
+
+
+def _after_commit(session):
+    scopes = session.info.pop(_COMMITTED_SCOPES_KEY, None)
+    session.info.pop(_PENDING_SCOPES_KEY, None)
+    if not scopes:
+        return
+    for callback in list(_commit_callbacks):
+        try:
+            callback(scopes)
+        except Exception as e:
+            print(f"Error in data version commit callback {callback!r}: {e}")
+
+
+def _after_rollback(session):
+    session.info.pop(_COMMITTED_SCOPES_KEY, None)
+    session.info.pop(_PENDING_SCOPES_KEY, None)
+
+
+def register_listeners():
+    """Attaches the version tracking hooks to every SQLAlchemy Session (idempotent)."""
+    global _listeners_registered
+    with _listeners_lock:
+        if _listeners_registered:
+            return
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'before_commit', _before_commit)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+        _listeners_registered = True
@@ -0,0 +1,402 @@
+# backend/services/delta_service.py
+# Delta (incremental) exports. Rows are exchanged by natural keys (area names,
+# BI_IDs) because database ids differ between instances; deletions travel as
+# tombstones recorded in deleted_records.
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, select, func, text
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm.attributes import get_history
+
+from ..models import (
+    Area, ProcessStep, UseCase, DeletedRecord,
+    UsecaseAreaRelevance, UsecaseStepRelevance, UsecaseUsecaseRelevance,
+    ProcessStepProcessStepRelevance
+)
+
+# Key under "data" that carries the tombstones in a delta export.
+DELETED_RECORDS_KEY = 'deleted_records'
+
+# Tables that take part in delta exports, in dependency (import) order.
+DELTA_MODELS = {
+    'areas': Area,
+    'process_steps': ProcessStep,
+    'use_cases': UseCase,
+    'usecase_area_relevance': UsecaseAreaRelevance,
+    'usecase_step_relevance': UsecaseStepRelevance,
+    'usecase_usecase_relevance': UsecaseUsecaseRelevance,
+    'process_step_process_step_relevance': ProcessStepProcessStepRelevance,
+}
+
+# Foreign key column -> (parent model, parent natural key column, field name in the delta).
+FOREIGN_KEYS = {
+    'process_steps': {'area_id': (Area, 'name', 'area_name')},
+    'use_cases': {'process_step_id': (ProcessStep, 'bi_id', 'process_step_bi_id')},
+    'usecase_area_relevance': {
+        'source_usecase_id': (UseCase, 'bi_id', 'source_usecase_bi_id'),
+        'target_area_id': (Area, 'name', 'target_area_name'),
+    },
+    'usecase_step_relevance': {
+        'source_usecase_id': (UseCase, 'bi_id', 'source_usecase_bi_id'),
+        'target_process_step_id': (ProcessStep, 'bi_id', 'target_process_step_bi_id'),
+    },
+    'usecase_usecase_relevance': {
+        'source_usecase_id': (UseCase, 'bi_id', 'source_usecase_bi_id'),
+        'target_usecase_id': (UseCase, 'bi_id', 'target_usecase_bi_id'),
+    },
+    'process_step_process_step_relevance': {
+        'source_process_step_id': (ProcessStep, 'bi_id', 'source_process_step_bi_id'),
+        'target_process_step_id': (ProcessStep, 'bi_id', 'target_process_step_bi_id'),
+    },
+}
+
+# Own columns that identify a row across instances; relevance rows are identified
+# by their two foreign keys (in their natural-key form).
+KEY_COLUMNS = {
+    'areas': ('name',),
+    'process_steps': ('bi_id',),
+    'use_cases': ('bi_id',),
+}
+
+# now() and updated_at defaults are transaction start times: a writer that began
+# before an export but commits after it stamps rows below that export's watermark.
+# The watermark is moved back by this much (and past any open transaction on
+# PostgreSQL); rows seen twice are harmless because apply_delta upserts by key.
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+# Columns never copied by a delta import; the target stamps its own timestamps.
+_SKIPPED_ON_APPLY = {'id', 'created_at', 'updated_at'}
+
+_TABLE_FOR_MODEL = {model: table for table, model in DELTA_MODELS.items()}
+
+_listeners_lock = threading.Lock()
+_listeners_registered = False
+
+
+def parse_watermark(value):
+    """Parses an ISO 8601 'since' watermark; naive values are taken as UTC."""
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f"Invalid 'since' watermark '{value}'. Use an ISO 8601 timestamp.")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def format_watermark(value):
+    """UTC ISO 8601 with a 'Z' suffix, so it survives unescaped in a query string."""
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _oldest_open_transaction(session: Session):
+    """Start time of the oldest other open transaction on PostgreSQL, else None."""
+    if session.get_bind().dialect.name != 'postgresql':
+        return None
+    started = session.execute(text(
+        "SELECT min(xact_start) FROM pg_stat_activity "
+        "WHERE datname = current_database() AND pid <> pg_backend_pid()"
+    )).scalar()
+    return parse_watermark(started) if started is not None else None
+
+
+def current_watermark(session: Session):
+    """
+    Database time to use as the next 'since' (avoids app/DB clock skew), less
+    WATERMARK_OVERLAP and never later than the oldest open transaction, so
+    rows committed after the export by older transactions reach the next delta.
+    """
+    now = session.execute(select(func.now())).scalar()
+    watermark = (parse_watermark(now) if now is not None else datetime.now(timezone.utc)) - WATERMARK_OVERLAP
+    oldest = _oldest_open_transaction(session)
+    return min(watermark, oldest) if oldest is not None else watermark
+
+
+# --- Natural keys ---
+
+def _key_fields(table):
+    fks = FOREIGN_KEYS.get(table, {})
+    if table in KEY_COLUMNS:
+        return KEY_COLUMNS[table]
+    return tuple(field for _, _, field in fks.values())
+
+
+def _parent_key_value(session, parent_model, parent_key_column, parent_id):
+    if parent_id is None:
+        return None
+    parent = session.get(parent_model, parent_id)
+    return getattr(parent, parent_key_column) if parent is not None else None
+
+
+def _natural_key(session, table, obj, fk_overrides=None):
+    """Natural key dict for obj; fk_overrides replaces FK ids (e.g. pre-update values)."""
+    if table in KEY_COLUMNS:
+        return {column: getattr(obj, column) for column in KEY_COLUMNS[table]}
+    key = {}
+    for fk_column, (parent_model, parent_key_column, field) in FOREIGN_KEYS[table].items():
+        parent_id = (fk_overrides or {}).get(fk_column, getattr(obj, fk_column))
+        key[field] = _parent_key_value(session, parent_model, parent_key_column, parent_id)
+    return key
+
+
+def _encode_key(key):
+    return json.dumps(key, sort_keys=True)
+
+
+# --- Tombstone recording ---
+
+def _parent_deleted(session, table, obj):
+    """True if a parent row goes in the same flush; its own tombstone covers this row."""
+    for fk_column, (parent_model, _, _) in FOREIGN_KEYS.get(table, {}).items():
+        parent_id = getattr(obj, fk_column)
+        parent = session.get(parent_model, parent_id) if parent_id is not None else None
+        if parent is not None and parent in session.deleted:
+            return True
+    return False
+
+
+def _before_flush(session, flush_context, instances):
+    tombstones = []
+
+    for obj in list(session.deleted):
+        table = _TABLE_FOR_MODEL.get(type(obj))
+        if table is None or _parent_deleted(session, table, obj):
+            continue
+        tombstones.append(DeletedRecord(table_name=table, natural_key=_encode_key(_natural_key(session, table, obj))))
+
+    for obj in list(session.dirty):
+        table = _TABLE_FOR_MODEL.get(type(obj))
+        if table is None:
+            continue
+        if table in KEY_COLUMNS:
+            # A changed name/BI_ID is a rename on the other side, not a delete + insert.
+            old_key, new_key = {}, {}
+            for column in KEY_COLUMNS[table]:
+                history = get_history(obj, column)
+                old_key[column] = history.deleted[0] if history.deleted else getattr(obj, column)
+                new_key[column] = getattr(obj, column)
+            if old_key != new_key:
+                tombstones.append(DeletedRecord(
+                    table_name=table, natural_key=_encode_key(old_key), replaced_by=_encode_key(new_key)
+                ))
+        else:
+            # A relevance link pointed at new rows: the old link is gone, the new one is exported as a change.
+            old_ids = {}
+            for fk_column in FOREIGN_KEYS[table]:
+                history = get_history(obj, fk_column)
+                if history.deleted and history.deleted[0] != getattr(obj, fk_column):
+                    old_ids[fk_column] = history.deleted[0]
+            if old_ids:
+                old_key = _natural_key(session, table, obj, fk_overrides=old_ids)
+                tombstones.append(DeletedRecord(table_name=table, natural_key=_encode_key(old_key)))
+
+    if tombstones:
+        session.add_all(tombstones)
+
+
+def record_bulk_deletion(session: Session, table, *criteria):
+    """
+    Adds tombstones for the rows of a delta table that a bulk delete
+    (Query.delete(), which skips the before_flush hook) is about to remove;
+    criteria are that delete's filters. Call it before the delete, in the
+    same transaction. Returns the number of tombstones.
+    """
+    stmt = _keyed_select(table, _key_columns(table)).where(*criteria)
+    tombstones = [
+        DeletedRecord(table_name=table, natural_key=_encode_key(dict(row._mapping)))
+        for row in session.execute(stmt)
+    ]
+    session.add_all(tombstones)
+    return len(tombstones)
+
+
+def register_listeners():
+    """Attaches the tombstone hook to every SQLAlchemy Session (idempotent)."""
+    global _listeners_registered
+    with _listeners_lock:
+        if _listeners_registered:
+            return
+        event.listen(Session, 'before_flush', _before_flush)
+        _listeners_registered = True
+
+
+# --- Delta export ---
+
+def _key_columns(table):
+    """Own columns that make up the natural key of table's rows."""
+    return KEY_COLUMNS.get(table) or tuple(FOREIGN_KEYS[table])
+
+
+def _keyed_select(table, columns):
+    """Select of columns of table, with FK ids swapped for natural keys."""
+    model = DELTA_MODELS[table]
+    fks = FOREIGN_KEYS.get(table, {})
+    selected = []
+    joins = []
+    for column in columns:
+        if column == 'id':
+            continue
+        if column in fks:
+            parent_model, parent_key_column, field = fks[column]
+            parent = aliased(parent_model)
+            selected.append(getattr(parent, parent_key_column).label(field))
+            joins.append((parent, getattr(model, column) == parent.id))
+        else:
+            selected.append(getattr(model, column).label(column))
+
+    stmt = select(*selected).select_from(model)
+    for parent, on_clause in joins:
+        stmt = stmt.outerjoin(parent, on_clause)
+    return stmt
+
+
+def _delta_select(table, columns, since):
+    """Select of the changed rows of table, with FK ids swapped for natural keys."""
+    model = DELTA_MODELS[table]
+    return _keyed_select(table, columns).where(model.updated_at >= since).order_by(model.id)
+
+
+def iter_delta_tables(session: Session, since, export_tables, yield_per=1000):
+    """
+    Yields (table key, record iterator) for every delta table, followed by the
+    tombstones under DELETED_RECORDS_KEY. export_tables is the exporter's
+    (key, model, columns) list so full and delta exports carry the same fields.
+    """
+    for key, _, columns in export_tables:
+        if key not in DELTA_MODELS:
+            continue
+        stmt = _delta_select(key, columns, since).execution_options(yield_per=yield_per)
+        yield key, (dict(row._mapping) for row in session.execute(stmt))
+
+    tombstones = (
+        select(DeletedRecord.table_name, DeletedRecord.natural_key, DeletedRecord.replaced_by, DeletedRecord.deleted_at)
+        .where(DeletedRecord.deleted_at >= since)
+        .order_by(DeletedRecord.deleted_at, DeletedRecord.id)
+        .execution_options(yield_per=yield_per)
+    )
+    yield DELETED_RECORDS_KEY, (
+        {
+            "table": row.table_name,
+            "natural_key": json.loads(row.natural_key),
+            "replaced_by": json.loads(row.replaced_by) if row.replaced_by else None,
+            "deleted_at": row.deleted_at,
+        }
+        for row in session.execute(tombstones)
+    )
+
+
+# --- Delta import ---
+
+class _KeyResolver:
+    """Resolves natural keys to local ids, caching lookups for one import."""
+
+    def __init__(self, session):
+        self.session = session
+        self._ids = {}
+
+    def parent_id(self, parent_model, parent_key_column, value):
+        if value is None:
+            return None
+        cache_key = (parent_model, value)
+        if cache_key not in self._ids:
+            parent_id = self.session.execute(
+                select(parent_model.id).where(getattr(parent_model, parent_key_column) == value)
+            ).scalar()
+            if parent_id is None:
+                return None  # Not cached: the parent may still be created by this delta.
+            self._ids[cache_key] = parent_id
+        return self._ids[cache_key]
+
+    def forget(self, parent_model, value):
+        self._ids.pop((parent_model, value), None)
+
+    def find(self, table, key):
+        """Returns the local row for a natural key, or None (also when a parent is missing)."""
+        model = DELTA_MODELS[table]
+        query = self.session.query(model)
+        if table in KEY_COLUMNS:
+            for column in KEY_COLUMNS[table]:
+                query = query.filter(getattr(model, column) == key.get(column))
+            return query.first()
+        for fk_column, (parent_model, parent_key_column, field) in FOREIGN_KEYS[table].items():
+            parent_id = self.parent_id(parent_model, parent_key_column, key.get(field))
+            if parent_id is None:
+                return None
+            query = query.filter(getattr(model, fk_column) == parent_id)
+        return query.first()
+
+
+def apply_delta(session: Session, data):
+    """
+    Applies a delta export's "data" to the database in the given session:
+    renames and deletions from the tombstones first, then upserts of changed
+    rows in dependency order. Returns (counts dict, list of skip messages).
+    The caller commits.
+    """
+    resolver = _KeyResolver(session)
+    counts = {'renamed': 0, 'deleted': 0, 'created': 0, 'updated': 0, 'skipped': 0}
+    skipped = []
+
+    for tombstone in data.get(DELETED_RECORDS_KEY, []):
+        table = tombstone.get('table')
+        if table not in DELTA_MODELS:
+            continue
+        row = resolver.find(table, tombstone.get('natural_key') or {})
+        if row is None:
+            continue
+        replaced_by = tombstone.get('replaced_by')
+        if replaced_by:
+            if resolver.find(table, replaced_by) is not None:
+                continue  # The new key already exists here; the upsert below updates it.
+            for column, value in replaced_by.items():
+                setattr(row, column, value)
+            for old_value in tombstone['natural_key'].values():
+                resolver.forget(DELTA_MODELS[table], old_value)
+            counts['renamed'] += 1
+        else:
+            session.delete(row)
+            counts['deleted'] += 1
+        session.flush()
+
+    for table, model in DELTA_MODELS.items():
+        fks = FOREIGN_KEYS.get(table, {})
+        key_fields = _key_fields(table)
+        for record in data.get(table, []):
+            key = {field: record.get(field) for field in key_fields}
+            values = {}
+            missing_parent = None
+            for field, value in record.items():
+                if field in _SKIPPED_ON_APPLY or field in KEY_COLUMNS.get(table, ()):
+                    continue
+                fk = next(((column, spec) for column, spec in fks.items() if spec[2] == field), None)
+                if fk is None:
+                    values[field] = value
+                    continue
+                fk_column, (parent_model, parent_key_column, _) = fk
+                parent_id = resolver.parent_id(parent_model, parent_key_column, value)
+                if parent_id is None:
+                    missing_parent = f"{field}='{value}'"
+                    break
+                values[fk_column] = parent_id
+            if missing_parent:
+                counts['skipped'] += 1
+                skipped.append(f"{table} {key}: unknown {missing_parent}")
+                continue
+
+            row = resolver.find(table, key)
+            if row is None:
+                row = model(**{**{column: key[column] for column in KEY_COLUMNS.get(table, ())}, **values})
+                session.add(row)
+                counts['created'] += 1
+            else:
+                for column, value in values.items():
+                    setattr(row, column, value)
+                counts['updated'] += 1
+        session.flush()
+
+    return counts, skipped
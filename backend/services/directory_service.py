@@ -0,0 +1,158 @@
+# backend/services/directory_service.py
+import threading
+from collections import namedtuple
+
+from flask import g, has_app_context, has_request_context, request
+from sqlalchemy.orm import Session
+
+from ..models import Area, ProcessStep, UseCase
+from ..utils import serialize_for_js
+from . import data_version_service
+
+
+# Lightweight (id, name, bi_id, parent_id) entries. The aliases keep them usable
+# wherever templates or serialize_for_js expect the ORM attribute names.
+class AreaEntry(namedtuple('AreaEntry', ['id', 'name', 'bi_id', 'parent_id'])):
+    __slots__ = ()
+
+
+class StepEntry(namedtuple('StepEntry', ['id', 'name', 'bi_id', 'parent_id'])):
+    __slots__ = ()
+
+    @property
+    def area_id(self):
+        return self.parent_id
+
+
+class UsecaseEntry(namedtuple('UsecaseEntry', ['id', 'name', 'bi_id', 'parent_id'])):
+    __slots__ = ()
+
+    @property
+    def process_step_id(self):
+        return self.parent_id
+
+
+class EntityDirectory:
+    """
+    Immutable, name-sorted view of all areas, process steps and use cases
+    for one catalog version. Shared by every request in a worker.
+    """
+
+    def __init__(self, version, areas, steps, usecases):
+        self.version = version
+        self.areas = areas
+        self.steps = steps
+        self.usecases = usecases
+        self.areas_by_id = {a.id: a for a in areas}
+        self.steps_by_id = {s.id: s for s in steps}
+        self.usecases_by_id = {uc.id: uc for uc in usecases}
+
+        self._steps_by_area = {}
+        for step in steps:
+            self._steps_by_area.setdefault(step.parent_id, []).append(step)
+        self._usecases_by_step = {}
+        for uc in usecases:
+            self._usecases_by_step.setdefault(uc.parent_id, []).append(uc)
+        # Serialized breadcrumb lists, keyed by the URL prefix they were built under.
+        self._breadcrumb_cache = {}
+
+    def steps_in_area(self, area_id):
+        return self._steps_by_area.get(area_id, [])
+
+    def usecases_in_step(self, step_id):
+        return self._usecases_by_step.get(step_id, [])
+
+    def area_name(self, area_id, default='N/A'):
+        area = self.areas_by_id.get(area_id)
+        return area.name if area else default
+
+    def step_name(self, step_id, default='N/A'):
+        step = self.steps_by_id.get(step_id)
+        return step.name if step else default
+
+    def area_id_for_step(self, step_id):
+        step = self.steps_by_id.get(step_id)
+        return step.parent_id if step else None
+
+    def area_id_for_usecase(self, usecase_id):
+        uc = self.usecases_by_id.get(usecase_id)
+        return self.area_id_for_step(uc.parent_id) if uc else None
+
+
+# Per-worker directory, replaced whenever the catalog version moves on.
+_directory = None
+_directory_lock = threading.Lock()
+_G_KEY = '_entity_directory'
+
+
+def _load_directory(db_session: Session, version):
+    areas = [
+        AreaEntry(row.id, row.name or '', None, None)
+        for row in db_session.query(Area.id, Area.name).order_by(Area.name, Area.id)
+    ]
+    steps = [
+        StepEntry(row.id, row.name or '', row.bi_id, row.area_id)
+        for row in db_session.query(ProcessStep.id, ProcessStep.name, ProcessStep.bi_id, ProcessStep.area_id)
+        .order_by(ProcessStep.name, ProcessStep.id)
+    ]
+    usecases = [
+        UsecaseEntry(row.id, row.name or '', row.bi_id, row.process_step_id)
+        for row in db_session.query(UseCase.id, UseCase.name, UseCase.bi_id, UseCase.process_step_id)
+        .order_by(UseCase.name, UseCase.id)
+    ]
+    return EntityDirectory(version, areas, steps, usecases)
+
+
+def get_directory(db_session: Session):
+    """
+    Returns the EntityDirectory for the current catalog version. Costs one
+    primary-key lookup per request; the three listing queries only run after
+    the catalog has changed.
+    """
+    global _directory
+    if has_app_context() and _G_KEY in g:
+        return g.get(_G_KEY)
+
+    version = data_version_service.get_version(db_session, data_version_service.CATALOG)
+    directory = _directory
+    if directory is None or directory.version != version:
+        with _directory_lock:
+            directory = _directory
+            if directory is None or directory.version != version:
+                directory = _load_directory(db_session, version)
+                _directory = directory
+
+    if has_app_context():
+        setattr(g, _G_KEY, directory)
+    return directory
+
+
+def get_breadcrumb_data(db_session: Session):
+    """
+    The all_*_flat lists most templates receive for the breadcrumb/navigation.
+    Built once per directory version; callers must treat them as read-only.
+    """
+    directory = get_directory(db_session)
+    cache_key = request.script_root if has_request_context() else ''
+    breadcrumb_data = directory._breadcrumb_cache.get(cache_key)
+    if breadcrumb_data is None:
+        breadcrumb_data = {
+            'all_areas_flat': serialize_for_js(directory.areas, 'area'),
+            'all_steps_flat': serialize_for_js(directory.steps, 'step'),
+            'all_usecases_flat': serialize_for_js(directory.usecases, 'usecase'),
+        }
+        directory._breadcrumb_cache[cache_key] = breadcrumb_data
+    return dict(breadcrumb_data)
+
+
+def _on_catalog_commit(scopes):
+    # The committing worker drops its copy right away; other workers notice
+    # the bumped version on their next lookup.
+    global _directory
+    if data_version_service.CATALOG in scopes:
+        _directory = None
+        if has_app_context():
+            g.pop(_G_KEY, None)
+
+
+data_version_service.on_commit(_on_catalog_commit)
@@ -0,0 +1,78 @@
+# backend/services/draft_service.py
+import json
+import secrets
+import zlib
+from datetime import date, datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy.orm import Session
+
+from ..models import Draft
+
+# zlib level: previews are mostly repeated keys and text, level 6 is plenty.
+COMPRESSION_LEVEL = 6
+
+
+def _json_default(value):
+    # Preview rows carry db_item columns; the templates only ever render them as JSON strings.
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encode(data):
+    return zlib.compress(json.dumps(data, default=_json_default).encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def _decode(payload):
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value):
+    # SQLite hands back naive datetimes even for timezone-aware columns.
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def purge_expired_drafts(db_session: Session):
+    """Deletes every draft past its expiry. Returns the number of rows removed."""
+    removed = db_session.query(Draft).filter(Draft.expires_at < _utcnow()).delete(synchronize_session=False)
+    db_session.commit()
+    return removed
+
+
+def save_draft(db_session: Session, user_id, kind, data, ttl_seconds=None):
+    """
+    Stores data (anything JSON serializable) compressed and returns the opaque
+    token to keep in the Flask session. Expired drafts are purged on the way.
+    """
+    ttl_seconds = ttl_seconds or current_app.config.get('DRAFT_TTL_SECONDS', 3600 * 4)
+    purge_expired_drafts(db_session)
+    token = secrets.token_urlsafe(32)
+    db_session.add(Draft(
+        token=token,
+        user_id=user_id,
+        kind=kind,
+        payload=_encode(data),
+        expires_at=_utcnow() + timedelta(seconds=ttl_seconds)
+    ))
+    db_session.commit()
+    return token
+
+
+def load_draft(db_session: Session, token, user_id, kind):
+    """Returns the stored data, or None if the token is unknown, expired or belongs to another user/flow."""
+    draft = db_session.get(Draft, token)
+    if draft is None or draft.user_id != user_id or draft.kind != kind:
+        return None
+    if _as_utc(draft.expires_at) < _utcnow():
+        return None
+    return _decode(draft.payload)
+
+
+def discard_draft(db_session: Session, token):
+    db_session.query(Draft).filter_by(token=token).delete(synchronize_session=False)
+    db_session.commit()
@@ -0,0 +1,357 @@
+# backend/services/enrichment_service.py
+import json
+import os
+import threading
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, joinedload
+from werkzeug.utils import secure_filename
+
+from ..db import SessionLocal
+from ..models import ProcessStep, UseCase
+from ..utils import FILE_LOCKS_SUPPORTED, file_lock
+from . import llm_cache_service, llm_service
+
+# Columns an enrichment run may fill.
+ENRICHABLE_FIELDS = ('summary', 'llm_comment_1', 'llm_comment_2', 'llm_comment_3', 'llm_comment_4', 'llm_comment_5')
+
+ENTITY_TYPES = {
+    'process_step': ProcessStep,
+    'use_case': UseCase,
+}
+ENTITY_LABELS = {
+    'process_step': 'process step',
+    'use_case': 'use case',
+}
+
+# (label, attribute) pairs that make up the {fields} placeholder of the prompt.
+STEP_CONTEXT_FIELDS = [
+    ("Step Name", "name"),
+    ("Step BI_ID", "bi_id"),
+    ("Step Description", "step_description"),
+    ("Vision Statement", "vision_statement"),
+    ("What is Actually Done", "what_is_actually_done"),
+    ("Pain Points", "pain_points"),
+    ("In Scope", "in_scope"),
+    ("Out of Scope", "out_of_scope"),
+    ("Interfaces", "interfaces_text"),
+    ("Targets", "targets_text"),
+    ("Raw Content", "raw_content"),
+]
+USECASE_CONTEXT_FIELDS = [
+    ("Use Case Name", "name"),
+    ("Use Case BI_ID", "bi_id"),
+    ("Wave", "wave"),
+    ("Status", "status"),
+    ("Summary", "summary"),
+    ("Business Problem Solved", "business_problem_solved"),
+    ("Target Solution", "target_solution_description"),
+    ("Technologies", "technologies_text"),
+    ("Requirements", "requirements"),
+    ("Inspiration", "inspiration"),
+    ("Raw Content", "raw_content"),
+]
+
+# Placeholders a prompt template may use; the step summary prompt's names work too.
+PROMPT_PLACEHOLDERS = ('name', 'bi_id', 'area_name', 'area_description', 'fields',
+                       'process_step_fields', 'use_case_fields', 'process_step_name')
+
+CHECKPOINT_FILENAME = 'enrichment_checkpoint.jsonl'
+
+EnrichmentTask = namedtuple('EnrichmentTask', ['entity_id', 'label', 'system_prompt'])
+
+# Per process; the slots they hand out are shared through RATE_LIMIT_DIR.
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Spaces calls at least 60 / requests_per_minute seconds apart (0 = no limit).
+    With a state_path the next free slot lives in that file under a file lock,
+    so every web worker and pool process draws on the same budget; without
+    one (or where file locks are not supported) the spacing only holds across threads.
+    """
+
+    def __init__(self, requests_per_minute, state_path=None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self.state_path = state_path
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def _read_next_slot(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                return float(f.read() or 0)
+        except (OSError, ValueError):
+            return 0.0
+
+    def _claim_slot(self, now):
+        with self._lock:
+            if self.state_path is None or not FILE_LOCKS_SUPPORTED:
+                slot = max(now, self._next_slot)
+                self._next_slot = slot + self.interval
+                return slot
+            with file_lock(self.state_path + '.lock'):
+                slot = max(now, self._read_next_slot())
+                with open(self.state_path, 'w', encoding='utf-8') as f:
+                    f.write(repr(slot + self.interval))
+            return slot
+
+    def wait(self):
+        if not self.interval:
+            return
+        # Wall clock: the slots are compared across processes.
+        now = time.time()
+        slot = self._claim_slot(now)
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def parse_provider_limits(value):
+    """'openai:500,anthropic:50' -> {'openai': 500, 'anthropic': 50}."""
+    limits = {}
+    for item in (value or '').split(','):
+        provider, _, rpm = item.partition(':')
+        if provider.strip() and rpm.strip():
+            limits[provider.strip().lower()] = int(rpm)
+    return limits
+
+
+def get_rate_limiter(provider):
+    """The process's limiter for provider, sharing its ENRICHMENT_RATE_LIMITS budget with all other processes."""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(provider)
+        if limiter is None:
+            limits = parse_provider_limits(current_app.config.get('ENRICHMENT_RATE_LIMITS'))
+            directory = current_app.config.get('RATE_LIMIT_DIR') or os.path.join(current_app.instance_path, 'rate_limits')
+            os.makedirs(directory, exist_ok=True)
+            state_path = os.path.join(directory, secure_filename(provider) or 'provider')
+            limiter = _rate_limiters[provider] = RateLimiter(limits.get(provider, 0), state_path)
+        return limiter
+
+
+def build_params(data, user_id):
+    """
+    Validates an enrichment request (JSON body of /llm/enrich) and returns
+    the job params. Raises ValueError with a user-facing message.
+    """
+    entity_type = data.get('entity_type')
+    target_field = data.get('target_field')
+    model_name = data.get('model')
+    prompt = data.get('prompt')
+    if entity_type not in ENTITY_TYPES:
+        raise ValueError(f"entity_type must be one of: {', '.join(ENTITY_TYPES)}.")
+    if target_field not in ENRICHABLE_FIELDS:
+        raise ValueError(f"target_field must be one of: {', '.join(ENRICHABLE_FIELDS)}.")
+    if not model_name or '-' not in model_name:
+        raise ValueError("A model is required.")
+    if not prompt or not prompt.strip():
+        raise ValueError("A prompt template is required.")
+    try:
+        prompt.format(**{placeholder: '' for placeholder in PROMPT_PLACEHOLDERS})
+    except KeyError as e:
+        raise ValueError(
+            f"Unknown placeholder {{{e.args[0]}}} in the prompt. Available: "
+            + ", ".join(f"{{{p}}}" for p in PROMPT_PLACEHOLDERS)
+        ) from e
+    except (IndexError, ValueError) as e:
+        raise ValueError(f"Invalid prompt template: {e}") from e
+
+    try:
+        ids = [int(entity_id) for entity_id in data.get('ids') or []]
+        area_id = int(data['area_id']) if data.get('area_id') not in (None, '') else None
+    except (TypeError, ValueError) as e:
+        raise ValueError("ids and area_id must be integers.") from e
+
+    return {
+        "entity_type": entity_type,
+        "target_field": target_field,
+        "model": model_name,
+        "prompt": prompt,
+        "ids": ids,
+        "area_id": area_id,
+        "wave": data.get('wave') or None,
+        "overwrite": bool(data.get('overwrite', False)),
+        "use_cache": llm_cache_service.use_cache_requested(data.get('use_cache', True)),
+        "user_id": user_id,
+    }
+
+
+def _select_entities(db_session: Session, params):
+    model = ENTITY_TYPES[params['entity_type']]
+    field = getattr(model, params['target_field'])
+    if model is ProcessStep:
+        query = db_session.query(ProcessStep).options(joinedload(ProcessStep.area))
+        if params.get('area_id'):
+            query = query.filter(ProcessStep.area_id == params['area_id'])
+        if params.get('wave'):
+            query = query.filter(ProcessStep.use_cases.any(UseCase.wave == params['wave']))
+    else:
+        query = db_session.query(UseCase).join(UseCase.process_step) \
+            .options(joinedload(UseCase.process_step).joinedload(ProcessStep.area))
+        if params.get('area_id'):
+            query = query.filter(ProcessStep.area_id == params['area_id'])
+        if params.get('wave'):
+            query = query.filter(UseCase.wave == params['wave'])
+    if params.get('ids'):
+        query = query.filter(model.id.in_(params['ids']))
+    if not params.get('overwrite'):
+        query = query.filter(or_(field.is_(None), field == ''))
+    return query.order_by(model.id).all()
+
+
+def _context_text(entity, context_fields):
+    return "\n".join(
+        f"- {label}: {getattr(entity, attr)}" for label, attr in context_fields if getattr(entity, attr)
+    )
+
+
+def _render_prompt(entity, entity_type, template):
+    if entity_type == 'process_step':
+        area = entity.area
+        fields = _context_text(entity, STEP_CONTEXT_FIELDS)
+        step_name = entity.name
+    else:
+        area = entity.process_step.area if entity.process_step else None
+        fields = _context_text(entity, USECASE_CONTEXT_FIELDS)
+        step_name = entity.process_step.name if entity.process_step else "N/A"
+    return template.format(
+        name=entity.name,
+        bi_id=entity.bi_id,
+        area_name=area.name if area else "N/A",
+        area_description=(area.description if area else None) or "N/A",
+        fields=fields,
+        process_step_fields=fields,
+        use_case_fields=fields,
+        process_step_name=step_name,
+    )
+
+
+def read_checkpoint(path):
+    """Ids already enriched by a previous run of the same job."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                done.add(json.loads(line))
+    return done
+
+
+def generate_with_retries(app, user_id, limiter, model_name, system_prompt, user_message, max_retries, use_cache):
+    """generate_chat_response with user_id's credentials, behind limiter, retried with backoff."""
+    # Runs in an executor thread, which needs its own app context.
+    with app.app_context():
+        llm_service.use_credentials_of(user_id)
+        result = None
+        for attempt in range(max_retries + 1):
+            if attempt:
+                time.sleep(2 ** attempt)
+            limiter.wait()
+            try:
+                result = llm_service.generate_chat_response(
+                    model_name=model_name,
+                    user_message=user_message,
+                    system_prompt=system_prompt,
+                    image_base64=None,
+                    image_mime_type=None,
+                    chat_history=[],
+                    use_cache=use_cache
+                )
+            except Exception as e:
+                traceback.print_exc()
+                result = {"success": False, "message": str(e)}
+            if result.get('success'):
+                return result
+        return result
+
+
+def run_enrichment(params, checkpoint_path, progress):
+    """
+    Fills params['target_field'] of the selected steps or use cases with LLM
+    output. Calls run on ENRICHMENT_CONCURRENCY threads behind the provider's
+    rate limiter; each result is committed as soon as it arrives and its id
+    appended to the checkpoint file, so a resumed run skips finished entities.
+    """
+    app = current_app._get_current_object()
+    entity_type = params['entity_type']
+    target_field = params['target_field']
+    model_name = params['model']
+    provider = model_name.split('-', 1)[0].lower()
+    model = ENTITY_TYPES[entity_type]
+    done_ids = read_checkpoint(checkpoint_path)
+    user_message = (
+        f"Based on the provided context in the system prompt, please generate the content for the "
+        f"'{target_field}' field of the {ENTITY_LABELS[entity_type]}."
+    )
+
+    session = SessionLocal.session_factory()
+    errors = []
+    updated = skipped = 0
+    try:
+        tasks = []
+        for entity in _select_entities(session, params):
+            if entity.id in done_ids:
+                skipped += 1
+                continue
+            try:
+                system_prompt = _render_prompt(entity, entity_type, params['prompt'])
+            except (KeyError, IndexError, ValueError) as e:
+                errors.append(f"{entity.bi_id}: could not render the prompt ({e}).")
+                continue
+            tasks.append(EnrichmentTask(entity.id, entity.bi_id, system_prompt))
+        session.rollback()
+        progress(0, errors=len(errors))
+
+        limiter = get_rate_limiter(provider)
+        max_retries = app.config.get('ENRICHMENT_MAX_RETRIES', 2)
+        workers = max(1, min(app.config.get('ENRICHMENT_CONCURRENCY', 8), len(tasks) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor, \
+                open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+            futures = {
+                executor.submit(generate_with_retries, app, params['user_id'], limiter, model_name,
+                                task.system_prompt, user_message, max_retries, params.get('use_cache', True)): task
+                for task in tasks
+            }
+            for future in as_completed(futures):
+                task = futures[future]
+                result = future.result()
+                text = (result.get('message') or '').strip() if result.get('success') else ''
+                if not text:
+                    errors.append(f"{task.label}: {result.get('message') or 'empty response'}")
+                else:
+                    entity = session.get(model, task.entity_id)
+                    if entity is None:
+                        errors.append(f"{task.label}: deleted while the job was running.")
+                    else:
+                        setattr(entity, target_field, text)
+                        session.commit()
+                        checkpoint.write(json.dumps(task.entity_id) + "\n")
+                        checkpoint.flush()
+                        updated += 1
+                progress(updated + len(errors), errors=len(errors))
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    message = f"Enriched '{target_field}' of {updated} {ENTITY_LABELS[entity_type]}(s) with {model_name}."
+    if skipped:
+        message += f" {skipped} already done by an earlier run."
+    if errors:
+        message += f" {len(errors)} failed; resume the job to retry them."
+    return {
+        "success": updated > 0 or not errors,
+        "message": message,
+        "updated": updated,
+        "skipped_errors_details": errors
+    }
@@ -1,9 +1,16 @@
 # backend/services/export_service.py
 import json
+import zlib
 from datetime import datetime
 import traceback
+try:
+    import zstandard
+except ImportError:  # Optional; only needed for zstd-compressed exports.
+    zstandard = None
+from sqlalchemy import select
 from sqlalchemy.orm import joinedload, selectinload
 from ..db import SessionLocal
+from . import delta_service
 from ..models import (
     User, Area, ProcessStep, UseCase,
     UsecaseAreaRelevance, UsecaseStepRelevance, UsecaseUsecaseRelevance,
@@ -15,116 +22,274 @@ def datetime_serializer(obj):
         return obj.isoformat()
     raise TypeError(f"Type {type(obj)} not serializable")
 
-def export_database_to_json_string():
-    session = SessionLocal()
+# Exported tables in import order: (key in "data", model, columns).
+EXPORT_TABLES = [
+    ("users", User, ["id", "username", "created_at"]),
+    ("areas", Area, ["id", "name", "description", "created_at", "updated_at"]),
+    ("process_steps", ProcessStep, [
+        "id", "bi_id", "name", "area_id",
+        "step_description", "raw_content",
+        "summary", "vision_statement",
+        "in_scope", "out_of_scope",
+        "interfaces_text", "what_is_actually_done",
+        "pain_points", "targets_text",
+        "created_at", "updated_at"
+    ]),
+    ("use_cases", UseCase, [
+        "id", "bi_id", "name",
+        "process_step_id", "priority",
+        "raw_content", "summary", "inspiration",
+        "wave", "effort_level", "status",
+        "business_problem_solved",
+        "target_solution_description",
+        "technologies_text", "requirements",
+        "relevants_text",
+        "reduction_time_transfer",
+        "reduction_time_launches",
+        "reduction_costs_supply",
+        "quality_improvement_quant",
+        "ideation_notes", "further_ideas",
+        "effort_quantification",
+        "potential_quantification",
+        "dependencies_text",
+        "contact_persons_text",
+        "related_projects_text",
+        "created_at", "updated_at",
+        "llm_comment_1", "llm_comment_2", "llm_comment_3", "llm_comment_4", "llm_comment_5"
+    ]),
+    ("usecase_area_relevance", UsecaseAreaRelevance, [
+        "id", "source_usecase_id",
+        "target_area_id", "relevance_score",
+        "relevance_content", "created_at", "updated_at"
+    ]),
+    ("usecase_step_relevance", UsecaseStepRelevance, [
+        "id", "source_usecase_id",
+        "target_process_step_id", "relevance_score",
+        "relevance_content", "created_at", "updated_at"
+    ]),
+    ("usecase_usecase_relevance", UsecaseUsecaseRelevance, [
+        "id", "source_usecase_id",
+        "target_usecase_id", "relevance_score",
+        "relevance_content", "created_at", "updated_at"
+    ]),
+    ("process_step_process_step_relevance", ProcessStepProcessStepRelevance, [
+        "id", "source_process_step_id",
+        "target_process_step_id", "relevance_score",
+        "relevance_content", "created_at", "updated_at"
+    ]),
+]
+
+# Rows fetched per round trip from the server-side cursor.
+EXPORT_YIELD_PER = 1000
+# Approximate size (characters) of each chunk handed to the response.
+EXPORT_CHUNK_CHARS = 64 * 1024
+
+
+# Supported layouts and compressions for the full-database export.
+EXPORT_FORMATS = ('json', 'ndjson')
+EXPORT_COMPRESSIONS = ('none', 'gzip', 'zstd')
+# Key that tags each NDJSON line with its table; the first line uses NDJSON_METADATA_TABLE.
+NDJSON_TABLE_KEY = '_table'
+NDJSON_METADATA_TABLE = '_metadata'
+
+
+def _export_metadata(session, export_format, since=None):
+    """
+    Export metadata. "watermark" is the database time at the start of the
+    export, moved back by a safety overlap; pass it as 'since' to get the
+    next delta.
+    """
+    metadata = {
+        "export_date": datetime.utcnow().isoformat(),
+        "version": "1.0",
+        "format": export_format,
+        "watermark": delta_service.format_watermark(delta_service.current_watermark(session))
+    }
+    if since is not None:
+        metadata["delta"] = True
+        metadata["since"] = delta_service.format_watermark(since)
+    return metadata
+
+
+def _export_table_keys(since=None):
+    if since is None:
+        return [key for key, _, _ in EXPORT_TABLES]
+    keys = [key for key, _, _ in EXPORT_TABLES if key in delta_service.DELTA_MODELS]
+    return keys + [delta_service.DELETED_RECORDS_KEY]
+
+
+def _iter_table_records(session, model, columns):
+    """Yields one (columns -> value) dict per row, read through a server-side cursor."""
+    stmt = (
+        select(*[getattr(model, column) for column in columns])
+        .order_by(model.id)
+        .execution_options(yield_per=EXPORT_YIELD_PER)
+    )
+    for row in session.execute(stmt):
+        yield dict(zip(columns, row))
+
+
+def _iter_export_tables(session, since=None, progress=None):
+    """
+    (table key, record iterator) pairs: every row, or only the changes since a watermark.
+    progress, if given, is called with the running row count as records are read.
+    """
+    if since is not None:
+        tables = delta_service.iter_delta_tables(session, since, EXPORT_TABLES, yield_per=EXPORT_YIELD_PER)
+    else:
+        tables = ((key, _iter_table_records(session, model, columns)) for key, model, columns in EXPORT_TABLES)
+    if progress is None:
+        yield from tables
+        return
+
+    exported_rows = 0
+
+    def counted(records):
+        nonlocal exported_rows
+        for record in records:
+            yield record
+            exported_rows += 1
+            progress(exported_rows)
+
+    for key, records in tables:
+        yield key, counted(records)
+
+
+def iter_database_export_json(since=None, progress=None):
+    """
+    Yields the database export as JSON text in chunks of roughly
+    EXPORT_CHUNK_CHARS. Each table is read with a server-side cursor
+    (yield_per), so memory use does not grow with the size of the database.
+    With since (an aware datetime) only rows changed after it plus tombstones
+    are exported (see delta_service).
+    Uses its own session; errors are logged and re-raised, which truncates the
+    output rather than producing a file that looks complete.
+    """
+    session = SessionLocal.session_factory()
     try:
-        export_data = {
-            "metadata": {
-                "export_date": datetime.utcnow().isoformat(),
-                "version": "1.0"
-            },
-            "data": {}
-        }
+        session.connection()  # Fail before the first chunk if the database is unreachable.
+        yield '{\n"metadata": ' + json.dumps(_export_metadata(session, 'json', since)) + ',\n"data": {'
 
-        users = session.query(User).all()
-        export_data["data"]["users"] = [
-            {"id": u.id, "username": u.username, "created_at": u.created_at}
-            for u in users
-        ]
-
-        areas = session.query(Area).all()
-        export_data["data"]["areas"] = [
-            {"id": a.id, "name": a.name, "description": a.description, "created_at": a.created_at}
-            for a in areas
-        ]
-
-        process_steps = session.query(ProcessStep).all()
-        export_data["data"]["process_steps"] = [
-            {
-                "id": ps.id, "bi_id": ps.bi_id, "name": ps.name, "area_id": ps.area_id,
-                "step_description": ps.step_description, "raw_content": ps.raw_content,
-                "summary": ps.summary, "vision_statement": ps.vision_statement,
-                "in_scope": ps.in_scope, "out_of_scope": ps.out_of_scope,
-                "interfaces_text": ps.interfaces_text, "what_is_actually_done": ps.what_is_actually_done,
-                "pain_points": ps.pain_points, "targets_text": ps.targets_text,
-                "created_at": ps.created_at, "updated_at": ps.updated_at
-            } for ps in process_steps
-        ]
-
-        use_cases = session.query(UseCase).all()
-        export_data["data"]["use_cases"] = [
-            {
-                "id": uc.id, "bi_id": uc.bi_id, "name": uc.name,
-                "process_step_id": uc.process_step_id, "priority": uc.priority,
-                "raw_content": uc.raw_content, "summary": uc.summary, "inspiration": uc.inspiration,
-                "wave": uc.wave, "effort_level": uc.effort_level, "status": uc.status,
-                "business_problem_solved": uc.business_problem_solved,
-                "target_solution_description": uc.target_solution_description,
-                "technologies_text": uc.technologies_text, "requirements": uc.requirements,
-                "relevants_text": uc.relevants_text,
-                "reduction_time_transfer": uc.reduction_time_transfer,
-                "reduction_time_launches": uc.reduction_time_launches,
-                "reduction_costs_supply": uc.reduction_costs_supply,
-                "quality_improvement_quant": uc.quality_improvement_quant,
-                "ideation_notes": uc.ideation_notes, "further_ideas": uc.further_ideas,
-                "effort_quantification": uc.effort_quantification,
-                "potential_quantification": uc.potential_quantification,
-                "dependencies_text": uc.dependencies_text,
-                "contact_persons_text": uc.contact_persons_text,
-                "related_projects_text": uc.related_projects_text,
-                "created_at": uc.created_at, "updated_at": uc.updated_at,
-                "llm_comment_1": uc.llm_comment_1,
-                "llm_comment_2": uc.llm_comment_2,
-                "llm_comment_3": uc.llm_comment_3,
-                "llm_comment_4": uc.llm_comment_4,
-                "llm_comment_5": uc.llm_comment_5
-            } for uc in use_cases
-        ]
-
-        uar = session.query(UsecaseAreaRelevance).all()
-        export_data["data"]["usecase_area_relevance"] = [
-            {
-                "id": r.id, "source_usecase_id": r.source_usecase_id,
-                "target_area_id": r.target_area_id, "relevance_score": r.relevance_score,
-                "relevance_content": r.relevance_content, "created_at": r.created_at, "updated_at": r.updated_at
-            } for r in uar
-        ]
-        usr = session.query(UsecaseStepRelevance).all()
-        export_data["data"]["usecase_step_relevance"] = [
-            {
-                "id": r.id, "source_usecase_id": r.source_usecase_id,
-                "target_process_step_id": r.target_process_step_id, "relevance_score": r.relevance_score,
-                "relevance_content": r.relevance_content, "created_at": r.created_at, "updated_at": r.updated_at
-            } for r in usr
-        ]
-        uur = session.query(UsecaseUsecaseRelevance).all()
-        export_data["data"]["usecase_usecase_relevance"] = [
-            {
-                "id": r.id, "source_usecase_id": r.source_usecase_id,
-                "target_usecase_id": r.target_usecase_id, "relevance_score": r.relevance_score,
-                "relevance_content": r.relevance_content, "created_at": r.created_at, "updated_at": r.updated_at
-            } for r in uur
-        ]
-
-        pspsr = session.query(ProcessStepProcessStepRelevance).all()
-        export_data["data"]["process_step_process_step_relevance"] = [
-            {
-                "id": r.id, "source_process_step_id": r.source_process_step_id,
-                "target_process_step_id": r.target_process_step_id, "relevance_score": r.relevance_score,
-                "relevance_content": r.relevance_content, "created_at": r.created_at, "updated_at": r.updated_at
-            } for r in pspsr
-        ]
-
-        return json.dumps(export_data, default=datetime_serializer, indent=2)
+        for table_index, (key, records) in enumerate(_iter_export_tables(session, since, progress)):
+            buffer = [',' if table_index else '', '\n', json.dumps(key), ': [']
+            buffered_chars = 0
+            first_row = True
+            for record in records:
+                encoded = json.dumps(record, default=datetime_serializer)
+                buffer.append('\n' + encoded if first_row else ',\n' + encoded)
+                buffered_chars += len(encoded) + 2
+                first_row = False
+                if buffered_chars >= EXPORT_CHUNK_CHARS:
+                    yield ''.join(buffer)
+                    buffer = []
+                    buffered_chars = 0
+            buffer.append('\n]' if not first_row else ']')
+            yield ''.join(buffer)
 
+        yield '\n}\n}\n'
     except Exception as e:
         print(f"Error during database export: {e}")
         traceback.print_exc()
-        return None
+        raise
     finally:
         session.close()
 
 
+def iter_database_export_ndjson(since=None, progress=None):
+    """
+    Yields the export as NDJSON: a metadata line, then one compact line per
+    record tagged with its table via NDJSON_TABLE_KEY, tables in import order.
+    Same streaming, delta and error behaviour as iter_database_export_json.
+    """
+    session = SessionLocal.session_factory()
+    try:
+        session.connection()
+        # The table list lets the importer tell an empty table from a missing one.
+        metadata = {
+            NDJSON_TABLE_KEY: NDJSON_METADATA_TABLE,
+            **_export_metadata(session, 'ndjson', since),
+            "tables": _export_table_keys(since)
+        }
+        yield json.dumps(metadata, separators=(',', ':')) + '\n'
+
+        for key, records in _iter_export_tables(session, since, progress):
+            buffer = []
+            buffered_chars = 0
+            for record in records:
+                encoded = json.dumps({NDJSON_TABLE_KEY: key, **record}, default=datetime_serializer, separators=(',', ':'))
+                buffer.append(encoded + '\n')
+                buffered_chars += len(encoded) + 1
+                if buffered_chars >= EXPORT_CHUNK_CHARS:
+                    yield ''.join(buffer)
+                    buffer = []
+                    buffered_chars = 0
+            if buffer:
+                yield ''.join(buffer)
+    except Exception as e:
+        print(f"Error during NDJSON database export: {e}")
+        traceback.print_exc()
+        raise
+    finally:
+        session.close()
+
+
+def _new_compressor(compression):
+    """Returns (compressor, block flush mode) or (None, None) for uncompressed output."""
+    if compression == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31), zlib.Z_SYNC_FLUSH  # wbits=31 writes a gzip container
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package.")
+        return zstandard.ZstdCompressor(level=3).compressobj(), zstandard.COMPRESSOBJ_FLUSH_BLOCK
+    return None, None
+
+
+def iter_database_export(export_format='ndjson', compression='gzip', since=None, progress=None):
+    """
+    Yields the export as bytes in the requested layout ('json' or 'ndjson')
+    and compression ('none', 'gzip' or 'zstd'); a since watermark makes it a
+    delta export. Every chunk is flushed through the compressor so the
+    download keeps moving instead of stalling in its buffer.
+    progress(rows) is called as rows are exported (used by background jobs).
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{export_format}'.")
+    if compression not in EXPORT_COMPRESSIONS:
+        raise ValueError(f"Unsupported export compression '{compression}'.")
+
+    compressor, block_flush = _new_compressor(compression)
+    if export_format == 'ndjson':
+        chunks = iter_database_export_ndjson(since, progress)
+    else:
+        chunks = iter_database_export_json(since, progress)
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        if compressor is None:
+            yield data
+            continue
+        yield compressor.compress(data) + compressor.flush(block_flush)
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def export_file_info(export_format, compression):
+    """Returns (file extension, mimetype) for a format/compression pair."""
+    extension = 'ndjson' if export_format == 'ndjson' else 'json'
+    if compression == 'gzip':
+        return f"{extension}.gz", "application/gzip"
+    if compression == 'zstd':
+        return f"{extension}.zst", "application/zstd"
+    return extension, ("application/x-ndjson" if export_format == 'ndjson' else "application/json")
+
+
+def export_filename(export_format, compression, since=None):
+    """Download name for an export, e.g. usecase_explorer_db_export_20240131_120000.ndjson.gz."""
+    extension, _ = export_file_info(export_format, compression)
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    kind = "delta" if since is not None else "db"
+    return f"usecase_explorer_{kind}_export_{timestamp}.{extension}"
+
+
 def format_text_for_markdown(text_content):
     if not text_content:
         return "N/A"
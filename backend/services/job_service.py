@@ -0,0 +1,413 @@
+# backend/services/job_service.py
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+from werkzeug.utils import secure_filename
+
+from ..db import SessionLocal
+from ..models import BackgroundJob
+from . import data_management_service, delta_service, enrichment_service, export_service, map_reduce_service
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED)
+
+# Minimum seconds between two progress writes of a running job.
+PROGRESS_INTERVAL_SECONDS = 1.0
+# Seconds between heartbeats (updated_at bumps) of a running job; see recover_lost_jobs.
+HEARTBEAT_INTERVAL_SECONDS = 30
+
+LOST_JOB_MESSAGE = "Worker lost; resume or re-run the job."
+
+# Upload field -> per-entity import function; each takes (file_stream, progress=None).
+ENTITY_FILE_IMPORTERS = {
+    'area_file': data_management_service.process_area_file,
+    'usecase_file': data_management_service.process_usecase_file,
+    'ps_ps_relevance_file': data_management_service.process_ps_ps_relevance_file,
+    'usecase_area_relevance_file': data_management_service.process_usecase_area_relevance_file,
+    'usecase_step_relevance_file': data_management_service.process_usecase_step_relevance_file,
+    'usecase_usecase_relevance_file': data_management_service.process_usecase_usecase_relevance_file,
+}
+
+_job_handlers = {}
+
+# Per web worker pool; created on the first enqueue (after gunicorn has forked).
+_executor = None
+_executor_lock = threading.Lock()
+
+# App used inside pool processes; see _init_worker.
+_worker_app = None
+
+
+def job_handler(job_type):
+    """Registers fn(params, artifact_dir, progress) -> result dict as the runner for job_type."""
+    def register(fn):
+        _job_handlers[job_type] = fn
+        return fn
+    return register
+
+
+class JobProgress:
+    """
+    Progress callback handed to import/export functions as progress(rows, errors=None).
+    Writes to the job row at most every PROGRESS_INTERVAL_SECONDS, in its own
+    session so the numbers are visible while the job's transaction is open.
+    Between start_heartbeat() and stop_heartbeat() it also bumps the row's
+    updated_at every HEARTBEAT_INTERVAL_SECONDS, progress or not.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.rows = 0
+        self.errors = 0
+        self._last_write = 0.0
+        self._stopped = threading.Event()
+
+    def start_heartbeat(self):
+        threading.Thread(target=self._beat, name=f"job-{self.job_id}-heartbeat", daemon=True).start()
+
+    def stop_heartbeat(self):
+        self._stopped.set()
+
+    def _beat(self):
+        while not self._stopped.wait(HEARTBEAT_INTERVAL_SECONDS):
+            _update_job(self.job_id, updated_at=func.now())
+
+    def __call__(self, rows, errors=None):
+        self.rows = rows
+        if errors is not None:
+            self.errors = errors
+        now = time.monotonic()
+        if now - self._last_write >= PROGRESS_INTERVAL_SECONDS:
+            self._last_write = now
+            _update_job(self.job_id, rows_processed=self.rows, error_count=self.errors)
+
+
+def _update_job(job_id, **fields):
+    session = SessionLocal.session_factory()
+    try:
+        session.query(BackgroundJob).filter_by(id=job_id).update(fields, synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        # Progress is best effort; never let it fail the job itself.
+        session.rollback()
+        print(f"Could not update background job {job_id}: {e}")
+    finally:
+        session.close()
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def artifact_root(app=None):
+    app = app or current_app
+    return app.config.get('JOB_ARTIFACT_DIR') or os.path.join(app.instance_path, 'job_artifacts')
+
+
+def _job_dir(job_id, app=None):
+    return os.path.join(artifact_root(app), str(job_id))
+
+
+# --- Job handlers (run inside pool processes) ---
+
+@job_handler('database_import')
+def _run_database_import(params, artifact_dir, progress):
+    with open(params['input_path'], 'rb') as f:
+        return data_management_service.import_database_from_json(
+            f, clear_existing_data=params.get('clear_existing_data', False), progress=progress
+        )
+
+
+@job_handler('entity_import')
+def _run_entity_import(params, artifact_dir, progress):
+    importer = ENTITY_FILE_IMPORTERS[params['file_key']]
+    with open(params['input_path'], 'rb') as f:
+        return importer(f, progress=progress)
+
+
+@job_handler('database_export')
+def _run_database_export(params, artifact_dir, progress):
+    export_format = params.get('format', 'ndjson')
+    compression = params.get('compression', 'gzip')
+    since = delta_service.parse_watermark(params['since']) if params.get('since') else None
+    filename = export_service.export_filename(export_format, compression, since)
+    path = os.path.join(artifact_dir, filename)
+    with open(path, 'wb') as f:
+        for chunk in export_service.iter_database_export(export_format, compression, since, progress=progress):
+            f.write(chunk)
+    return {
+        "success": True,
+        "message": f"Exported {progress.rows} rows to {filename}.",
+        "artifact_path": path,
+        "artifact_name": filename
+    }
+
+
+@job_handler('llm_enrichment')
+def _run_llm_enrichment(params, artifact_dir, progress):
+    # A resumed job keeps appending to the checkpoint of the job it resumes.
+    checkpoint_dir = _job_dir(params['resume_of'], _worker_app) if params.get('resume_of') else artifact_dir
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    checkpoint_path = os.path.join(checkpoint_dir, enrichment_service.CHECKPOINT_FILENAME)
+    return enrichment_service.run_enrichment(params, checkpoint_path, progress)
+
+
+@job_handler('llm_map_reduce')
+def _run_llm_map_reduce(params, artifact_dir, progress):
+    return map_reduce_service.run_map_reduce(params, artifact_dir, progress)
+
+
+def _init_worker():
+    # Pool processes are spawned, so they build their own app (config, engine, listeners).
+    global _worker_app
+    from ..app import create_app
+    _worker_app = create_app(init_session=False)
+
+
+def _execute_job(job_id):
+    """Entry point inside a pool process."""
+    with _worker_app.app_context():
+        session = SessionLocal.session_factory()
+        try:
+            job = session.get(BackgroundJob, job_id)
+            if job is None or job.status != JOB_QUEUED:
+                return
+            job.status = JOB_RUNNING
+            job.started_at = _utcnow()
+            session.commit()
+            job_type = job.job_type
+            params = json.loads(job.params or '{}')
+        finally:
+            session.close()
+
+        artifact_dir = _job_dir(job_id, _worker_app)
+        os.makedirs(artifact_dir, exist_ok=True)
+        progress = JobProgress(job_id)
+        progress.start_heartbeat()
+        print(f"Background job {job_id} ({job_type}) started.")
+        try:
+            outcome = _job_handlers[job_type](params, artifact_dir, progress) or {}
+        except Exception as e:
+            traceback.print_exc()
+            outcome = {"success": False, "message": f"Job failed: {e}"}
+        finally:
+            progress.stop_heartbeat()
+
+        artifact_path = outcome.pop('artifact_path', None)
+        artifact_name = outcome.pop('artifact_name', None)
+        if artifact_path is None:
+            # Imports have no output file; their result report is the artifact.
+            artifact_name = f"{job_type}_{job_id}_result.json"
+            artifact_path = os.path.join(artifact_dir, artifact_name)
+            with open(artifact_path, 'w', encoding='utf-8') as f:
+                json.dump(outcome, f, indent=2, default=str)
+        if params.get('input_path') and os.path.exists(params['input_path']):
+            os.remove(params['input_path'])
+
+        details = outcome.get('skipped_errors_details')
+        _update_job(
+            job_id,
+            status=JOB_COMPLETED if outcome.get('success', True) else JOB_FAILED,
+            rows_processed=progress.rows,
+            error_count=len(details) if details is not None else progress.errors,
+            message=outcome.get('message'),
+            result=json.dumps(outcome, default=str),
+            artifact_path=artifact_path,
+            artifact_name=artifact_name,
+            finished_at=_utcnow()
+        )
+        print(f"Background job {job_id} ({job_type}) finished: {outcome.get('message')}")
+
+
+# --- Web worker side ---
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=current_app.config.get('JOB_WORKER_PROCESSES', 1),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        return _executor
+
+
+def _discard_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+
+
+def _on_job_done(job_id, executor, future):
+    # _execute_job records its own failures; this only catches crashed pool processes.
+    error = future.exception()
+    if error is None:
+        return
+    if isinstance(error, BrokenProcessPool):
+        _discard_executor(executor)
+    print(f"Background job {job_id} crashed: {error}")
+    _update_job(job_id, status=JOB_FAILED, message=f"Job process crashed: {error}", finished_at=_utcnow())
+
+
+def _submit(job_id):
+    for attempt in range(2):
+        executor = _get_executor()
+        try:
+            future = executor.submit(_execute_job, job_id)
+        except BrokenProcessPool:
+            _discard_executor(executor)
+            continue
+        future.add_done_callback(lambda f: _on_job_done(job_id, executor, f))
+        return
+    _update_job(job_id, status=JOB_FAILED, message="The job worker pool is not available.", finished_at=_utcnow())
+
+
+def enqueue_job(db_session: Session, job_type, user_id=None, params=None, upload=None):
+    """
+    Creates a job row and hands it to the worker pool. upload (a werkzeug
+    FileStorage) is saved next to the job's artifacts and passed to the
+    handler as params['input_path']. Returns the committed BackgroundJob.
+    """
+    if job_type not in _job_handlers:
+        raise ValueError(f"Unknown job type '{job_type}'.")
+    params = dict(params or {})
+    prune_old_jobs(db_session)
+
+    job = BackgroundJob(job_type=job_type, user_id=user_id, status=JOB_QUEUED)
+    db_session.add(job)
+    db_session.flush()
+
+    if upload is not None:
+        job_dir = _job_dir(job.id)
+        os.makedirs(job_dir, exist_ok=True)
+        input_path = os.path.join(job_dir, 'input_' + (secure_filename(upload.filename or '') or 'upload'))
+        upload.save(input_path)
+        params['input_path'] = input_path
+
+    job.params = json.dumps(params)
+    db_session.commit()
+    _submit(job.id)
+    return job
+
+
+def _as_utc(value):
+    # SQLite hands back naive datetimes; they are UTC.
+    return value.replace(tzinfo=timezone.utc) if value is not None and value.tzinfo is None else value
+
+
+def _lost_cutoffs():
+    now = _utcnow()
+    return (
+        now - timedelta(seconds=current_app.config.get('JOB_HEARTBEAT_TIMEOUT_SECONDS', 300)),
+        now - timedelta(seconds=current_app.config.get('JOB_QUEUED_TIMEOUT_SECONDS', 6 * 3600)),
+    )
+
+
+def _is_lost(job):
+    running_cutoff, queued_cutoff = _lost_cutoffs()
+    if job.status == JOB_RUNNING:
+        return job.updated_at is not None and _as_utc(job.updated_at) < running_cutoff
+    if job.status == JOB_QUEUED:
+        return job.created_at is not None and _as_utc(job.created_at) < queued_cutoff
+    return False
+
+
+def recover_lost_jobs(db_session: Session):
+    """
+    Marks jobs whose worker is gone as failed, so they stop being polled and
+    can be resumed: running jobs without a heartbeat for
+    JOB_HEARTBEAT_TIMEOUT_SECONDS and jobs still queued after
+    JOB_QUEUED_TIMEOUT_SECONDS. A job only runs in the pool of the web
+    worker that accepted it, so a restarted worker leaves its jobs behind.
+    Returns the number of jobs failed.
+    """
+    running_cutoff, queued_cutoff = _lost_cutoffs()
+    lost = db_session.query(BackgroundJob).filter(or_(
+        and_(BackgroundJob.status == JOB_RUNNING, BackgroundJob.updated_at < running_cutoff),
+        and_(BackgroundJob.status == JOB_QUEUED, BackgroundJob.created_at < queued_cutoff),
+    )).update(
+        {'status': JOB_FAILED, 'message': LOST_JOB_MESSAGE, 'finished_at': _utcnow()},
+        synchronize_session=False
+    )
+    db_session.commit()
+    if lost:
+        print(f"Marked {lost} background job(s) with a lost worker as failed.")
+    return lost
+
+
+def prune_old_jobs(db_session: Session):
+    """
+    Fails lost jobs (see recover_lost_jobs), then deletes finished jobs (and
+    their artifacts) older than JOB_RETENTION_DAYS.
+    """
+    recover_lost_jobs(db_session)
+    cutoff = _utcnow() - timedelta(days=current_app.config.get('JOB_RETENTION_DAYS', 7))
+    old_jobs = db_session.query(BackgroundJob.id).filter(
+        BackgroundJob.status.in_(FINISHED_STATUSES),
+        BackgroundJob.created_at < cutoff
+    ).all()
+    if not old_jobs:
+        return
+    for (job_id,) in old_jobs:
+        shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+    db_session.query(BackgroundJob).filter(
+        BackgroundJob.id.in_([job_id for (job_id,) in old_jobs])
+    ).delete(synchronize_session=False)
+    db_session.commit()
+
+
+def resume_job(db_session: Session, job, user_id):
+    """Enqueues a finished job again with the same params, continuing from its checkpoint."""
+    if job.status not in FINISHED_STATUSES:
+        raise ValueError(f"Job #{job.id} is still {job.status}.")
+    params = json.loads(job.params or '{}')
+    params.setdefault('resume_of', job.id)
+    return enqueue_job(db_session, job.job_type, user_id, params)
+
+
+def get_job_for_user(db_session: Session, job_id, user_id):
+    job = db_session.get(BackgroundJob, job_id)
+    if job is None or job.user_id != user_id:
+        return None
+    if _is_lost(job):
+        recover_lost_jobs(db_session)
+        db_session.refresh(job)
+    return job
+
+
+def list_jobs(db_session: Session, user_id, limit=10):
+    return db_session.query(BackgroundJob).filter_by(user_id=user_id) \
+        .order_by(BackgroundJob.created_at.desc(), BackgroundJob.id.desc()).limit(limit).all()
+
+
+def job_to_dict(job):
+    return {
+        "id": job.id,
+        "job_type": job.job_type,
+        "status": job.status,
+        "finished": job.status in FINISHED_STATUSES,
+        "rows_processed": job.rows_processed,
+        "error_count": job.error_count,
+        "message": job.message,
+        "result": json.loads(job.result) if job.result else None,
+        "artifact_name": job.artifact_name if job.artifact_path else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
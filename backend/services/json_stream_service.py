@@ -0,0 +1,165 @@
+# backend/services/json_stream_service.py
+import codecs
+import json
+
+# Bytes (or characters) requested from the stream per read.
+READ_CHUNK_SIZE = 64 * 1024
+# raw_decode errors this close to the end of the buffer may just be truncated input.
+_TRUNCATION_MARGIN = 16
+_WHITESPACE = ' \t\r\n'
+_decoder = json.JSONDecoder()
+
+
+class JsonStreamError(json.JSONDecodeError):
+    """JSONDecodeError whose position counts from the start of the stream, not the buffer."""
+
+    def __init__(self, msg, pos):
+        ValueError.__init__(self, f"{msg} (char {pos})")
+        self.msg = msg
+        self.doc = None
+        self.pos = pos
+        self.lineno = None
+        self.colno = None
+
+    def __reduce__(self):
+        return self.__class__, (self.msg, self.pos)
+
+
+class JsonStreamReader:
+    """
+    Incremental (pull) JSON parser over a binary or text stream. Only the
+    unparsed tail of the input and the value currently being decoded are held
+    in memory, so arrays can be consumed one item at a time regardless of the
+    size of the document.
+    """
+
+    def __init__(self, stream, chunk_size=READ_CHUNK_SIZE):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._buffer = ''
+        self._pos = 0
+        self._consumed = 0  # characters dropped from the front of _buffer
+        self._eof = False
+
+    def _error(self, message, pos=None):
+        return JsonStreamError(message, self._consumed + (self._pos if pos is None else pos))
+
+    def _fill(self, min_chars=1):
+        """Buffers at least min_chars more characters unless the stream ends first. False at end of input."""
+        if self._pos:
+            self._consumed += self._pos
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        target = len(self._buffer) + min_chars
+        while len(self._buffer) < target and not self._eof:
+            chunk = self._stream.read(self._chunk_size)
+            if isinstance(chunk, str):
+                text = chunk
+            else:
+                text = self._text_decoder.decode(chunk or b'', final=not chunk)
+            if not chunk:
+                self._eof = True
+            self._buffer += text
+        return len(self._buffer) > self._pos
+
+    def peek(self):
+        """Next non-whitespace character without consuming it; '' at end of input."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self._error(f"Expecting '{char}'")
+        self._pos += 1
+
+    def read_value(self):
+        """Decodes and returns the next complete JSON value."""
+        if not self.peek():
+            raise self._error("Expecting value")
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                truncated = e.pos >= len(self._buffer) - _TRUNCATION_MARGIN or e.msg.startswith('Unterminated')
+                if self._eof or not truncated:
+                    raise self._error(e.msg, e.pos)
+                # Grow geometrically so a large value is not re-decoded once per chunk.
+                self._fill(max(self._chunk_size, len(self._buffer) - self._pos))
+                continue
+            if len(self._buffer) - end < _TRUNCATION_MARGIN and not self._eof:
+                # A number ending near the buffer edge ('-0.' of '-0.25') may continue in the next chunk.
+                self._fill(_TRUNCATION_MARGIN)
+                continue
+            self._pos = end
+            return value
+
+    def iter_array(self):
+        """Yields the items of the array at the current position one by one."""
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.read_value()
+            char = self.peek()
+            if char == ']':
+                self._pos += 1
+                return
+            if char != ',':
+                raise self._error("Expecting ',' delimiter")
+            self._pos += 1
+
+    def iter_object_keys(self):
+        """
+        Yields the keys of the object at the current position. The caller must
+        consume each value (read_value, iter_array, ...) before asking for the next key.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise self._error("Expecting property name enclosed in double quotes")
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            if char == '}':
+                self._pos += 1
+                return
+            if char != ',':
+                raise self._error("Expecting ',' delimiter")
+            self._pos += 1
+
+    def iter_values(self):
+        """Yields consecutive whitespace-separated values (e.g. NDJSON lines) until the input ends."""
+        while self.peek():
+            yield self.read_value()
+
+    def expect_end(self):
+        if self.peek():
+            raise self._error("Extra data")
+
+
+def iter_json_array(stream, not_a_list_message="Invalid JSON format: Top level must be a list."):
+    """
+    Yields the items of a top-level JSON array read incrementally from stream
+    (binary or text). Raises ValueError(not_a_list_message) when the document
+    is not an array and json.JSONDecodeError on malformed input, both lazily
+    while iterating.
+    """
+    reader = JsonStreamReader(stream)
+    char = reader.peek()
+    if char != '[':
+        if not char:
+            raise reader._error("Expecting value")
+        raise ValueError(not_a_list_message)
+    yield from reader.iter_array()
+    reader.expect_end()
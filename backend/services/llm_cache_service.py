@@ -0,0 +1,177 @@
+# backend/services/llm_cache_service.py
+import base64
+import hashlib
+import json
+import threading
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from ..db import SessionLocal
+from ..models import LLMResponseCache
+
+# Bump when the key layout changes, so old entries are never matched.
+CACHE_KEY_VERSION = 1
+
+# Per-worker counters since start-up; the table itself keeps per-entry hit counts.
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value):
+    # SQLite hands back naive datetimes even for timezone-aware columns.
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def is_enabled():
+    return current_app.config.get('LLM_CACHE_ENABLED', True)
+
+
+def use_cache_requested(value):
+    """A request's use_cache flag; strings from forms or JSON ('false', '0', 'off') count as no."""
+    if isinstance(value, str):
+        return value.strip().lower() not in ('0', 'false', 'off')
+    return bool(value)
+
+
+def can_clear(user):
+    """Only users listed in LLM_CACHE_ADMINS may empty the cache every user shares."""
+    admins = {name.strip() for name in (current_app.config.get('LLM_CACHE_ADMINS') or '').split(',') if name.strip()}
+    return user.is_authenticated and user.username in admins
+
+
+def image_digest(image_base64):
+    """sha256 of the decoded image, so the key does not depend on base64 formatting."""
+    if not image_base64:
+        return None
+    try:
+        data = base64.b64decode(image_base64)
+    except (ValueError, TypeError):
+        data = image_base64.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_key(provider, model_id, system_prompt, chat_history, user_message,
+              image_base64=None, image_mime_type=None, sampling=None):
+    """Content hash of everything that determines a response."""
+    material = {
+        'v': CACHE_KEY_VERSION,
+        'provider': provider,
+        'model': model_id,
+        'system': system_prompt or '',
+        'history': chat_history or [],
+        'message': user_message or '',
+        'image': image_digest(image_base64),
+        'image_mime_type': image_mime_type if image_base64 else None,
+        'sampling': sampling or {},
+    }
+    encoded = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def get(key):
+    """Cached response text for key, or None. A hit refreshes the entry's LRU position."""
+    # A private session: cache bookkeeping must not commit the caller's transaction.
+    session = SessionLocal.session_factory()
+    try:
+        now = _utcnow()
+        entry = session.get(LLMResponseCache, key)
+        if entry is None or _as_utc(entry.expires_at) <= now:
+            _count('misses')
+            return None
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_used_at = now
+        response = entry.response
+        session.commit()
+        _count('hits')
+        return response
+    except Exception:
+        # The cache is an optimization; a broken cache means a miss.
+        session.rollback()
+        traceback.print_exc()
+        _count('misses')
+        return None
+    finally:
+        session.close()
+
+
+def put(key, provider, model_id, response):
+    """Stores a response, then evicts expired and least recently used entries."""
+    if not response:
+        return
+    session = SessionLocal.session_factory()
+    try:
+        now = _utcnow()
+        ttl = current_app.config.get('LLM_CACHE_TTL_SECONDS', 7 * 24 * 3600)
+        session.merge(LLMResponseCache(
+            key=key,
+            provider=provider,
+            model=model_id,
+            response=response,
+            hit_count=0,
+            last_used_at=now,
+            expires_at=now + timedelta(seconds=ttl)
+        ))
+        session.commit()
+        _count('stores')
+        _evict(session, now)
+    except Exception:
+        session.rollback()
+        traceback.print_exc()
+    finally:
+        session.close()
+
+
+def _evict(session, now):
+    removed = session.query(LLMResponseCache).filter(LLMResponseCache.expires_at <= now) \
+        .delete(synchronize_session=False)
+    max_entries = current_app.config.get('LLM_CACHE_MAX_ENTRIES', 5000)
+    excess = session.query(func.count(LLMResponseCache.key)).scalar() - max_entries
+    if excess > 0:
+        oldest = select(LLMResponseCache.key).order_by(LLMResponseCache.last_used_at).limit(excess)
+        removed += session.query(LLMResponseCache).filter(LLMResponseCache.key.in_(oldest)) \
+            .delete(synchronize_session=False)
+    session.commit()
+    if removed:
+        _count('evictions', removed)
+
+
+def stats():
+    """Hit/miss counters of this worker plus the size and per-entry hits of the shared table."""
+    session = SessionLocal.session_factory()
+    try:
+        entries, total_chars, total_hits = session.query(
+            func.count(LLMResponseCache.key),
+            func.coalesce(func.sum(func.length(LLMResponseCache.response)), 0),
+            func.coalesce(func.sum(LLMResponseCache.hit_count), 0)
+        ).one()
+    finally:
+        session.close()
+    with _stats_lock:
+        counters = dict(_stats)
+    lookups = counters['hits'] + counters['misses']
+    counters['hit_rate'] = round(counters['hits'] / lookups, 3) if lookups else None
+    counters.update(entries=entries, response_chars=int(total_chars), entry_hits=int(total_hits))
+    return counters
+
+
+def clear():
+    """Deletes every cached response. Returns the number of rows removed."""
+    session = SessionLocal.session_factory()
+    try:
+        removed = session.query(LLMResponseCache).delete(synchronize_session=False)
+        session.commit()
+        return removed
+    finally:
+        session.close()
@@ -0,0 +1,117 @@
+# backend/services/llm_client_service.py
+import hashlib
+import threading
+from collections import OrderedDict
+
+import httpx
+import openai
+import requests
+from anthropic import Anthropic
+from langchain_openai import ChatOpenAI
+from requests.adapters import HTTPAdapter
+
+# Clients kept per worker; the least recently used one is dropped beyond this.
+CLIENT_REGISTRY_MAX_SIZE = 32
+# Keep-alive connections per HTTP pool (one pool per host).
+HTTP_POOL_MAXSIZE = 10
+APOLLO_TIMEOUT_SECONDS = 300
+
+
+def _fingerprint(credential):
+    # Registry keys never hold the secret itself.
+    return hashlib.sha256(repr(credential).encode('utf-8')).hexdigest()
+
+
+class ClientRegistry:
+    """
+    Bounded LRU of long-lived provider clients keyed by (provider, credential
+    hash). Reusing a client reuses its HTTP connection pool, so repeated
+    calls skip the TCP/TLS setup. Safe to share between threads.
+    Evicted clients are only dropped, not closed: a call in another thread
+    may still be using one, and its pool is released once it is garbage.
+    """
+
+    def __init__(self, max_size=CLIENT_REGISTRY_MAX_SIZE):
+        self.max_size = max_size
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, provider, credential, factory):
+        """Returns the client for (provider, credential), creating it with factory() on a miss."""
+        key = (provider, _fingerprint(credential))
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+
+        # Built outside the lock; if another thread won the race, its client is kept.
+        client = factory()
+        with self._lock:
+            client = self._clients.setdefault(key, client)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+        return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+_registry = ClientRegistry()
+
+
+def _new_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_http_session(provider, base_url=None):
+    """Keep-alive requests.Session for plain HTTP calls (Ollama, Apollo token/discovery)."""
+    return _registry.get(f"{provider}-http", base_url, _new_http_session)
+
+
+def get_openai_client(api_key):
+    return _registry.get('openai', api_key, lambda: openai.OpenAI(api_key=api_key))
+
+
+def get_anthropic_client(api_key):
+    return _registry.get('anthropic', api_key, lambda: Anthropic(api_key=api_key))
+
+
+def _get_apollo_http_client(base_url):
+    return _registry.get(
+        'apollo-http', base_url,
+        lambda: httpx.Client(timeout=APOLLO_TIMEOUT_SECONDS, limits=httpx.Limits(max_keepalive_connections=HTTP_POOL_MAXSIZE))
+    )
+
+
+def get_apollo_chat_model(model_id, base_url, access_token, temperature=0.01):
+    """
+    ChatOpenAI for an Apollo model. The access token rotates, so models are
+    keyed by it, but all of them share one HTTP connection pool per base URL.
+    """
+    http_client = _get_apollo_http_client(base_url)
+    return _registry.get(
+        'apollo', (model_id, base_url, access_token, temperature),
+        lambda: ChatOpenAI(
+            model=model_id,
+            base_url=base_url,
+            api_key=access_token,
+            temperature=temperature,
+            timeout=APOLLO_TIMEOUT_SECONDS,
+            http_client=http_client
+        )
+    )
+
+
+def clear_clients():
+    """Forgets every cached client (e.g. after credentials were rotated)."""
+    _registry.clear()
@@ -1,158 +1,260 @@
 # backend/services/llm_service.py
 import requests
-import tiktoken
+import hashlib
 import json
 import os
+import threading
 import time
 import traceback
 from io import BytesIO
-from flask import session as flask_session, current_app
-from collections import deque
+from flask import session as flask_session, current_app, g, has_app_context, has_request_context
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
 import logging
 from flask_login import current_user
 from ..db import SessionLocal
-from ..models import User, LLMSettings, ProcessStep, UseCase, UsecaseStepRelevance, Area
+from . import (
+    apollo_token_service, compact_format_service, conversation_service, data_version_service, llm_cache_service,
+    llm_client_service, token_count_service
+)
+from ..models import LLMSettings, ProcessStep, UseCase, UsecaseStepRelevance, Area
 from sqlalchemy.orm import joinedload, selectinload, Session
-from sqlalchemy import or_
+from sqlalchemy import func, or_, select
 
 # --- SDK Imports ---
-import openai
-from anthropic import Anthropic
 import google.generativeai as genai
-from langchain_openai import ChatOpenAI
 import base64
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# --- Global Apollo Token Cache ---
-_apollo_access_token = None
-_apollo_token_expiry = 0
+# --- Per-user credential cache ---
+# One load per user serves every provider lookup; entries are reloaded once the
+# llm_settings data version moves, i.e. after any worker saved settings.
+LLMCredentials = namedtuple('LLMCredentials', [
+    'ollama_base_url', 'openai_api_key', 'anthropic_api_key', 'google_api_key',
+    'apollo_client_id', 'apollo_client_secret'
+])
+_EMPTY_CREDENTIALS = LLMCredentials(None, None, None, None, None, None)
+_credentials_cache = {}  # user_id -> (llm_settings version, LLMCredentials)
+_credentials_lock = threading.Lock()
+_G_CREDENTIALS_KEY = '_llm_credentials'
+
+
+def _cached_credentials(user_id):
+    """user_id's credentials; one version lookup while cached, the settings row only after a change."""
+    # A private session: the request's scoped session must stay open for the view.
+    session = SessionLocal.session_factory()
+    try:
+        version = data_version_service.get_version(session, data_version_service.LLM_SETTINGS)
+        cached = _credentials_cache.get(user_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        row = session.query(*[getattr(LLMSettings, field) for field in LLMCredentials._fields]) \
+            .filter(LLMSettings.user_id == user_id).one_or_none()
+        credentials = LLMCredentials(*row) if row else _EMPTY_CREDENTIALS
+    finally:
+        session.close()
+    with _credentials_lock:
+        _credentials_cache[user_id] = (version, credentials)
+    return credentials
+
+
+def get_user_credentials():
+    """The current user's LLMSettings values (all None when signed out or unset)."""
+    if has_app_context() and _G_CREDENTIALS_KEY in g:
+        return g.get(_G_CREDENTIALS_KEY)
+    if not has_request_context() or not current_user.is_authenticated:
+        return _EMPTY_CREDENTIALS
+    credentials = _cached_credentials(current_user.id)
+    g.setdefault(_G_CREDENTIALS_KEY, credentials)
+    return credentials
+
+
+def use_credentials_of(user_id):
+    """
+    Makes user_id's settings the LLM credentials of the current app context.
+    For work outside a request (background jobs), where nobody is signed in.
+    """
+    setattr(g, _G_CREDENTIALS_KEY, _cached_credentials(user_id))
+
+
+def _on_llm_settings_commit(scopes):
+    # Later lookups in this request see the new version; only the per-request copy is stale.
+    if data_version_service.LLM_SETTINGS in scopes and has_app_context():
+        g.pop(_G_CREDENTIALS_KEY, None)
+
+
+data_version_service.on_commit(_on_llm_settings_commit)
+
 
 # --- API Key & URL Retrieval Functions ---
 def get_ollama_base_url():
-    if current_user.is_authenticated:
-        session = SessionLocal()
-        user = session.query(User).options(joinedload(User.llm_settings)).get(current_user.id)
-        if user and user.llm_settings and user.llm_settings.ollama_base_url:
-            session.close() # Close session before returning
-            return user.llm_settings.ollama_base_url
-        session.close() # Close session if no settings found
-    return os.environ.get('OLLAMA_BASE_URL', 'http://localhost:11434')
+    return get_user_credentials().ollama_base_url or os.environ.get('OLLAMA_BASE_URL', 'http://localhost:11434')
 
 def get_openai_api_key():
-    if current_user.is_authenticated:
-        session = SessionLocal()
-        user = session.query(User).options(joinedload(User.llm_settings)).get(current_user.id)
-        if user and user.llm_settings and user.llm_settings.openai_api_key:
-            session.close()
-            return user.llm_settings.openai_api_key
-        session.close()
-    return os.environ.get('OPENAI_API_KEY')
+    return get_user_credentials().openai_api_key or os.environ.get('OPENAI_API_KEY')
 
 def get_anthropic_api_key():
-    if current_user.is_authenticated:
-        session = SessionLocal()
-        user = session.query(User).options(joinedload(User.llm_settings)).get(current_user.id)
-        if user and user.llm_settings and user.llm_settings.anthropic_api_key:
-            session.close()
-            return user.llm_settings.anthropic_api_key
-        session.close()
-    return os.environ.get('ANTHROPIC_API_KEY')
+    return get_user_credentials().anthropic_api_key or os.environ.get('ANTHROPIC_API_KEY')
 
 def get_google_api_key():
-    if current_user.is_authenticated:
-        session = SessionLocal()
-        user = session.query(User).options(joinedload(User.llm_settings)).get(current_user.id)
-        if user and user.llm_settings and user.llm_settings.google_api_key:
-            session.close()
-            return user.llm_settings.google_api_key
-        session.close()
-    return os.environ.get('GOOGLE_API_KEY')
+    return get_user_credentials().google_api_key or os.environ.get('GOOGLE_API_KEY')
 
 def get_apollo_client_credentials():
-    if current_user.is_authenticated:
-        session = SessionLocal()
-        user = session.query(User).options(joinedload(User.llm_settings)).get(current_user.id)
-        if user and user.llm_settings and user.llm_settings.apollo_client_id and user.llm_settings.apollo_client_secret:
-            session.close()
-            return user.llm_settings.apollo_client_id, user.llm_settings.apollo_client_secret
-        session.close()
+    credentials = get_user_credentials()
+    if credentials.apollo_client_id and credentials.apollo_client_secret:
+        return credentials.apollo_client_id, credentials.apollo_client_secret
     return current_app.config.get('APOLLO_CLIENT_ID'), current_app.config.get('APOLLO_CLIENT_SECRET')
 
 def get_apollo_access_token():
-    global _apollo_access_token, _apollo_token_expiry
-    if _apollo_access_token and time.time() < _apollo_token_expiry:
-        return _apollo_access_token
     client_id, client_secret = get_apollo_client_credentials()
     token_url = current_app.config.get('APOLLO_TOKEN_URL')
     if not client_id or not client_secret:
         raise ValueError("Apollo credentials not configured.")
     if not token_url:
         raise ValueError("Apollo TOKEN_URL not configured.")
-    try:
-        response = requests.post(
-            token_url,
-            data={"grant_type": "client_credentials", "client_id": client_id, "client_secret": client_secret},
-            timeout=10
-        )
-        response.raise_for_status()
-        json_response = response.json()
-        _apollo_access_token = json_response['access_token']
-        _apollo_token_expiry = time.time() + json_response.get('expires_in', 3500)
-        return _apollo_access_token
-    except requests.exceptions.HTTPError as e:
-        raise ValueError(f"Apollo Token Error: {e.response.text}") from e
-    except requests.exceptions.RequestException as e:
-        raise ValueError(f"Apollo Token Error: Network request failed: {e}") from e
+    return apollo_token_service.get_access_token(token_url, client_id, client_secret)
 
 # --- Chat History Management ---
-def _get_history_deque():
-    max_len = current_app.config.get('MAX_CHAT_HISTORY_LENGTH', 10)
-    return deque(flask_session.get('llm_chat_history', []), maxlen=max_len)
+# Conversations live in the database (conversation_service); the Flask session only holds the id.
+_CONVERSATION_SESSION_KEY = 'llm_conversation_id'
+CHAT_SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Merge the existing summary with the new turns into one updated summary of at most 300 words. "
+    "Keep facts, decisions, names, numbers and open questions; drop pleasantries. "
+    "Reply with the summary only."
+)
+# Conversations being summarized by this worker, so a burst of turns starts one call, not several.
+_summarizing = set()
+_summarizing_lock = threading.Lock()
 
-def _save_history_deque(history_deque):
-    flask_session['llm_chat_history'] = list(history_deque)
 
-def get_chat_history():
-    return list(_get_history_deque())
+def _history_token_budget():
+    return current_app.config.get('LLM_CHAT_HISTORY_TOKEN_BUDGET', 6000)
 
-def add_message_to_history(role, content):
-    history_deque = _get_history_deque()
-    history_deque.append({'role': role, 'content': content})
-    _save_history_deque(history_deque)
 
-def clear_chat_history():
-    flask_session.pop('llm_chat_history', None)
+def _with_summary(system_prompt, summary):
+    if not summary:
+        return system_prompt
+    block = f"Summary of the earlier part of this conversation:\n{summary}"
+    return f"{system_prompt}\n\n{block}" if system_prompt else block
 
-# --- Data Preparation Service Logic ---
 
-def prepare_data_for_llm(db_session: Session, form_data, selectable_step_fields, selectable_uc_fields):
+def get_chat_context(system_prompt=None, create=False):
     """
-    Prepares data based on form selections for LLM analysis.
+    (conversation_id, system_prompt, chat_history) for the next chat turn: the
+    newest turns of the user's conversation within LLM_CHAT_HISTORY_TOKEN_BUDGET,
+    and the system prompt with the rolling summary of older turns appended.
+    With create=True a missing conversation is started (its id is None otherwise).
     """
-    # Parse form data
-    area_ids = [int(id_str) for id_str in form_data.getlist('area_ids') if id_str.isdigit()]
-    step_ids = [int(id_str) for id_str in form_data.getlist('step_ids') if id_str.isdigit()]
-    usecase_ids = [int(id_str) for id_str in form_data.getlist('usecase_ids') if id_str.isdigit()]
-    wave_values = form_data.getlist('wave_values')
-    selected_step_fields = form_data.getlist('step_fields')
-    selected_uc_fields = form_data.getlist('usecase_fields')
-    export_relevance = form_data.get('export_uc_step_relevance') == 'on'
+    conversation_id = flask_session.get(_CONVERSATION_SESSION_KEY)
+    history = conversation_service.get_history(conversation_id, current_user.id, _history_token_budget())
+    if history is None:
+        if not create:
+            return None, system_prompt, []
+        conversation_id = conversation_service.create_conversation(current_user.id)
+        flask_session[_CONVERSATION_SESSION_KEY] = conversation_id
+        # Sessions from before the conversation store kept the whole history here.
+        flask_session.pop('llm_chat_history', None)
+        return conversation_id, system_prompt, []
+    return conversation_id, _with_summary(system_prompt, history['summary']), history['messages']
 
-    prepared_data = {"process_steps": [], "use_cases": []}
-    
-    # Base queries
-    steps_query = db_session.query(ProcessStep).options(selectinload(ProcessStep.area))
-    usecases_query = db_session.query(UseCase).options(selectinload(UseCase.process_step).selectinload(ProcessStep.area))
 
-    # Apply filters
-    if usecase_ids:
-        usecases_query = usecases_query.filter(UseCase.id.in_(usecase_ids))
-    elif step_ids:
-        usecases_query = usecases_query.filter(UseCase.process_step_id.in_(step_ids))
-    elif area_ids:
-        usecases_query = usecases_query.join(ProcessStep).filter(ProcessStep.area_id.in_(area_ids))
+def get_chat_history():
+    return get_chat_context()[2]
+
+
+def record_chat_exchange(conversation_id, user_message, assistant_message, model_name=None):
+    """
+    Stores a completed turn. If LLM_CHAT_SUMMARIZE_OLDER_TURNS is on, turns
+    that fell out of the history budget are summarized with model_name in the background.
+    """
+    stored = conversation_service.add_messages(
+        conversation_id, current_user.id, [('user', user_message), ('assistant', assistant_message)]
+    )
+    if stored and model_name and current_app.config.get('LLM_CHAT_SUMMARIZE_OLDER_TURNS', False):
+        _summarize_in_background(conversation_id, current_user.id, model_name)
+    return stored
+
+
+def _summarize_older_turns(conversation_id, model_name):
+    budget = _history_token_budget()
+    while True:
+        summary, through_id, batch = conversation_service.summarization_batch(conversation_id, budget)
+        if not batch:
+            return
+        transcript = "\n\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in batch)
+        result = generate_chat_response(
+            model_name=model_name,
+            user_message=f"Existing summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}",
+            system_prompt=CHAT_SUMMARY_SYSTEM_PROMPT,
+            image_base64=None,
+            image_mime_type=None,
+            chat_history=[],
+            use_cache=False
+        )
+        new_summary = (result.get('message') or '').strip() if result.get('success') else ''
+        if not new_summary:
+            print(f"Could not summarize conversation {conversation_id}: {result.get('message')}")
+            return
+        if not conversation_service.store_summary(conversation_id, new_summary, through_id, batch[-1]['id']):
+            return
+
+
+def _summarize_in_background(conversation_id, user_id, model_name):
+    with _summarizing_lock:
+        if conversation_id in _summarizing:
+            return
+        _summarizing.add(conversation_id)
+    app = current_app._get_current_object()
+
+    def run():
+        try:
+            with app.app_context():
+                use_credentials_of(user_id)
+                _summarize_older_turns(conversation_id, model_name)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with _summarizing_lock:
+                _summarizing.discard(conversation_id)
+
+    threading.Thread(target=run, name='chat-summary', daemon=True).start()
 
+
+def clear_chat_history():
+    """Deletes the user's conversation; the next message starts a new one."""
+    conversation_id = flask_session.pop(_CONVERSATION_SESSION_KEY, None)
+    flask_session.pop('llm_chat_history', None)
+    if conversation_id is not None:
+        conversation_service.delete_conversation(conversation_id, current_user.id)
+
+# --- Data Preparation Service Logic ---
+PreparedData = namedtuple('PreparedData', ['data', 'steps', 'usecases', 'relevance_links'])
+
+def parse_data_prep_selection(form_data):
+    return {
+        "area_ids": [int(id_str) for id_str in form_data.getlist('area_ids') if id_str.isdigit()],
+        "step_ids": [int(id_str) for id_str in form_data.getlist('step_ids') if id_str.isdigit()],
+        "usecase_ids": [int(id_str) for id_str in form_data.getlist('usecase_ids') if id_str.isdigit()],
+        "wave_values": form_data.getlist('wave_values'),
+        "step_fields": form_data.getlist('step_fields'),
+        "usecase_fields": form_data.getlist('usecase_fields'),
+        "export_relevance": form_data.get('export_uc_step_relevance') == 'on',
+        "compact": form_data.get('output_format') == 'compact',
+    }
+
+def _filter_data_prep_queries(selection, steps_query, usecases_query):
+    """Applies the data prep selection to a ProcessStep and a UseCase query."""
+    # Apply filters
+    if selection["usecase_ids"]:
+        usecases_query = usecases_query.filter(UseCase.id.in_(selection["usecase_ids"]))
+    elif selection["step_ids"]:
+        usecases_query = usecases_query.filter(UseCase.process_step_id.in_(selection["step_ids"]))
+    elif selection["area_ids"]:
+        usecases_query = usecases_query.join(ProcessStep).filter(ProcessStep.area_id.in_(selection["area_ids"]))
+
+    wave_values = selection["wave_values"]
     if wave_values:
         # Handle 'N/A' as a filter for NULL or empty strings
         if "N/A" in wave_values:
@@ -160,23 +262,190 @@ def prepare_data_for_llm(db_session: Session, form_data, selectable_step_fields,
             usecases_query = usecases_query.filter(or_(*wave_conditions))
         else:
             usecases_query = usecases_query.filter(UseCase.wave.in_(wave_values))
-        
-    final_usecases = usecases_query.all()
 
-    if step_ids:
-        steps_query = steps_query.filter(ProcessStep.id.in_(step_ids))
-    elif area_ids:
-        steps_query = steps_query.filter(ProcessStep.area_id.in_(area_ids))
-        
+    if selection["step_ids"]:
+        steps_query = steps_query.filter(ProcessStep.id.in_(selection["step_ids"]))
+    elif selection["area_ids"]:
+        steps_query = steps_query.filter(ProcessStep.area_id.in_(selection["area_ids"]))
+
+    return steps_query, usecases_query
+
+def _usecase_step_relevance_links(db_session: Session, usecase_ids, step_ids):
+    """Relevance rows between the selected use cases and steps as (source_usecase_id, row dict)."""
+    if not usecase_ids or not step_ids:
+        return []
+    relevance_links = db_session.query(UsecaseStepRelevance).options(
+        selectinload(UsecaseStepRelevance.source_usecase),
+        selectinload(UsecaseStepRelevance.target_process_step)
+    ).filter(
+        UsecaseStepRelevance.source_usecase_id.in_(usecase_ids),
+        UsecaseStepRelevance.target_process_step_id.in_(step_ids)
+    ).all()
+    return [(rel.source_usecase_id, {
+        "source_usecase_name": rel.source_usecase.name,
+        "source_usecase_bi_id": rel.source_usecase.bi_id,
+        "target_process_step_name": rel.target_process_step.name,
+        "target_process_step_bi_id": rel.target_process_step.bi_id,
+        "relevance_score": rel.relevance_score,
+        "relevance_content": rel.relevance_content
+    }) for rel in relevance_links]
+
+def _usecase_step_relevance_data(db_session: Session, usecase_ids, step_ids):
+    return [row for _, row in _usecase_step_relevance_links(db_session, usecase_ids, step_ids)]
+
+def _compact_name_refs(steps, usecases):
+    """The refs compact_format_service gives the area and step names repeated on every row."""
+    return compact_format_service.choose_refs(_name_occurrences(steps, usecases))
+
+def _name_occurrences(steps, usecases):
+    return Counter([row[2] for row in steps] + [row[2] for row in usecases] + [row[3] for row in usecases])
+
+def _repeated_values_in_data(records, fields):
+    """String values of fields occurring more than once in records: Counter {value: occurrences}."""
+    values = Counter(
+        record[field] for record in records for field in fields if isinstance(record.get(field), str)
+    )
+    return Counter({value: count for value, count in values.items() if count > 1})
+
+def _repeated_values_in_db(db_session: Session, query, model, fields):
+    """Like _repeated_values_in_data for the rows of query, grouped in the database so unique texts are never loaded."""
+    ids = query.with_entities(model.id).subquery()
+    repeats = Counter()
+    for field in fields:
+        column = model.__table__.columns.get(field)
+        if column is None:
+            continue
+        for value, count in db_session.query(column, func.count()).filter(model.id.in_(select(ids.c.id))) \
+                .group_by(column).having(func.count() > 1):
+            if isinstance(value, str):
+                repeats[value] += count
+    return repeats
+
+def data_prep_item_tokens(db_session: Session, selection, steps, usecases, refs=None):
+    """
+    Tokens each step and use case adds to the data prep output (JSON, or
+    compact rows if selection["compact"]), from the per-field counts stored
+    by token_count_service. steps are (id, updated_at, area_name), usecases
+    (id, updated_at, area_name, process_step_name). Returns ({step_id: tokens},
+    {usecase_id: tokens}); nothing but new or changed rows is tokenized.
+    Compact rows count field values inline and names as refs (refs, or the
+    refs the names alone would get).
+    """
+    compact = selection.get("compact", False)
+    count_short = token_count_service.count_short_tokens
+    step_counts = token_count_service.get_field_counts(
+        db_session, 'process_step', [(row[0], row[1]) for row in steps], selection["step_fields"], compact=compact
+    )
+    usecase_counts = token_count_service.get_field_counts(
+        db_session, 'use_case', [(row[0], row[1]) for row in usecases], selection["usecase_fields"], compact=compact
+    )
+
+    if compact:
+        refs = refs if refs is not None else _compact_name_refs(steps, usecases)
+        step_header = lambda step_id, area_name: compact_format_service.row_tokens([step_id, area_name], refs)
+        usecase_header = lambda usecase_id, area_name, step_name: compact_format_service.row_tokens(
+            [usecase_id, area_name, step_name], refs
+        )
+    else:
+        step_header = lambda step_id, area_name: count_short(
+            f'{{"id": {step_id}, "area_name": {json.dumps(area_name)}}}, '
+        )
+        usecase_header = lambda usecase_id, area_name, step_name: count_short(
+            f'{{"id": {usecase_id}, "area_name": {json.dumps(area_name)}, "process_step_name": {json.dumps(step_name)}}}, '
+        )
+
+    step_tokens, usecase_tokens = {}, {}
+    for step_id, _, area_name in steps:
+        counts = step_counts.get(step_id, {})
+        step_tokens[step_id] = step_header(step_id, area_name) \
+            + sum(counts.get(field, 0) for field in selection["step_fields"])
+    for usecase_id, _, area_name, step_name in usecases:
+        counts = usecase_counts.get(usecase_id, {})
+        usecase_tokens[usecase_id] = usecase_header(usecase_id, area_name, step_name) \
+            + sum(counts.get(field, 0) for field in selection["usecase_fields"])
+    return step_tokens, usecase_tokens
+
+def _count_data_prep_tokens(db_session: Session, selection, steps, usecases, relevance, field_repeats=None):
+    """
+    Token total of the data prep output and its breakdown per section;
+    relevance is the list of relevance dicts or None. For the compact format,
+    field_repeats ({'process_steps': Counter, 'use_cases': Counter} of
+    repeated field values) lets the estimate account for their refs.
+    """
+    if not selection.get("compact"):
+        step_tokens, usecase_tokens = data_prep_item_tokens(db_session, selection, steps, usecases)
+        breakdown = {
+            "process_steps": sum(step_tokens.values()),
+            "use_cases": sum(usecase_tokens.values()),
+            "usecase_step_relevance": 0
+        }
+        if relevance is not None:
+            breakdown["usecase_step_relevance"] = token_count_service.count_tokens(
+                ', "usecase_step_relevance": ' + json.dumps(relevance, default=str)
+            )
+        breakdown["total_tokens"] = token_count_service.count_short_tokens('{"process_steps": [], "use_cases": []}') \
+            + sum(breakdown.values())
+        breakdown["format"] = "json"
+        return breakdown
+
+    field_repeats = field_repeats or {}
+    occurrences = _name_occurrences(steps, usecases)
+    for repeats in field_repeats.values():
+        occurrences.update(repeats)
+    for row in relevance or []:
+        occurrences.update(value for value in row.values() if isinstance(value, str))
+    refs = compact_format_service.choose_refs(occurrences)
+
+    step_tokens, usecase_tokens = data_prep_item_tokens(db_session, selection, steps, usecases, refs=refs)
+    breakdown = {
+        "process_steps": sum(step_tokens.values())
+            - compact_format_service.ref_savings(field_repeats.get("process_steps", {}), refs),
+        "use_cases": sum(usecase_tokens.values())
+            - compact_format_service.ref_savings(field_repeats.get("use_cases", {}), refs),
+        "usecase_step_relevance": 0
+    }
+    sections = [
+        ("process_steps", ["id", "area_name"] + selection["step_fields"]),
+        ("use_cases", ["id", "area_name", "process_step_name"] + selection["usecase_fields"]),
+    ]
+    if relevance is not None:
+        sections.append(("usecase_step_relevance", list(relevance[0]) if relevance else []))
+        breakdown["usecase_step_relevance"] = sum(
+            compact_format_service.row_tokens(list(row.values()), refs) for row in relevance
+        )
+    breakdown["total_tokens"] = compact_format_service.overhead_tokens(sections, refs) + sum(breakdown.values())
+    breakdown["format"] = "compact"
+    return breakdown
+
+def collect_data_prep(db_session: Session, selection):
+    """
+    Serializes the steps and use cases of a data prep selection. Returns a
+    PreparedData of the JSON-ready dict, the (id, updated_at, ...) rows that
+    data_prep_item_tokens takes, and the relevance rows as (source_usecase_id, row).
+    """
+    selected_step_fields = selection["step_fields"]
+    selected_uc_fields = selection["usecase_fields"]
+
+    prepared_data = {"process_steps": [], "use_cases": []}
+
+    # Base queries
+    steps_query, usecases_query = _filter_data_prep_queries(
+        selection,
+        db_session.query(ProcessStep).options(selectinload(ProcessStep.area)),
+        db_session.query(UseCase).options(selectinload(UseCase.process_step).selectinload(ProcessStep.area))
+    )
+    final_usecases = usecases_query.all()
     final_steps = steps_query.all()
 
     # Serialize selected data
+    steps_for_count, usecases_for_count = [], []
     for step in final_steps:
         step_data = {"id": step.id, "area_name": step.area.name if step.area else "N/A"}
         for field in selected_step_fields:
             if hasattr(step, field):
                 step_data[field] = getattr(step, field)
         prepared_data["process_steps"].append(step_data)
+        steps_for_count.append((step.id, step.updated_at, step_data["area_name"]))
 
     for uc in final_usecases:
         uc_data = {
@@ -188,41 +457,88 @@ def prepare_data_for_llm(db_session: Session, form_data, selectable_step_fields,
             if hasattr(uc, field):
                 uc_data[field] = getattr(uc, field)
         prepared_data["use_cases"].append(uc_data)
-        
-    if export_relevance:
-        prepared_data["usecase_step_relevance"] = []
-        # Get IDs of selected items for efficient filtering
-        final_uc_ids = [uc.id for uc in final_usecases]
-        final_step_ids = [step.id for step in final_steps]
-
-        if final_uc_ids and final_step_ids:
-            relevance_query = db_session.query(UsecaseStepRelevance).options(
-                selectinload(UsecaseStepRelevance.source_usecase),
-                selectinload(UsecaseStepRelevance.target_process_step)
-            ).filter(
-                UsecaseStepRelevance.source_usecase_id.in_(final_uc_ids),
-                UsecaseStepRelevance.target_process_step_id.in_(final_step_ids)
-            )
-            relevance_links = relevance_query.all()
-            for rel in relevance_links:
-                prepared_data["usecase_step_relevance"].append({
-                    "source_usecase_name": rel.source_usecase.name,
-                    "source_usecase_bi_id": rel.source_usecase.bi_id,
-                    "target_process_step_name": rel.target_process_step.name,
-                    "target_process_step_bi_id": rel.target_process_step.bi_id,
-                    "relevance_score": rel.relevance_score,
-                    "relevance_content": rel.relevance_content
-                })
-
-    # Calculate token count
-    json_string = json.dumps(prepared_data, default=str)
-    try:
-        encoding = tiktoken.get_encoding("cl100k_base")
-        total_tokens = len(encoding.encode(json_string))
-    except Exception:
-        total_tokens = len(json_string) // 4  # Fallback approximation
+        usecases_for_count.append((uc.id, uc.updated_at, uc_data["area_name"], uc_data["process_step_name"]))
+
+    relevance_links = []
+    if selection["export_relevance"]:
+        relevance_links = _usecase_step_relevance_links(
+            db_session, [uc.id for uc in final_usecases], [step.id for step in final_steps]
+        )
+        prepared_data["usecase_step_relevance"] = [row for _, row in relevance_links]
+
+    return PreparedData(prepared_data, steps_for_count, usecases_for_count, relevance_links)
 
-    return prepared_data, total_tokens
+def prepare_data_for_llm(db_session: Session, form_data, selectable_step_fields, selectable_uc_fields):
+    """
+    Prepares data based on form selections for LLM analysis.
+    """
+    selection = parse_data_prep_selection(form_data)
+    prepared = collect_data_prep(db_session, selection)
+
+    field_repeats = None
+    if selection["compact"]:
+        field_repeats = {
+            "process_steps": _repeated_values_in_data(prepared.data["process_steps"], selection["step_fields"]),
+            "use_cases": _repeated_values_in_data(prepared.data["use_cases"], selection["usecase_fields"]),
+        }
+
+    # Token count from stored per-field counts instead of re-tokenizing the whole output
+    total_tokens = _count_data_prep_tokens(
+        db_session, selection, prepared.steps, prepared.usecases, prepared.data.get("usecase_step_relevance"),
+        field_repeats
+    )["total_tokens"]
+
+    return prepared.data, total_tokens
+
+def estimate_data_prep_tokens(db_session: Session, form_data):
+    """
+    Token estimate for a data prep selection without building the output:
+    only ids, timestamps and names are queried (plus, for the compact
+    format, the field values that repeat). Returns the total and a
+    breakdown per section.
+    """
+    selection = parse_data_prep_selection(form_data)
+    steps_query, usecases_query = _filter_data_prep_queries(
+        selection, db_session.query(ProcessStep), db_session.query(UseCase)
+    )
+    area_names = dict(db_session.query(Area.id, Area.name).all())
+    step_info = {
+        step_id: (name, area_names.get(area_id, "N/A"))
+        for step_id, name, area_id in db_session.query(ProcessStep.id, ProcessStep.name, ProcessStep.area_id)
+    }
+
+    steps = [
+        (step_id, updated_at, area_names.get(area_id, "N/A"))
+        for step_id, updated_at, area_id in steps_query.with_entities(
+            ProcessStep.id, ProcessStep.updated_at, ProcessStep.area_id
+        )
+    ]
+    usecases = []
+    for usecase_id, updated_at, step_id in usecases_query.with_entities(
+        UseCase.id, UseCase.updated_at, UseCase.process_step_id
+    ):
+        step_name, area_name = step_info.get(step_id, ("N/A", "N/A"))
+        usecases.append((usecase_id, updated_at, area_name, step_name))
+
+    relevance = None
+    if selection["export_relevance"]:
+        relevance = _usecase_step_relevance_data(db_session, [row[0] for row in usecases], [row[0] for row in steps])
+    field_repeats = None
+    if selection["compact"]:
+        field_repeats = {
+            "process_steps": _repeated_values_in_db(db_session, steps_query, ProcessStep, selection["step_fields"]),
+            "use_cases": _repeated_values_in_db(db_session, usecases_query, UseCase, selection["usecase_fields"]),
+        }
+    return _count_data_prep_tokens(db_session, selection, steps, usecases, relevance, field_repeats)
+
+# Sampling parameters per provider; part of the response cache key.
+PROVIDER_SAMPLING_PARAMS = {
+    "ollama": {},
+    "openai": {"temperature": 0.7, "max_tokens": 1024},
+    "anthropic": {"max_tokens": 1024},
+    "google": {},
+    "apollo": {"temperature": 0.01},
+}
 
 # --- REFACTORED: Provider-Specific Chat Generation Functions ---
 # These functions are now simpler, only handling the direct API call.
@@ -230,19 +546,20 @@ def prepare_data_for_llm(db_session: Session, form_data, selectable_step_fields,
 def _call_ollama(model_id, messages, **kwargs):
     api_url = f"{get_ollama_base_url()}/api/chat"
     payload = {"model": model_id, "messages": messages, "stream": False}
-    response = requests.post(api_url, json=payload, headers={"Content-Type": "application/json"}, timeout=300)
+    http = llm_client_service.get_http_session('ollama', get_ollama_base_url())
+    response = http.post(api_url, json=payload, headers={"Content-Type": "application/json"}, timeout=300)
     response.raise_for_status()
     return response.json()['message']['content']
 
 def _call_openai(model_id, messages, **kwargs):
-    client = openai.OpenAI(api_key=get_openai_api_key())
-    response = client.chat.completions.create(model=model_id, messages=messages, temperature=0.7, max_tokens=1024)
+    client = llm_client_service.get_openai_client(get_openai_api_key())
+    response = client.chat.completions.create(model=model_id, messages=messages, **PROVIDER_SAMPLING_PARAMS['openai'])
     return response.choices[0].message.content
 
 def _call_anthropic(model_id, messages, **kwargs):
-    client = Anthropic(api_key=get_anthropic_api_key())
+    client = llm_client_service.get_anthropic_client(get_anthropic_api_key())
     system_prompt = kwargs.get('system_prompt', '')
-    response = client.messages.create(model=model_id, max_tokens=1024, system=system_prompt, messages=messages)
+    response = client.messages.create(model=model_id, system=system_prompt, messages=messages, **PROVIDER_SAMPLING_PARAMS['anthropic'])
     return response.content[0].text
 
 def _call_google(model_id, messages, **kwargs):
@@ -257,16 +574,69 @@ def _call_google(model_id, messages, **kwargs):
     return response.text
 
 def _call_apollo(model_id, messages, **kwargs):
-    llm_model = ChatOpenAI(
-        model=model_id,
-        base_url=current_app.config.get('APOLLO_LLM_API_BASE_URL'),
-        api_key=get_apollo_access_token(),
-        temperature=0.01,
-        timeout=300
+    llm_model = llm_client_service.get_apollo_chat_model(
+        model_id, current_app.config.get('APOLLO_LLM_API_BASE_URL'), get_apollo_access_token(),
+        **PROVIDER_SAMPLING_PARAMS['apollo']
     )
     response = llm_model.invoke(messages)
     return response.content
 
+# --- Streaming variants: generators yielding text deltas as the provider sends them ---
+
+def _stream_ollama(model_id, messages, **kwargs):
+    api_url = f"{get_ollama_base_url()}/api/chat"
+    payload = {"model": model_id, "messages": messages, "stream": True}
+    http = llm_client_service.get_http_session('ollama', get_ollama_base_url())
+    with http.post(api_url, json=payload, headers={"Content-Type": "application/json"}, timeout=300, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get('error'):
+                raise ValueError(chunk['error'])
+            content = (chunk.get('message') or {}).get('content')
+            if content:
+                yield content
+            if chunk.get('done'):
+                return
+
+def _stream_openai(model_id, messages, **kwargs):
+    client = llm_client_service.get_openai_client(get_openai_api_key())
+    stream = client.chat.completions.create(
+        model=model_id, messages=messages, stream=True, **PROVIDER_SAMPLING_PARAMS['openai']
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def _stream_anthropic(model_id, messages, **kwargs):
+    client = llm_client_service.get_anthropic_client(get_anthropic_api_key())
+    system_prompt = kwargs.get('system_prompt', '')
+    with client.messages.stream(model=model_id, system=system_prompt, messages=messages, **PROVIDER_SAMPLING_PARAMS['anthropic']) as stream:
+        for text in stream.text_stream:
+            yield text
+
+def _stream_google(model_id, messages, **kwargs):
+    genai.configure(api_key=get_google_api_key())
+    model_config = {}
+    if kwargs.get('system_prompt'):
+        model_config['system_instruction'] = kwargs.get('system_prompt')
+    model = genai.GenerativeModel(model_name=model_id, **model_config)
+    chat = model.start_chat(history=kwargs.get('history_for_google', []))
+    for chunk in chat.send_message(messages[-1]['parts'], stream=True):
+        if chunk.text:
+            yield chunk.text
+
+def _stream_apollo(model_id, messages, **kwargs):
+    llm_model = llm_client_service.get_apollo_chat_model(
+        model_id, current_app.config.get('APOLLO_LLM_API_BASE_URL'), get_apollo_access_token(),
+        **PROVIDER_SAMPLING_PARAMS['apollo']
+    )
+    for chunk in llm_model.stream(messages):
+        if chunk.content:
+            yield chunk.content
+
 # --- REFACTORED: Main dispatcher function ---
 
 PROVIDER_HANDLERS = {
@@ -277,16 +647,19 @@ PROVIDER_HANDLERS = {
     "apollo": _call_apollo,
 }
 
-def generate_chat_response(model_name, user_message, system_prompt, image_base64, image_mime_type, chat_history):
-    """
-    Main dispatcher for generating chat responses from any provider.
-    Handles message preparation and calls the appropriate provider handler.
-    """
-    provider, model_id = model_name.split('-', 1) if '-' in model_name else ("unknown", model_name)
-    handler = PROVIDER_HANDLERS.get(provider)
-    if not handler:
-        return {"success": False, "message": f"Unsupported LLM provider: {provider}"}
+PROVIDER_STREAM_HANDLERS = {
+    "ollama": _stream_ollama,
+    "openai": _stream_openai,
+    "anthropic": _stream_anthropic,
+    "google": _stream_google,
+    "apollo": _stream_apollo,
+}
+
+def _split_model_name(model_name):
+    return model_name.split('-', 1) if '-' in model_name else ("unknown", model_name)
 
+def _prepare_chat_messages(provider, user_message, system_prompt, image_base64, image_mime_type, chat_history):
+    """Builds the provider-specific message list. Returns (messages_for_api, history_for_google)."""
     # --- Prepare messages based on provider requirements ---
     messages_for_api = []
     
@@ -335,6 +708,42 @@ def generate_chat_response(model_name, user_message, system_prompt, image_base64
     else: # OpenAI / Apollo
         messages_for_api.append({"role": "user", "content": user_content_blocks})
 
+    return messages_for_api, history_for_google
+
+def _response_cache_key(provider, model_id, user_message, system_prompt, image_base64, image_mime_type, chat_history, use_cache):
+    """Cache key for the call, or None when caching is bypassed or disabled."""
+    if not use_cache or not llm_cache_service.is_enabled():
+        return None
+    return llm_cache_service.cache_key(
+        provider, model_id, system_prompt, chat_history, user_message,
+        image_base64=image_base64, image_mime_type=image_mime_type,
+        sampling=PROVIDER_SAMPLING_PARAMS.get(provider)
+    )
+
+def generate_chat_response(model_name, user_message, system_prompt, image_base64, image_mime_type, chat_history, use_cache=True):
+    """
+    Main dispatcher for generating chat responses from any provider.
+    Handles message preparation and calls the appropriate provider handler.
+    Identical requests are answered from the response cache unless use_cache is False.
+    """
+    provider, model_id = _split_model_name(model_name)
+    handler = PROVIDER_HANDLERS.get(provider)
+    if not handler:
+        return {"success": False, "message": f"Unsupported LLM provider: {provider}"}
+
+    cache_key = _response_cache_key(
+        provider, model_id, user_message, system_prompt, image_base64, image_mime_type, chat_history, use_cache
+    )
+    if cache_key:
+        cached = llm_cache_service.get(cache_key)
+        if cached is not None:
+            logging.info(f"Response cache hit for provider '{provider}' with model '{model_id}'.")
+            return {"success": True, "message": cached, "cached": True}
+
+    messages_for_api, history_for_google = _prepare_chat_messages(
+        provider, user_message, system_prompt, image_base64, image_mime_type, chat_history
+    )
+
     # --- Call the handler and handle exceptions ---
     try:
         logging.info(f"Calling provider '{provider}' with model '{model_id}'...")
@@ -344,6 +753,8 @@ def generate_chat_response(model_name, user_message, system_prompt, image_base64
             system_prompt=system_prompt, 
             history_for_google=history_for_google
         )
+        if cache_key:
+            llm_cache_service.put(cache_key, provider, model_id, assistant_message)
         return {"success": True, "message": assistant_message}
     except Exception as e:
         error_msg = f"Error from {provider.capitalize()} API: {e}"
@@ -351,7 +762,51 @@ def generate_chat_response(model_name, user_message, system_prompt, image_base64
         return {"success": False, "message": error_msg}
 
 
-def generate_step_summary(db_session: Session, step_id: int, model_name: str, system_prompt_template: str):
+def stream_chat_response(model_name, user_message, system_prompt, image_base64, image_mime_type, chat_history, use_cache=True):
+    """
+    Streaming counterpart of generate_chat_response: yields the assistant's
+    text deltas as they arrive (a cached response arrives as one delta).
+    Provider failures are logged and raised as ValueError with the same
+    message generate_chat_response would return.
+    """
+    provider, model_id = _split_model_name(model_name)
+    handler = PROVIDER_STREAM_HANDLERS.get(provider)
+    if not handler:
+        raise ValueError(f"Unsupported LLM provider: {provider}")
+
+    cache_key = _response_cache_key(
+        provider, model_id, user_message, system_prompt, image_base64, image_mime_type, chat_history, use_cache
+    )
+    if cache_key:
+        cached = llm_cache_service.get(cache_key)
+        if cached is not None:
+            logging.info(f"Response cache hit for provider '{provider}' with model '{model_id}'.")
+            yield cached
+            return
+
+    parts = []
+    try:
+        messages_for_api, history_for_google = _prepare_chat_messages(
+            provider, user_message, system_prompt, image_base64, image_mime_type, chat_history
+        )
+        logging.info(f"Streaming from provider '{provider}' with model '{model_id}'...")
+        for delta in handler(
+            model_id=model_id,
+            messages=messages_for_api,
+            system_prompt=system_prompt,
+            history_for_google=history_for_google
+        ):
+            parts.append(delta)
+            yield delta
+    except Exception as e:
+        error_msg = f"Error from {provider.capitalize()} API: {e}"
+        logging.error(f"{error_msg}\n{traceback.format_exc()}")
+        raise ValueError(error_msg) from e
+    if cache_key:
+        llm_cache_service.put(cache_key, provider, model_id, ''.join(parts))
+
+
+def generate_step_summary(db_session: Session, step_id: int, model_name: str, system_prompt_template: str, use_cache: bool = True):
     """
     Generates a summary for a Process Step using an LLM.
 
@@ -360,6 +815,7 @@ def generate_step_summary(db_session: Session, step_id: int, model_name: str, sy
         step_id: The ID of the ProcessStep to summarize.
         model_name: The name of the LLM model to use.
         system_prompt_template: The user-provided system prompt template.
+        use_cache: Whether an identical earlier request may be answered from the response cache.
 
     Returns:
         A dictionary with the success status and the generated summary or an error message.
@@ -405,7 +861,8 @@ def generate_step_summary(db_session: Session, step_id: int, model_name: str, sy
         system_prompt=final_system_prompt,
         image_base64=None,
         image_mime_type=None,
-        chat_history=[] # No chat history needed for this one-off task
+        chat_history=[], # No chat history needed for this one-off task
+        use_cache=use_cache
     )
 
     return response
@@ -414,7 +871,8 @@ def generate_step_summary(db_session: Session, step_id: int, model_name: str, sy
 def get_available_ollama_models():
     ollama_url = get_ollama_base_url()
     try:
-        response = requests.get(f"{ollama_url}/api/tags", timeout=5)
+        http = llm_client_service.get_http_session('ollama', ollama_url)
+        response = http.get(f"{ollama_url}/api/tags", timeout=5)
         response.raise_for_status()
         return [f"ollama-{model['name']}" for model in response.json().get('models', [])]
     except requests.exceptions.RequestException as e:
@@ -435,17 +893,105 @@ def get_available_apollo_models():
         return []
     try:
         access_token = get_apollo_access_token()
-        response = requests.get(f"{apollo_url}/model_group/info", headers={"Authorization": f"Bearer {access_token}"}, timeout=10)
+        http = llm_client_service.get_http_session('apollo', apollo_url)
+        response = http.get(f"{apollo_url}/model_group/info", headers={"Authorization": f"Bearer {access_token}"}, timeout=10)
         response.raise_for_status()
         return [f"apollo-{model['model_group']}" for model in response.json().get('data', []) if model.get('mode') == 'chat']
     except Exception as e:
         return [f"apollo-Error: {e.__class__.__name__}"]
 
-def get_all_available_llm_models():
-    all_models = []
-    all_models.extend(get_available_openai_models())
-    all_models.extend(get_available_anthropic_models())
-    all_models.extend(get_available_google_models())
-    all_models.extend(get_available_apollo_models())
-    all_models.extend(get_available_ollama_models())
-    return list(dict.fromkeys(filter(None, all_models)))
\ No newline at end of file
+# Probed concurrently; the merged list keeps this order.
+MODEL_PROBES = (
+    get_available_openai_models,
+    get_available_anthropic_models,
+    get_available_google_models,
+    get_available_apollo_models,
+    get_available_ollama_models,
+)
+
+# credential fingerprint -> (expires_at, models); shared by users with the same settings.
+_model_lists = {}
+# credential fingerprint -> futures of the refresh in flight.
+_model_refreshes = {}
+_model_lists_lock = threading.Lock()
+_probe_executor = None
+
+
+def _get_probe_executor():
+    # Created on first use, i.e. after gunicorn has forked the worker.
+    global _probe_executor
+    with _model_lists_lock:
+        if _probe_executor is None:
+            _probe_executor = ThreadPoolExecutor(max_workers=len(MODEL_PROBES) * 2, thread_name_prefix='llm-model-probe')
+        return _probe_executor
+
+
+def _model_list_key(credentials):
+    config = current_app.config
+    material = (credentials, config.get('APOLLO_CLIENT_ID'), config.get('APOLLO_LLM_API_BASE_URL'))
+    return hashlib.sha256(repr(material).encode('utf-8')).hexdigest()
+
+
+def _run_model_probe(app, credentials, probe):
+    # Executor threads have no request; they get an app context with the caller's credentials.
+    with app.app_context():
+        setattr(g, _G_CREDENTIALS_KEY, credentials)
+        try:
+            return probe()
+        except Exception as e:
+            print(f"Model discovery via {probe.__name__} failed: {e}")
+            return []
+
+
+def _merge_model_lists(futures):
+    models = []
+    for future in futures:
+        if future.done() and not future.cancelled():
+            models.extend(future.result())
+    return list(dict.fromkeys(filter(None, models)))
+
+
+def _start_model_refresh(key, credentials):
+    """Starts probing all providers for key (unless already running); returns the futures."""
+    app = current_app._get_current_object()
+    ttl = app.config.get('LLM_MODELS_TTL_SECONDS', 300)
+    executor = _get_probe_executor()
+    with _model_lists_lock:
+        futures = _model_refreshes.get(key)
+        if futures is not None:
+            return futures
+        futures = [executor.submit(_run_model_probe, app, credentials, probe) for probe in MODEL_PROBES]
+        _model_refreshes[key] = futures
+
+    def store_when_complete(_):
+        if not all(future.done() for future in futures):
+            return
+        with _model_lists_lock:
+            if _model_refreshes.get(key) is futures:
+                del _model_refreshes[key]
+                _model_lists[key] = (time.monotonic() + ttl, _merge_model_lists(futures))
+
+    for future in futures:
+        future.add_done_callback(store_when_complete)
+    return futures
+
+
+def get_all_available_llm_models(force_refresh=False):
+    """
+    Models offered by every configured provider, cached per credential set
+    for LLM_MODELS_TTL_SECONDS. An expired list is still returned while a
+    background refresh runs. Without any list yet, the providers are probed
+    concurrently for at most LLM_MODELS_PROBE_WAIT_SECONDS; slower ones are
+    left out of this answer and show up once their probe has finished.
+    """
+    credentials = get_user_credentials()
+    key = _model_list_key(credentials)
+    cached = _model_lists.get(key)
+    if cached and not force_refresh:
+        if cached[0] <= time.monotonic():
+            _start_model_refresh(key, credentials)
+        return list(cached[1])
+
+    futures = _start_model_refresh(key, credentials)
+    futures_wait(futures, timeout=current_app.config.get('LLM_MODELS_PROBE_WAIT_SECONDS', 2))
+    return _merge_model_lists(futures)
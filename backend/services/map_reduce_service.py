@@ -0,0 +1,342 @@
+# backend/services/map_reduce_service.py
+import json
+import os
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+
+from ..db import SessionLocal
+from ..models import UseCase
+from . import compact_format_service, enrichment_service, llm_cache_service, llm_service, token_count_service
+
+# Used for providers missing from LLM_CONTEXT_WINDOWS.
+DEFAULT_CONTEXT_WINDOW = 8192
+# Share of the context window one chunk may fill; the rest is prompt, question and answer.
+CHUNK_WINDOW_SHARE = 0.5
+MIN_CHUNK_TOKENS = 1000
+
+NO_RELEVANT_DATA = "NO RELEVANT DATA"
+
+DIRECT_SYSTEM_PROMPT = (
+    "You answer questions about a portfolio of process steps and use cases, given as 'process_steps', "
+    "'use_cases' and optionally 'usecase_step_relevance' records. Answer from the data only "
+    "and cite use cases and process steps by name and BI_ID where available."
+)
+MAP_SYSTEM_PROMPT = (
+    "You analyse one part of a larger portfolio of process steps and use cases, given as 'process_steps', "
+    "'use_cases' and optionally 'usecase_step_relevance' records. The other parts are analysed "
+    "separately and all findings are merged afterwards. Extract everything in this part that helps answer "
+    "the question: facts, counts, examples, and the names and BI_IDs to cite. Do not guess about data you "
+    f"cannot see. If this part holds nothing relevant, reply exactly '{NO_RELEVANT_DATA}'."
+)
+REDUCE_SYSTEM_PROMPT = (
+    "You merge findings that were extracted from different parts of a portfolio of process steps and use "
+    "cases into one answer to the question. Add up counts, merge lists, drop repetition and keep the cited "
+    "names and BI_IDs. Use only the findings."
+)
+
+Chunk = namedtuple('Chunk', ['data', 'tokens', 'areas'])
+
+
+def build_params(form_data, user_id):
+    """
+    Validates a map-reduce question (the data prep form plus question, model
+    and optional chunk_tokens / use_cache) and returns the job params.
+    Raises ValueError with a user-facing message.
+    """
+    question = (form_data.get('question') or '').strip()
+    model_name = form_data.get('model')
+    if not question:
+        raise ValueError("A question is required.")
+    if not model_name or '-' not in model_name:
+        raise ValueError("A model is required.")
+    selection = llm_service.parse_data_prep_selection(form_data)
+    if not selection["step_fields"] and not selection["usecase_fields"]:
+        raise ValueError("Select at least one process step or use case field.")
+    try:
+        chunk_tokens = int(form_data['chunk_tokens']) if form_data.get('chunk_tokens') not in (None, '') else None
+    except (TypeError, ValueError) as e:
+        raise ValueError("chunk_tokens must be an integer.") from e
+
+    return {
+        "question": question,
+        "model": model_name,
+        "selection": selection,
+        "chunk_tokens": chunk_tokens,
+        "use_cache": llm_cache_service.use_cache_requested(form_data.get('use_cache', True)),
+        "user_id": user_id,
+    }
+
+
+def chunk_token_budget(model_name, requested=None):
+    """Tokens of data per chunk: a share of the provider's context window, capped by LLM_MAP_REDUCE_CHUNK_TOKENS."""
+    provider = model_name.split('-', 1)[0].lower()
+    windows = enrichment_service.parse_provider_limits(current_app.config.get('LLM_CONTEXT_WINDOWS'))
+    budget = min(
+        current_app.config.get('LLM_MAP_REDUCE_CHUNK_TOKENS', 30000),
+        int(windows.get(provider, DEFAULT_CONTEXT_WINDOW) * CHUNK_WINDOW_SHARE)
+    )
+    if requested:
+        budget = min(budget, requested)
+    return max(MIN_CHUNK_TOKENS, budget)
+
+
+class _ChunkBuilder:
+    """Accumulates steps and use cases (with their relevance rows) into one chunk."""
+
+    def __init__(self, base_tokens, with_relevance):
+        self.base_tokens = base_tokens
+        self.with_relevance = with_relevance
+        self.reset()
+
+    def reset(self):
+        self.steps, self.usecases, self.relevance, self.areas = [], [], [], []
+        self.tokens = self.base_tokens
+
+    @property
+    def empty(self):
+        return not self.steps and not self.usecases
+
+    def add_step(self, step, tokens):
+        self.steps.append(step)
+        self._add_area(step['area_name'])
+        self.tokens += tokens
+
+    def add_usecase(self, usecase, relevance_rows, tokens):
+        self.usecases.append(usecase)
+        self.relevance.extend(relevance_rows)
+        self._add_area(usecase['area_name'])
+        self.tokens += tokens
+
+    def _add_area(self, area_name):
+        if not self.areas or self.areas[-1] != area_name:
+            self.areas.append(area_name)
+
+    def flush(self, chunks):
+        if self.empty:
+            return
+        data = {"process_steps": self.steps, "use_cases": self.usecases}
+        if self.with_relevance:
+            data["usecase_step_relevance"] = self.relevance
+        chunks.append(Chunk(data, self.tokens, list(dict.fromkeys(self.areas))))
+        self.reset()
+
+
+def chunk_prepared_data(prepared, step_tokens, usecase_tokens, usecase_step_ids, max_tokens, compact=False):
+    """
+    Splits collect_data_prep output into chunks of the same shape and at
+    most max_tokens each, sized as JSON or, if compact, as compact tables
+    with every value inline: encode() only swaps a value for a ref where
+    that saves more than its refs table row costs, so a chunk encodes to
+    no more than that. step_tokens and usecase_tokens must be sized the
+    same way (see build_chunks).
+    Steps are ordered by area, and every step travels with its use cases and
+    their relevance rows, so chunks hold whole steps where they fit. A
+    larger step is split over several chunks that each repeat the step
+    itself; a single use case over max_tokens gets its own chunk.
+    """
+    relevance = defaultdict(list)
+    for usecase_id, row in prepared.relevance_links:
+        relevance[usecase_id].append(row)
+    with_relevance = "usecase_step_relevance" in prepared.data
+
+    units = {}
+    for step in prepared.data["process_steps"]:
+        units.setdefault((step["area_name"], step["id"]), [None, []])[0] = step
+    for usecase in prepared.data["use_cases"]:
+        units.setdefault((usecase["area_name"], usecase_step_ids.get(usecase["id"])), [None, []])[1].append(usecase)
+
+    count = token_count_service.count_tokens
+    if compact:
+        base_tokens = compact_format_service.overhead_tokens(compact_format_service.sections_of(prepared.data), {})
+    else:
+        base_tokens = token_count_service.count_short_tokens('{"process_steps": [], "use_cases": []}')
+        if with_relevance:
+            base_tokens += token_count_service.count_short_tokens(', "usecase_step_relevance": []')
+
+    chunks = []
+    builder = _ChunkBuilder(base_tokens, with_relevance)
+    for key in sorted(units, key=lambda k: (k[0] or '', k[1] is None, k[1] or 0)):
+        step, usecases = units[key]
+        step_cost = step_tokens.get(step["id"], 0) if step else 0
+        atoms = []
+        for usecase in usecases:
+            rows = relevance.get(usecase["id"], [])
+            if compact:
+                row_cost = sum(compact_format_service.row_tokens(list(row.values()), {}) for row in rows)
+            else:
+                row_cost = sum(count(json.dumps(row, default=str)) + 1 for row in rows)
+            cost = usecase_tokens.get(usecase["id"], 0) + row_cost
+            atoms.append((usecase, rows, cost))
+        unit_cost = step_cost + sum(cost for _, _, cost in atoms)
+
+        if builder.tokens + unit_cost > max_tokens:
+            builder.flush(chunks)
+        if builder.tokens + unit_cost <= max_tokens:
+            if step:
+                builder.add_step(step, step_cost)
+            for usecase, rows, cost in atoms:
+                builder.add_usecase(usecase, rows, cost)
+            continue
+
+        # Too large for one chunk: split by use case, repeating the step in every part.
+        for usecase, rows, cost in atoms:
+            if not builder.empty and builder.tokens + cost > max_tokens:
+                builder.flush(chunks)
+            if builder.empty and step:
+                builder.add_step(step, step_cost)
+            builder.add_usecase(usecase, rows, cost)
+        if not atoms and step:
+            builder.add_step(step, step_cost)
+        builder.flush(chunks)
+    builder.flush(chunks)
+    return chunks
+
+
+def build_chunks(db_session, selection, max_tokens):
+    prepared = llm_service.collect_data_prep(db_session, selection)
+    # Each chunk picks its own refs, so size rows inline rather than with the selection's refs.
+    step_tokens, usecase_tokens = llm_service.data_prep_item_tokens(
+        db_session, selection, prepared.steps, prepared.usecases, refs={}
+    )
+    usecase_step_ids = dict(db_session.query(UseCase.id, UseCase.process_step_id))
+    return chunk_prepared_data(
+        prepared, step_tokens, usecase_tokens, usecase_step_ids, max_tokens, compact=selection.get("compact", False)
+    )
+
+
+def _map_message(question, chunk, index, total, compact=False):
+    data = compact_format_service.encode(chunk.data) if compact else json.dumps(chunk.data, ensure_ascii=False, default=str)
+    if total == 1:
+        return f"Question: {question}\n\nData:\n{data}"
+    return f"Question: {question}\n\nData (part {index} of {total}, areas: {', '.join(chunk.areas)}):\n{data}"
+
+
+def _reduce_message(question, findings):
+    parts = "\n\n".join(f"--- Findings {i} ---\n{text}" for i, text in enumerate(findings, 1))
+    return f"Question: {question}\n\nFindings from {len(findings)} parts of the data:\n\n{parts}"
+
+
+def _group_findings(findings, max_tokens):
+    """Packs findings in order into groups of at most max_tokens (at least one finding each)."""
+    groups, current, used = [], [], 0
+    for text in findings:
+        tokens = token_count_service.count_tokens(text)
+        if current and used + tokens > max_tokens:
+            groups.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _write_report(path, params, answer, chunks, findings, errors):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"# {params['question']}\n\n{answer or '(no answer)'}\n\n---\n\n")
+        f.write(f"Model: {params['model']}. Data split into {len(chunks)} part(s)")
+        f.write(f", {len(errors)} failed.\n" if errors else ".\n")
+        for error in errors:
+            f.write(f"- {error}\n")
+        if len(chunks) > 1:
+            f.write("\n## Findings per part\n")
+            for index, chunk in enumerate(chunks, 1):
+                text = findings.get(index)
+                f.write(f"\n### Part {index} ({', '.join(chunk.areas)}, ~{chunk.tokens} tokens)\n\n")
+                f.write(f"{text if text is not None else '(failed)'}\n")
+
+
+def run_map_reduce(params, artifact_dir, progress):
+    """
+    Answers params['question'] over a data prep selection of any size. The
+    data is split into chunks that fit the model's context window (see
+    chunk_prepared_data), every chunk is asked on LLM_MAP_REDUCE_CONCURRENCY
+    threads behind the provider's rate limiter (map), and the findings are
+    merged, in rounds if they do not fit one call (reduce). The answer and
+    the findings per part are written to a Markdown report.
+    """
+    app = current_app._get_current_object()
+    model_name = params['model']
+    question = params['question']
+    use_cache = params.get('use_cache', True)
+    max_tokens = chunk_token_budget(model_name, params.get('chunk_tokens'))
+    compact = params['selection'].get('compact', False)
+
+    session = SessionLocal.session_factory()
+    try:
+        chunks = build_chunks(session, params['selection'], max_tokens)
+        session.rollback()
+    finally:
+        session.close()
+    if not chunks:
+        return {"success": False, "message": "The selection holds no data.", "skipped_errors_details": []}
+
+    limiter = enrichment_service.get_rate_limiter(model_name.split('-', 1)[0].lower())
+    max_retries = app.config.get('ENRICHMENT_MAX_RETRIES', 2)
+    workers = max(1, min(app.config.get('LLM_MAP_REDUCE_CONCURRENCY', 8), len(chunks)))
+    errors, findings = [], {}
+    calls = 0
+
+    def ask(system_prompt, user_message):
+        return enrichment_service.generate_with_retries(
+            app, params['user_id'], limiter, model_name, system_prompt, user_message, max_retries, use_cache
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        system_prompt = DIRECT_SYSTEM_PROMPT if len(chunks) == 1 else MAP_SYSTEM_PROMPT
+        futures = [
+            executor.submit(ask, system_prompt, _map_message(question, chunk, index, len(chunks), compact))
+            for index, chunk in enumerate(chunks, 1)
+        ]
+        for index, (chunk, future) in enumerate(zip(chunks, futures), 1):
+            result = future.result()
+            text = (result.get('message') or '').strip() if result.get('success') else ''
+            if text:
+                findings[index] = text
+            else:
+                errors.append(f"Part {index} ({', '.join(chunk.areas)}): {result.get('message') or 'empty response'}")
+            calls += 1
+            progress(calls, errors=len(errors))
+
+        if len(chunks) == 1:
+            answer = findings.get(1)
+        else:
+            relevant = [text for _, text in sorted(findings.items()) if text.strip().strip('.').upper() != NO_RELEVANT_DATA]
+            answer = None if relevant else ("None of the data is relevant to the question." if findings else None)
+            while relevant and answer is None:
+                groups = _group_findings(relevant, max_tokens)
+                results = list(executor.map(lambda group: ask(REDUCE_SYSTEM_PROMPT, _reduce_message(question, group)), groups))
+                calls += len(groups)
+                progress(calls, errors=len(errors))
+                failed = [result.get('message') for result in results if not result.get('success')]
+                if failed:
+                    errors.append(f"Merging the findings failed: {failed[0]}")
+                    break
+                merged = [(result.get('message') or '').strip() for result in results]
+                if len(groups) == 1:
+                    answer = merged[0]
+                elif len(merged) >= len(relevant):
+                    # Findings too large to pair up; merging again would not shrink them.
+                    answer = "\n\n".join(merged)
+                else:
+                    relevant = merged
+
+    report_name = f"llm_answer_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
+    report_path = os.path.join(artifact_dir, report_name)
+    _write_report(report_path, params, answer, chunks, findings, errors)
+
+    message = f"Answered from {len(chunks)} part(s) of the data with {model_name}."
+    if errors:
+        message += f" {len(errors)} call(s) failed; the answer may be incomplete."
+    return {
+        "success": bool(answer),
+        "message": message if answer else f"No answer: {errors[0] if errors else 'empty response'}",
+        "answer": answer,
+        "chunks": len(chunks),
+        "skipped_errors_details": errors,
+        "artifact_path": report_path,
+        "artifact_name": report_name
+    }
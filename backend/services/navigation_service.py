@@ -0,0 +1,45 @@
+# backend/services/navigation_service.py
+import hashlib
+import json
+import threading
+
+from sqlalchemy.orm import Session
+
+from . import directory_service
+
+# Per-worker snapshot: (catalog version, etag, encoded JSON body)
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def _build_navigation_payload(db_session: Session):
+    flat = directory_service.get_breadcrumb_data(db_session)
+    return {
+        'areas': flat['all_areas_flat'],
+        'steps': flat['all_steps_flat'],
+        'usecases': flat['all_usecases_flat'],
+    }
+
+
+def get_navigation_snapshot(db_session: Session):
+    """
+    Returns (etag, body) for the navigation data used by the breadcrumbs.
+    The encoded body is rebuilt only when the catalog version has changed
+    since the last build in this worker.
+    """
+    global _snapshot
+    version = directory_service.get_directory(db_session).version
+
+    snapshot = _snapshot
+    if snapshot is not None and snapshot[0] == version:
+        return snapshot[1], snapshot[2]
+
+    with _snapshot_lock:
+        snapshot = _snapshot
+        if snapshot is None or snapshot[0] != version:
+            payload = _build_navigation_payload(db_session)
+            body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+            etag = hashlib.sha1(body).hexdigest()
+            snapshot = (version, etag, body)
+            _snapshot = snapshot
+    return snapshot[1], snapshot[2]
@@ -1,12 +1,13 @@
 # backend/services/relevance_service.py
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 import markdown
 from ..models import (
-    UseCase, ProcessStep, Area,
+    UseCase,
     UsecaseAreaRelevance, UsecaseStepRelevance, UsecaseUsecaseRelevance,
     ProcessStepProcessStepRelevance
 )
+from . import directory_service
 
 def add_relevance_link(session: Session, source_usecase_id: int, target_id: int, score: int, content: str, link_type: str):
     """Generic function to add a relevance link."""
@@ -73,11 +74,9 @@ def add_step_to_step_relevance_link(session: Session, source_step_id: int, targe
 
 def get_relevance_graph_data(session: Session):
     """Prepares data for the ECharts relevance graph."""
-    areas = session.query(Area).order_by(Area.name).all()
-    steps = session.query(ProcessStep).options(
-        joinedload(ProcessStep.area),
-        joinedload(ProcessStep.use_cases)
-    ).order_by(ProcessStep.area_id, ProcessStep.name).all()
+    directory = directory_service.get_directory(session)
+    areas = directory.areas
+    steps = sorted(directory.steps, key=lambda step: step.area_id)
     relevances = session.query(ProcessStepProcessStepRelevance).all()
 
     echarts_categories = []
@@ -102,7 +101,7 @@ def get_relevance_graph_data(session: Session):
             print(f"Warning: Process step {step.name} (ID: {step.id}) has no valid area or area not found. Skipping node.")
             continue
 
-        num_use_cases = len(step.use_cases) if step.use_cases else 0
+        num_use_cases = len(directory.usecases_in_step(step.id))
         symbol_size = 15 + (num_use_cases * 1.5)
 
         node_display_name = step.name
@@ -119,7 +118,7 @@ def get_relevance_graph_data(session: Session):
                 'formatter': (
                     f'<strong>{step.name}</strong><br>'
                     f'BI_ID: {step.bi_id}<br>'
-                    f'Area: {step.area.name if step.area else "N/A"}<br>'
+                    f'Area: {directory.area_name(step.area_id)}<br>'
                     f'Use Cases: {num_use_cases}<br>'
                     f'<i>Click for details</i>'
                 )
@@ -0,0 +1,385 @@
+# backend/services/restore_service.py
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from passlib.hash import pbkdf2_sha256
+from sqlalchemy import DateTime, insert, select, text, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models import (
+    User, Area, ProcessStep, UseCase, LLMSettings,
+    UsecaseAreaRelevance, UsecaseStepRelevance, UsecaseUsecaseRelevance,
+    ProcessStepProcessStepRelevance
+)
+from . import data_management_service, data_version_service
+
+# Rows per spooled batch file; every batch is committed (and checkpointed) on its own.
+RESTORE_BATCH_SIZE = 5000
+RESTORE_WORKERS = 4
+CHECKPOINT_FILE = 'checkpoint.json'
+DEFAULT_PASSWORD = 'imported_default_password'
+
+# Export table key -> (model, {foreign key column: referenced table key}).
+RESTORE_TABLES = {
+    "users": (User, {}),
+    "areas": (Area, {}),
+    "process_steps": (ProcessStep, {"area_id": "areas"}),
+    "use_cases": (UseCase, {"process_step_id": "process_steps"}),
+    "llm_settings": (LLMSettings, {"user_id": "users"}),
+    "usecase_area_relevance": (UsecaseAreaRelevance, {
+        "source_usecase_id": "use_cases", "target_area_id": "areas"}),
+    "usecase_step_relevance": (UsecaseStepRelevance, {
+        "source_usecase_id": "use_cases", "target_process_step_id": "process_steps"}),
+    "usecase_usecase_relevance": (UsecaseUsecaseRelevance, {
+        "source_usecase_id": "use_cases", "target_usecase_id": "use_cases"}),
+    "process_step_process_step_relevance": (ProcessStepProcessStepRelevance, {
+        "source_process_step_id": "process_steps", "target_process_step_id": "process_steps"}),
+}
+
+# Relevance tables forbid linking a row to itself (CheckConstraint).
+_SELF_LINK_COLUMNS = {
+    "usecase_usecase_relevance": ("source_usecase_id", "target_usecase_id"),
+    "process_step_process_step_relevance": ("source_process_step_id", "target_process_step_id"),
+}
+
+
+def restore_levels():
+    """
+    Groups RESTORE_TABLES into levels: every table only references tables of
+    earlier levels, so the tables of one level can be loaded concurrently.
+    """
+    levels, placed = [], set()
+    remaining = list(RESTORE_TABLES)
+    while remaining:
+        level = [key for key in remaining if set(RESTORE_TABLES[key][1].values()) <= placed]
+        levels.append(level)
+        placed.update(level)
+        remaining = [key for key in remaining if key not in placed]
+    return levels
+
+
+class RestoreCheckpoint:
+    """
+    Resume marker kept in the work directory. Records the source file it was
+    made for, the spooled batches per table and which of them are committed.
+    Saved atomically after every committed batch; safe to update from threads.
+    """
+
+    def __init__(self, path, state):
+        self.path = path
+        self.state = state
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, work_dir):
+        path = os.path.join(work_dir, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return cls(path, json.load(f))
+
+    @classmethod
+    def create(cls, work_dir, source):
+        stat = os.stat(source)
+        return cls(os.path.join(work_dir, CHECKPOINT_FILE), {
+            "source": os.path.abspath(source),
+            "source_size": stat.st_size,
+            "source_mtime": stat.st_mtime,
+            "spooled": False,
+            "loading": False,
+            "tables": {}
+        })
+
+    def matches(self, source):
+        stat = os.stat(source)
+        return (self.state["source"] == os.path.abspath(source)
+                and self.state["source_size"] == stat.st_size
+                and self.state["source_mtime"] == stat.st_mtime)
+
+    def save(self):
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def mark_batch_done(self, key, batch_no, inserted, skipped):
+        with self._lock:
+            table = self.state["tables"][key]
+            table["done"].append(batch_no)
+            table["inserted"] += inserted
+            table["skipped"] += skipped
+        self.save()
+
+    def pending_batches(self, key):
+        table = self.state["tables"].get(key)
+        if not table:
+            return []
+        done = set(table["done"])
+        return [batch_no for batch_no in range(table["batches"]) if batch_no not in done]
+
+
+def _batch_path(work_dir, key, batch_no):
+    return os.path.join(work_dir, key, f"{batch_no:06d}.ndjson")
+
+
+def spool_export(source, work_dir, checkpoint, batch_size=RESTORE_BATCH_SIZE):
+    """
+    Splits the export at source (any layout read_database_export accepts) into
+    per-table NDJSON batch files under work_dir. This is the only sequential
+    pass over the file; loading then works from the batch files.
+    """
+    with open(source, 'rb') as f:
+        metadata, tables = data_management_service.read_database_export(f)
+        if metadata.get("delta"):
+            raise ValueError("This is a delta export; apply it through the data management import instead.")
+        for key, rows in tables:
+            if key not in RESTORE_TABLES:
+                print(f"Skipping table '{key}' in export file.")
+                for _ in rows:
+                    pass
+                continue
+            table_dir = os.path.join(work_dir, key)
+            shutil.rmtree(table_dir, ignore_errors=True)
+            os.makedirs(table_dir)
+            batches = row_count = 0
+            for batch in data_management_service._batched(rows, batch_size):
+                with open(_batch_path(work_dir, key, batches), 'w', encoding='utf-8') as out:
+                    for row in batch:
+                        out.write(json.dumps(row))
+                        out.write('\n')
+                batches += 1
+                row_count += len(batch)
+            checkpoint.state["tables"][key] = {
+                "rows": row_count, "batches": batches, "done": [], "inserted": 0, "skipped": 0
+            }
+            print(f"Spooled {row_count} rows of {key} into {batches} batch(es).")
+    checkpoint.state["spooled"] = True
+    checkpoint.save()
+    return metadata
+
+
+def _insert_statement(table, dialect_name):
+    """INSERT that skips rows already present (same id), which makes replaying a batch harmless."""
+    if dialect_name == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect_name == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+
+def _prepare_batch(key, rows, parent_ids, default_password):
+    """
+    Keeps the exported ids and drops rows that would violate a constraint of
+    the empty target: references to missing parents and self links.
+    Returns (mappings, skipped count).
+    """
+    model, foreign_keys = RESTORE_TABLES[key]
+    table = model.__table__
+    columns = {c.name for c in table.columns}
+    datetime_columns = {c.name for c in table.columns if isinstance(c.type, DateTime)}
+    stamped_columns = data_management_service._stamped_columns(table)
+    now = datetime.now(timezone.utc)
+    self_link = _SELF_LINK_COLUMNS.get(key)
+
+    def missing_parent(row):
+        for column, parent in foreign_keys.items():
+            value = row.get(column)
+            if value is None and table.c[column].nullable:
+                continue
+            if value not in parent_ids[parent]:
+                return True
+        return False
+
+    mappings, skipped = [], 0
+    for row in rows:
+        if missing_parent(row):
+            skipped += 1
+            continue
+        if self_link and row.get(self_link[0]) == row.get(self_link[1]):
+            skipped += 1
+            continue
+        mapping = {k: v for k, v in row.items() if k in columns}
+        data_management_service._parse_datetimes(mapping, datetime_columns, stamped_columns, now)
+        if key == "users" and not mapping.get("password"):
+            mapping["password"] = default_password
+        mappings.append(mapping)
+    return data_management_service._normalize_keys(mappings), skipped
+
+
+class _TableStats:
+    """Throughput of one table in the current run (resumed batches excluded)."""
+
+    def __init__(self):
+        self.inserted = 0
+        self.skipped = 0
+        self.started = None
+        self.finished = None
+        self.pending = 0
+
+
+def _load_batch(engine, checkpoint, work_dir, key, batch_no, parent_ids, default_password, stats, stats_lock):
+    with stats_lock:
+        if stats.started is None:
+            stats.started = time.monotonic()
+    with open(_batch_path(work_dir, key, batch_no), encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    mappings, skipped = _prepare_batch(key, rows, parent_ids, default_password)
+
+    table = RESTORE_TABLES[key][0].__table__
+    inserted = 0
+    if mappings:
+        with engine.begin() as conn:
+            result = conn.execute(_insert_statement(table, engine.dialect.name), mappings)
+        # Rows of a replayed batch that were already committed are not counted again.
+        inserted = result.rowcount if result.rowcount >= 0 else len(mappings)
+    checkpoint.mark_batch_done(key, batch_no, inserted, skipped)
+
+    with stats_lock:
+        stats.inserted += inserted
+        stats.skipped += skipped
+        stats.pending -= 1
+        if stats.pending == 0:
+            stats.finished = time.monotonic()
+            _report_table(key, stats)
+
+
+def _report_table(key, stats):
+    elapsed = max(stats.finished - stats.started, 1e-6)
+    message = f"  {key}: {stats.inserted} rows in {elapsed:.2f}s ({stats.inserted / elapsed:,.0f} rows/s)"
+    if stats.skipped:
+        message += f", {stats.skipped} skipped"
+    print(message)
+
+
+def _load_parent_ids(engine, keys):
+    with engine.connect() as conn:
+        return {key: set(conn.execute(select(RESTORE_TABLES[key][0].__table__.c.id)).scalars()) for key in keys}
+
+
+def clear_tables(engine):
+    """
+    Empties every restored table (and the stored Flask sessions) in one
+    transaction. Nothing cascades into background_jobs, drafts or
+    llm_conversations: users are deleted row by row instead, so their foreign
+    key actions apply. Jobs stay (without an owner); drafts and conversations
+    of the replaced accounts go, as the restored ids may belong to others.
+    """
+    with engine.begin() as conn:
+        if engine.dialect.has_table(conn, 'flask_sessions'):
+            conn.execute(text("DELETE FROM flask_sessions"))
+        data_management_service.truncate_tables(conn, engine.dialect.name, data_management_service.IMPORT_CLEARED_TABLES)
+        conn.execute(text(f"DELETE FROM {User.__tablename__}"))
+
+
+def tables_with_data(engine):
+    with engine.connect() as conn:
+        return [
+            key for key, (model, _) in RESTORE_TABLES.items()
+            if conn.execute(select(func.count()).select_from(model.__table__)).scalar()
+        ]
+
+
+def reset_sequences(engine):
+    """Moves the PostgreSQL id sequences past the restored ids (no-op elsewhere)."""
+    if engine.dialect.name != 'postgresql':
+        return
+    with engine.begin() as conn:
+        for model, _ in RESTORE_TABLES.values():
+            table_name = model.__tablename__
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table_name}', 'id'), "
+                f"COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table_name}"
+            ))
+
+
+def restore_database(engine, source, work_dir, workers=RESTORE_WORKERS, batch_size=RESTORE_BATCH_SIZE,
+                     clear=True, restart=False):
+    """
+    Restores a full export at source into the database behind engine, keeping
+    the exported ids. The export is spooled into batch files under work_dir,
+    then the tables of each dependency level are loaded by up to `workers`
+    threads, one committed transaction per batch. A run that stops part way
+    resumes from the checkpoint in work_dir on the next call with the same
+    source; restart=True discards it. Returns {table: (inserted, skipped)}.
+    """
+    if engine.dialect.name == 'sqlite':
+        workers = 1  # SQLite allows a single writer.
+
+    checkpoint = None if restart else RestoreCheckpoint.load(work_dir)
+    if checkpoint is not None and not checkpoint.matches(source):
+        raise ValueError(
+            f"{work_dir} holds a checkpoint for {checkpoint.state['source']}; "
+            "use another work directory or restart."
+        )
+    resuming = checkpoint is not None and checkpoint.state["loading"]
+
+    if not resuming:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+        checkpoint = RestoreCheckpoint.create(work_dir, source)
+        started = time.monotonic()
+        spool_export(source, work_dir, checkpoint, batch_size)
+        print(f"Export spooled in {time.monotonic() - started:.2f}s.")
+
+        if clear:
+            print("Clearing existing data...")
+            clear_tables(engine)
+        else:
+            non_empty = tables_with_data(engine)
+            if non_empty:
+                raise ValueError(f"Target tables are not empty ({', '.join(non_empty)}); restore into a fresh database or clear it.")
+        checkpoint.state["loading"] = True
+        checkpoint.save()
+    else:
+        print(f"Resuming restore of {source} from {checkpoint.path}.")
+
+    default_password = pbkdf2_sha256.hash(DEFAULT_PASSWORD)
+    run_stats = {}
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for level in restore_levels():
+            parents = {parent for key in level for parent in RESTORE_TABLES[key][1].values()}
+            parent_ids = _load_parent_ids(engine, parents)
+            stats_lock = threading.Lock()
+            futures = []
+            for key in level:
+                table_state = checkpoint.state["tables"].get(key)
+                if not table_state:
+                    continue
+                stats = _TableStats()
+                run_stats[key] = stats
+                pending = checkpoint.pending_batches(key)
+                stats.pending = len(pending)
+                if not pending:
+                    print(f"  {key}: {'already restored' if table_state['batches'] else 'no rows'}.")
+                    continue
+                for batch_no in pending:
+                    futures.append(executor.submit(
+                        _load_batch, engine, checkpoint, work_dir, key, batch_no,
+                        parent_ids, default_password, stats, stats_lock
+                    ))
+            # A level must be committed before the next one references it.
+            for future in futures:
+                future.result()
+
+    reset_sequences(engine)
+    session = Session(bind=engine)
+    try:
+        data_version_service.mark_changed(session, data_version_service.CATALOG, data_version_service.LLM_SETTINGS)
+        session.commit()
+    finally:
+        session.close()
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    total = sum(stats.inserted for stats in run_stats.values())
+    print(f"Restored {total} rows in {elapsed:.2f}s ({total / elapsed:,.0f} rows/s).")
+    results = {key: (table["inserted"], table["skipped"]) for key, table in checkpoint.state["tables"].items()}
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return results
@@ -2,6 +2,7 @@
 from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy.exc import IntegrityError
 from ..models import ProcessStep, UseCase, Area, UsecaseStepRelevance, ProcessStepProcessStepRelevance
+from . import directory_service
 
 def get_all_steps_with_details(db_session: Session):
     """Retrieves all process steps, preloading area and use case data."""
@@ -29,8 +30,8 @@ def get_step_by_id(db_session: Session, step_id: int):
     ).get(step_id)
 
 def get_all_other_steps(db_session: Session, step_id: int):
-    """Gets all steps except the one with the given ID."""
-    return db_session.query(ProcessStep).filter(ProcessStep.id != step_id).order_by(ProcessStep.name).all()
+    """Gets all steps except the one with the given ID (directory entries, sorted by name)."""
+    return [step for step in directory_service.get_directory(db_session).steps if step.id != step_id]
 
 def update_step_from_form(db_session: Session, step: ProcessStep, form_data: dict):
     """Updates a ProcessStep object from form data."""
@@ -0,0 +1,139 @@
+# backend/services/tag_service.py
+import threading
+
+from sqlalchemy import event, insert, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from ..models import Tag
+
+TAG_CONSTRAINT = 'unique_name_category_in_tags'
+# (name, category) pairs per INSERT/SELECT round trip.
+TAG_BATCH_SIZE = 500
+
+# Per-worker (name, category) -> tag id. Tags are never deleted, so ids stay valid.
+_tag_ids = {}
+_tag_ids_lock = threading.Lock()
+_warmed = False
+
+# Tags created in a transaction that has not committed yet, kept per session.
+_PENDING_TAGS_KEY = 'tag_service_pending_ids'
+
+_listeners_lock = threading.Lock()
+_listeners_registered = False
+
+
+def parse_tag_names(tag_input):
+    """Unique, stripped names from a comma-separated string or a list, in input order."""
+    if isinstance(tag_input, str):
+        names = (name.strip() for name in tag_input.split(','))
+    elif isinstance(tag_input, list):
+        names = (str(name).strip() for name in tag_input)
+    else:
+        return []
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def warm_cache(db_session: Session):
+    """Loads every tag id into the worker cache (one query)."""
+    global _warmed
+    rows = db_session.execute(select(Tag.id, Tag.name, Tag.category)).all()
+    with _tag_ids_lock:
+        _tag_ids.update(((row.name, row.category), row.id) for row in rows)
+        _warmed = True
+    return len(rows)
+
+
+def _insert_missing(db_session: Session, pairs):
+    """Batched get-or-create inside the session's transaction. Returns {pair: id}."""
+    dialect = db_session.get_bind().dialect.name
+    table = Tag.__table__
+    rows = [{'name': name, 'category': category} for name, category in pairs]
+    if dialect == 'postgresql':
+        db_session.execute(postgresql.insert(table).on_conflict_do_nothing(constraint=TAG_CONSTRAINT), rows)
+    elif dialect == 'sqlite':
+        db_session.execute(sqlite.insert(table).on_conflict_do_nothing(index_elements=['name', 'category']), rows)
+    else:
+        existing = {
+            (row.name, row.category)
+            for row in db_session.execute(
+                select(Tag.name, Tag.category).where(tuple_(Tag.name, Tag.category).in_(pairs))
+            )
+        }
+        missing = [row for row in rows if (row['name'], row['category']) not in existing]
+        if missing:
+            db_session.execute(insert(table), missing)
+    # Rows inserted concurrently by another transaction are picked up here too.
+    return {
+        (row.name, row.category): row.id
+        for row in db_session.execute(
+            select(Tag.id, Tag.name, Tag.category).where(tuple_(Tag.name, Tag.category).in_(pairs))
+        )
+    }
+
+
+def resolve_tag_ids(db_session: Session, pairs):
+    """
+    Maps (name, category) pairs to tag ids, creating the missing tags with
+    INSERT ... ON CONFLICT DO NOTHING in db_session's transaction. Known
+    pairs are a dictionary lookup; ids of new tags become visible to other
+    requests once that transaction commits.
+    """
+    if not _warmed:
+        warm_cache(db_session)
+    pending = db_session.info.get(_PENDING_TAGS_KEY, {})
+    result, missing = {}, []
+    for pair in dict.fromkeys(pairs):
+        tag_id = _tag_ids.get(pair) or pending.get(pair)
+        if tag_id is None:
+            missing.append(pair)
+        else:
+            result[pair] = tag_id
+
+    for start in range(0, len(missing), TAG_BATCH_SIZE):
+        created = _insert_missing(db_session, missing[start:start + TAG_BATCH_SIZE])
+        db_session.info.setdefault(_PENDING_TAGS_KEY, {}).update(created)
+        result.update(created)
+    return result
+
+
+def get_or_create_tags(db_session: Session, tag_input, category: str):
+    """
+    Tag instances (attached to db_session) for a comma-separated string or a
+    list of names. Resolves through the id cache and attaches the tags
+    without loading them, so no per-save Tag queries are needed.
+    """
+    names = parse_tag_names(tag_input)
+    if not names:
+        return []
+    tag_ids = resolve_tag_ids(db_session, [(name, category) for name in names])
+    tags = []
+    for name in names:
+        tag = Tag(id=tag_ids[(name, category)], name=name, category=category)
+        make_transient_to_detached(tag)
+        tags.append(db_session.merge(tag, load=False))
+    return tags
+
+
+# --- Session event listeners ---
+
+def _after_commit(session):
+    pending = session.info.pop(_PENDING_TAGS_KEY, None)
+    if pending:
+        with _tag_ids_lock:
+            _tag_ids.update(pending)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_TAGS_KEY, None)
+
+
+def register_listeners():
+    """Publishes tags created in a session to the worker cache when it commits (idempotent)."""
+    global _listeners_registered
+    with _listeners_lock:
+        if _listeners_registered:
+            return
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+        _listeners_registered = True
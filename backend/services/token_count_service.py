@@ -0,0 +1,177 @@
+# backend/services/token_count_service.py
+import json
+import threading
+import time
+import traceback
+from datetime import timezone
+from functools import lru_cache
+
+import tiktoken
+from sqlalchemy.orm import Session
+
+from ..models import ProcessStep, TokenCount, UseCase
+
+DEFAULT_ENCODING = 'cl100k_base'
+# Stored as the encoding of counts estimated as characters / 4, so they are recounted once tiktoken loads.
+FALLBACK_ENCODING = 'chars/4'
+# Seconds before loading an encoding that failed (e.g. offline) is tried again.
+ENCODER_RETRY_SECONDS = 300
+
+ENTITY_MODELS = {
+    'process_step': ProcessStep,
+    'use_case': UseCase,
+}
+
+# Entities recounted per query when stored counts are missing or stale.
+REFRESH_BATCH_SIZE = 500
+# Counts of a field's compact_format_service cell are stored next to its JSON count under this prefix.
+COMPACT_KEY_PREFIX = '~'
+
+
+_encoders = {}
+_encoder_failures = {}  # name -> time.monotonic() of the last failed load
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(name=DEFAULT_ENCODING):
+    """
+    tiktoken encoding, loaded once per process. None while it cannot be
+    loaded (e.g. offline); the load is retried every ENCODER_RETRY_SECONDS.
+    """
+    encoder = _encoders.get(name)
+    if encoder is not None:
+        return encoder
+    with _encoders_lock:
+        encoder = _encoders.get(name)
+        if encoder is not None:
+            return encoder
+        failed_at = _encoder_failures.get(name)
+        if failed_at is not None and time.monotonic() - failed_at < ENCODER_RETRY_SECONDS:
+            return None
+        try:
+            encoder = _encoders[name] = tiktoken.get_encoding(name)
+        except Exception as e:
+            _encoder_failures[name] = time.monotonic()
+            print(f"Could not load tiktoken encoding '{name}', estimating tokens as characters / 4: {e}")
+            return None
+        _encoder_failures.pop(name, None)
+        return encoder
+
+
+def counting_encoding(encoding=DEFAULT_ENCODING):
+    """What counts are made with right now: encoding, or FALLBACK_ENCODING while it cannot be loaded."""
+    return encoding if get_encoder(encoding) is not None else FALLBACK_ENCODING
+
+
+def count_tokens(text, encoding=DEFAULT_ENCODING):
+    encoder = get_encoder(encoding)
+    if encoder is None:
+        return len(text) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def count_short_tokens(text, encoding=DEFAULT_ENCODING):
+    """count_tokens for short, often repeated strings (names, ids); memoized."""
+    return _count_short_tokens(text, counting_encoding(encoding))
+
+
+@lru_cache(maxsize=8192)
+def _count_short_tokens(text, counted_as):
+    # Keyed by counted_as, so estimates are not served once the encoder has loaded.
+    if counted_as == FALLBACK_ENCODING:
+        return len(text) // 4
+    return count_tokens(text, counted_as)
+
+
+def field_fragment(field, value):
+    """The text a field adds to the data prep JSON: ', "field": value'."""
+    return f", {json.dumps(field)}: {json.dumps(value, default=str)}"
+
+
+def compact_fragment(value):
+    """The text a field adds to a compact_format_service row: ',value'."""
+    return "," + json.dumps(value, ensure_ascii=False, default=str, separators=(',', ':'))
+
+
+def _as_utc(value):
+    # SQLite hands back naive datetimes even for timezone-aware columns.
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _count_fields(entity, keys, encoding):
+    counts = {}
+    for key in keys:
+        if key.startswith(COMPACT_KEY_PREFIX):
+            counts[key] = count_tokens(compact_fragment(getattr(entity, key[len(COMPACT_KEY_PREFIX):])), encoding)
+        else:
+            counts[key] = count_tokens(field_fragment(key, getattr(entity, key)), encoding)
+    return counts
+
+
+def get_field_counts(db_session: Session, entity_type, rows, fields, encoding=DEFAULT_ENCODING, compact=False):
+    """
+    Token counts per field for rows of (entity_id, updated_at), as JSON
+    fragments or, with compact=True, as compact table cells. Stored counts
+    are used when they are current; missing or stale ones are recounted from
+    the entity and stored. Estimates stored while the encoder could not be
+    loaded count as stale once it can. Returns {entity_id: {field: tokens}}.
+    """
+    model = ENTITY_MODELS[entity_type]
+    counted_as = counting_encoding(encoding)
+    usable = {encoding, counted_as}
+    requested = list(fields)
+    keys = [COMPACT_KEY_PREFIX + field for field in requested] if compact else requested
+    updated = {entity_id: _as_utc(updated_at) for entity_id, updated_at in rows}
+    result, stale, stored = {}, [], {}
+    ids = list(updated)
+    for start in range(0, len(ids), REFRESH_BATCH_SIZE):
+        batch = ids[start:start + REFRESH_BATCH_SIZE]
+        stored.update(
+            (row.entity_id, row) for row in db_session.query(TokenCount).filter(
+                TokenCount.entity_type == entity_type, TokenCount.entity_id.in_(batch)
+            )
+        )
+    for entity_id in ids:
+        row = stored.get(entity_id)
+        counts = json.loads(row.counts) if row is not None else None
+        if (row is None or row.encoding not in usable or _as_utc(row.source_updated_at) != updated[entity_id]
+                or any(key not in counts for key in keys)):
+            stale.append(entity_id)
+        else:
+            result[entity_id] = counts
+    if not stale:
+        return _by_field(result, requested, keys)
+
+    # Recount every field already tracked for the row too, so other selections stay current.
+    for start in range(0, len(stale), REFRESH_BATCH_SIZE):
+        batch = stale[start:start + REFRESH_BATCH_SIZE]
+        for entity in db_session.query(model).filter(model.id.in_(batch)):
+            previous = stored.get(entity.id)
+            tracked = set(keys)
+            if previous is not None and previous.encoding in usable:
+                tracked.update(json.loads(previous.counts))
+            counts = _count_fields(entity, sorted(tracked), encoding)
+            result[entity.id] = counts
+            db_session.merge(TokenCount(
+                entity_type=entity_type,
+                entity_id=entity.id,
+                encoding=counted_as,
+                source_updated_at=entity.updated_at,
+                counts=json.dumps(counts)
+            ))
+    try:
+        db_session.commit()
+    except Exception:
+        # Another worker stored the same rows first; the counts are still valid.
+        db_session.rollback()
+        traceback.print_exc()
+    return _by_field(result, requested, keys)
+
+
+def _by_field(result, requested, keys):
+    return {
+        entity_id: {field: counts[key] for field, key in zip(requested, keys) if key in counts}
+        for entity_id, counts in result.items()
+    }
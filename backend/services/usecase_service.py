@@ -1,6 +1,7 @@
 # backend/services/usecase_service.py
 from sqlalchemy.orm import Session, joinedload, selectinload
-from ..models import UseCase, ProcessStep, Area, UsecaseAreaRelevance, UsecaseStepRelevance, UsecaseUsecaseRelevance, Tag
+from ..models import UseCase, ProcessStep, Area, UsecaseAreaRelevance, UsecaseStepRelevance, UsecaseUsecaseRelevance
+from . import tag_service
 
 def get_all_usecases_with_details(db_session: Session):
     return db_session.query(UseCase).options(
@@ -23,32 +24,7 @@ def get_all_other_usecases(db_session: Session, usecase_id: int):
 
 def _handle_tags(db_session: Session, tag_string: str, category: str):
     """Helper function to process a comma-separated string of tags."""
-    if not tag_string:
-        return []
-    
-    tag_names = [name.strip() for name in tag_string.split(',') if name.strip()]
-    if not tag_names:
-        return []
-    
-    # Find existing tags in one query
-    existing_tags = db_session.query(Tag).filter(
-        Tag.category == category,
-        Tag.name.in_(tag_names)
-    ).all()
-    existing_tag_names = {tag.name for tag in existing_tags}
-    
-    # Create new tags for those that don't exist
-    new_tags = [
-        Tag(name=name, category=category)
-        for name in tag_names if name not in existing_tag_names
-    ]
-    
-    # Add new tags to the session
-    if new_tags:
-        db_session.add_all(new_tags)
-        db_session.flush() # Flush to get IDs for new tags
-        
-    return existing_tags + new_tags
+    return tag_service.get_or_create_tags(db_session, tag_string, category)
 
 def update_usecase_from_form(db_session: Session, usecase: UseCase, form_data: dict):
     original_bi_id = usecase.bi_id
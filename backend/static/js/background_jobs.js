@@ -0,0 +1,74 @@
+// backend/static/js/background_jobs.js
+
+document.addEventListener('DOMContentLoaded', function() {
+    const POLL_INTERVAL_MS = 2000;
+    const table = document.getElementById('backgroundJobsTable');
+    if (!table) return;
+
+    function renderArtifact(cell, job) {
+        cell.textContent = '';
+        if (!job.artifact_url) return;
+        const link = document.createElement('a');
+        link.href = job.artifact_url;
+        link.className = 'btn btn-sm btn-outline-info';
+        link.innerHTML = '<i class="fas fa-download"></i> ';
+        link.appendChild(document.createTextNode(job.artifact_name));
+        cell.appendChild(link);
+    }
+
+    function renderMessage(cell, job) {
+        cell.textContent = job.message || '';
+        const details = job.result && job.result.skipped_errors_details;
+        if (!details || !details.length) return;
+
+        const toggle = document.createElement('details');
+        const summary = document.createElement('summary');
+        summary.textContent = `${details.length} skipped/failed item(s)`;
+        toggle.appendChild(summary);
+        const list = document.createElement('ul');
+        Array.from(new Set(details)).sort().forEach(detail => {
+            const item = document.createElement('li');
+            item.textContent = detail;
+            list.appendChild(item);
+        });
+        toggle.appendChild(list);
+        cell.appendChild(toggle);
+    }
+
+    function updateRow(row, job) {
+        row.querySelector('.job-status').textContent = job.status;
+        row.querySelector('.job-rows').textContent = job.rows_processed;
+        row.querySelector('.job-errors').textContent = job.error_count;
+        if (job.finished) {
+            row.dataset.jobFinished = 'true';
+            renderMessage(row.querySelector('.job-message'), job);
+            renderArtifact(row.querySelector('.job-artifact'), job);
+            row.classList.add(job.status === 'failed' ? 'table-danger' : (job.error_count ? 'table-warning' : 'table-success'));
+        }
+    }
+
+    function refresh() {
+        return fetch(table.dataset.listUrl, { headers: { 'Accept': 'application/json' } })
+            .then(response => response.ok ? response.json() : { jobs: [] })
+            .then(data => {
+                (data.jobs || []).forEach(job => {
+                    const row = table.querySelector(`tr[data-job-id="${job.id}"]`);
+                    if (row && (row.dataset.jobFinished === 'false' || !row.dataset.detailsLoaded)) {
+                        updateRow(row, job);
+                        if (job.finished) row.dataset.detailsLoaded = 'true';
+                    }
+                });
+            })
+            .catch(error => console.error('Error polling background jobs:', error));
+    }
+
+    // One request per interval for all jobs in the table, until every job has finished.
+    function poll() {
+        refresh().then(() => {
+            if (table.querySelector('tr[data-job-id][data-job-finished="false"]')) {
+                setTimeout(poll, POLL_INTERVAL_MS);
+            }
+        });
+    }
+    poll();
+});
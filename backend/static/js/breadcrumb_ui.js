@@ -23,7 +23,13 @@
                     throw new Error(`Network response was not ok: ${response.statusText}`);
                 }
                 const data = await response.json();
-                navDataCache = data; // Cache the successful response
+                // The API sends compact [id, name, parent_id] rows; expand them once here.
+                const expand = window.usecaseExplorer.expandEntities;
+                navDataCache = {
+                    areas: expand(data.areas),
+                    steps: expand(data.steps),
+                    usecases: expand(data.usecases)
+                }; // Cache the successful response
                 return navDataCache;
             } catch (error) {
                 console.error('Failed to fetch navigation data:', error);
@@ -71,6 +71,39 @@ export function initializeLLMChat(
         chatDisplay.scrollTop = chatDisplay.scrollHeight;
     }
 
+    /**
+     * Reads a text/event-stream response body and calls onEvent(eventName, data)
+     * for every event ('message' when unnamed), with data parsed as JSON.
+     * @param {Response} response - The fetch response whose body is the event stream.
+     * @param {function(string, Object)} onEvent - Callback; throwing aborts the read.
+     */
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        try {
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    let eventName = 'message';
+                    const dataLines = [];
+                    rawEvent.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                    });
+                    if (dataLines.length) onEvent(eventName, JSON.parse(dataLines.join('\n')));
+                }
+            }
+        } finally {
+            reader.releaseLock();
+        }
+    }
+
     function clearImageInput() {
         currentImageBase64 = null;
         currentImageMimeType = null;
@@ -276,25 +309,45 @@ export function initializeLLMChat(
             chatDisplay.scrollTop = chatDisplay.scrollHeight;
 
             try {
-                const response = await fetch('/llm/chat', {
+                const response = await fetch('/llm/chat/stream', {
                     method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
+                    headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
                     body: JSON.stringify(payload),
                 });
 
-                const data = await response.json();
-
-                if (data.success) {
-                    loadingBubble.remove();
-                    addMessageToChat('assistant', data.message);
-                } else {
-                    loadingBubble.innerHTML = `<i class="fas fa-exclamation-triangle me-2"></i>Error: ${data.message}`;
-                    loadingBubble.classList.add('chat-bubble-error'); // Add the new error class
-                    console.error('LLM Chat Error:', data.message);
+                if (!response.ok || !response.body) {
+                    const data = await response.json().catch(() => ({ message: `HTTP ${response.status}` }));
+                    throw new Error(data.message);
                 }
+
+                // The first delta replaces the "Thinking..." bubble; later ones re-render it.
+                let assistantText = '';
+                let renderPending = false;
+                const renderAssistant = () => {
+                    renderPending = false;
+                    if (loadingBubble.classList.contains('chat-bubble-error')) return;
+                    loadingBubble.innerHTML = markdownToHtml(assistantText);
+                    chatDisplay.scrollTop = chatDisplay.scrollHeight;
+                };
+
+                await readEventStream(response, (event, data) => {
+                    if (event === 'error') {
+                        throw new Error(data.message);
+                    }
+                    if (event === 'done') {
+                        assistantText = data.message;
+                        renderAssistant();
+                    } else if (data.delta) {
+                        assistantText += data.delta;
+                        if (!renderPending) {
+                            renderPending = true;
+                            requestAnimationFrame(renderAssistant);
+                        }
+                    }
+                });
             } catch (error) {
-                console.error('Network or server error:', error);
-                loadingBubble.innerHTML = `<i class="fas fa-exclamation-triangle me-2"></i>Network Error: Could not reach LLM service.`;
+                console.error('LLM Chat Error:', error);
+                loadingBubble.innerHTML = `<i class="fas fa-exclamation-triangle me-2"></i>Error: ${error.message || 'Could not reach LLM service.'}`;
                 loadingBubble.classList.add('chat-bubble-error'); // Add the new error class
             } finally {
                 sendMessageButton.disabled = false;
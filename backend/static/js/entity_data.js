@@ -0,0 +1,35 @@
+// backend/static/js/entity_data.js
+(function() {
+    'use strict';
+
+    window.usecaseExplorer = window.usecaseExplorer || {};
+
+    /**
+     * Expands the compact entity lists produced by serialize_for_js on the server
+     * ({type, parent_key, url_template, rows: [[id, name, parent_id], ...]})
+     * into the objects the UI code works with: {id, name, url, area_id | step_id}.
+     * Arrays are returned unchanged, so already-expanded data can be passed too.
+     * @param {Object|Array} compact The compact list from a data island or API.
+     * @returns {Object[]} The expanded entity objects.
+     */
+    window.usecaseExplorer.expandEntities = function(compact) {
+        if (!compact) return [];
+        if (Array.isArray(compact)) return compact;
+
+        const rows = compact.rows || [];
+        const urlTemplate = compact.url_template || '#';
+        const parentKey = compact.parent_key;
+
+        return rows.map(row => {
+            const item = {
+                id: row[0],
+                name: row[1],
+                url: urlTemplate.replace('{id}', row[0])
+            };
+            if (parentKey) {
+                item[parentKey] = row[2];
+            }
+            return item;
+        });
+    };
+})();
@@ -12,7 +12,7 @@
         // --- START REFACTOR: Read data from the data island ---
         const dataIsland = document.getElementById('page-data-island');
         const pageData = dataIsland ? JSON.parse(dataIsland.textContent) : {};
-        const allAreas = pageData.all_areas_for_select || [];
+        const allAreas = window.usecaseExplorer.expandEntities(pageData.all_areas_for_select);
         // --- END REFACTOR ---
 
         allTables.forEach(table => {
@@ -328,6 +328,118 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     });
 
+    // --- Live token estimate for the current selection ---
+    const liveTokenEstimate = document.getElementById('liveTokenEstimate');
+    const selectionForm = liveTokenEstimate ? liveTokenEstimate.closest('form') : null;
+    let estimateTimer = null;
+    let estimateRequest = 0;
+
+    function refreshTokenEstimate() {
+        const requestId = ++estimateRequest;
+        liveTokenEstimate.textContent = 'Estimating tokens...';
+        fetch(liveTokenEstimate.dataset.estimateUrl, { method: 'POST', body: new FormData(selectionForm) })
+            .then(response => response.json())
+            .then(data => {
+                if (requestId !== estimateRequest) return; // A newer selection is already being estimated
+                liveTokenEstimate.textContent = data.success
+                    ? `Estimated Token Count: ${data.total_tokens.toLocaleString()}`
+                    : '';
+            })
+            .catch(error => {
+                console.error('Error estimating tokens:', error);
+                if (requestId === estimateRequest) liveTokenEstimate.textContent = '';
+            });
+    }
+
+    function scheduleTokenEstimate() {
+        clearTimeout(estimateTimer);
+        estimateTimer = setTimeout(refreshTokenEstimate, 400);
+    }
+
+    if (selectionForm) {
+        selectionForm.addEventListener('change', scheduleTokenEstimate);
+        // Custom selects and the All/None buttons update hidden inputs on click, not change.
+        selectionForm.addEventListener('click', event => {
+            if (event.target.closest('.select-option, button[type="button"]')) scheduleTokenEstimate();
+        });
+    }
+
+    // --- Map-reduce question over the current selection (background job) ---
+    const selectionQuestion = document.getElementById('selectionQuestion');
+    if (selectionQuestion && selectionForm) {
+        const questionText = document.getElementById('selectionQuestionText');
+        const questionModel = document.getElementById('selectionQuestionModel');
+        const questionButton = document.getElementById('selectionQuestionButton');
+        const questionStatus = document.getElementById('selectionQuestionStatus');
+        const questionAnswer = document.getElementById('selectionQuestionAnswer');
+
+        fetch(selectionQuestion.dataset.modelsUrl)
+            .then(response => response.json())
+            .then(data => {
+                questionModel.innerHTML = '';
+                (data.models || []).forEach(model => {
+                    const option = document.createElement('option');
+                    option.value = model;
+                    option.textContent = model;
+                    questionModel.appendChild(option);
+                });
+                if (!questionModel.options.length) questionModel.innerHTML = '<option value="">No models found</option>';
+            })
+            .catch(() => { questionModel.innerHTML = '<option value="">Error loading models</option>'; });
+
+        function showJobStatus(job) {
+            if (!job.finished) {
+                questionStatus.textContent = `Running... ${job.rows_processed || 0} call(s) done`;
+                setTimeout(() => pollJob(job.status_url), 2000);
+                return;
+            }
+            questionButton.disabled = false;
+            questionStatus.textContent = job.message || job.status;
+            if (job.result && job.result.answer) {
+                questionAnswer.textContent = job.result.answer;
+                questionAnswer.style.display = 'block';
+            }
+            if (job.artifact_url) {
+                const link = document.createElement('a');
+                link.href = job.artifact_url;
+                link.className = 'ms-2';
+                link.textContent = 'Download report';
+                questionStatus.appendChild(link);
+            }
+        }
+
+        function pollJob(statusUrl) {
+            fetch(statusUrl)
+                .then(response => response.json())
+                .then(showJobStatus)
+                .catch(() => setTimeout(() => pollJob(statusUrl), 5000));
+        }
+
+        questionButton.addEventListener('click', () => {
+            const formData = new FormData(selectionForm);
+            formData.append('question', questionText.value.trim());
+            formData.append('model', questionModel.value);
+            questionButton.disabled = true;
+            questionAnswer.style.display = 'none';
+            questionStatus.textContent = 'Queuing...';
+            fetch(selectionQuestion.dataset.askUrl, { method: 'POST', body: formData })
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.success) {
+                        questionButton.disabled = false;
+                        questionStatus.textContent = data.message;
+                        return;
+                    }
+                    questionStatus.textContent = data.message;
+                    pollJob(data.status_url);
+                })
+                .catch(error => {
+                    questionButton.disabled = false;
+                    questionStatus.textContent = `Network error: ${error}`;
+                });
+        });
+    }
+
     // --- NEW: Event listeners for Select All / Clear All field checkboxes ---
     document.getElementById('selectAllStepFieldsBtn')?.addEventListener('click', () => {
         document.querySelectorAll('input[name="step_fields"]').forEach(cb => cb.checked = true);
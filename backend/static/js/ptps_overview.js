@@ -8,8 +8,8 @@
         const dataIsland = document.getElementById('ptps-page-data-island');
         const pageData = dataIsland ? JSON.parse(dataIsland.textContent) : {};
         // The page_data will contain a key 'all_steps_for_js_filtering'
-        // which has step.id, step.name, step.bi_id, step.area_id
-        const allStepsDataForJS = pageData.all_steps_for_js_filtering || []; 
+        // in the compact entity format (id, name, area_id per row)
+        const allStepsDataForJS = window.usecaseExplorer.expandEntities(pageData.all_steps_for_js_filtering);
         const initialFilterAreaId = pageData.initial_filter_area_id || 'all'; // Get from page_data
 
         const ptpAreaFilterTabs = document.getElementById('ptpAreaFilterTabs');
@@ -13,7 +13,7 @@
         const pageData = dataIsland ? JSON.parse(dataIsland.textContent) : {};
 
         const allUsecasesDataForJS = pageData.usecases || [];
-        const allStepsDataForJS = pageData.steps || [];
+        const allStepsDataForJS = window.usecaseExplorer.expandEntities(pageData.steps);
         // --- END REFACTOR ---
 
         // --- DOM Elements from usecase_overview.html ---
@@ -2,8 +2,36 @@
 import markupsafe
 import markdown
 import json
+from contextlib import contextmanager
 from flask import url_for
 
+try:
+    import fcntl
+except ImportError:  # Not on POSIX: file_lock does not lock; callers keep their state per process.
+    fcntl = None
+
+# Whether file_lock actually excludes other processes.
+FILE_LOCKS_SUPPORTED = fcntl is not None
+
+
+@contextmanager
+def file_lock(lock_path, blocking=True):
+    """Exclusive cross-process lock; yields False if non-blocking and someone else holds it."""
+    with open(lock_path, 'a') as lock_file:
+        if fcntl is None:
+            yield True
+            return
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file.fileno(), flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
 
 # --- CUSTOM JINJA FILTERS ---
 def nl2br(value):
@@ -43,30 +71,43 @@ def map_priority_to_benefit_filter(priority):
     return "N/A"
 
 # --- SERIALIZATION FOR JAVASCRIPT ---
+# item_type -> (endpoint, id argument, attribute holding the parent id, parent key on the client)
+_JS_ENTITY_TYPES = {
+    'area': ('areas.view_area', 'area_id', None, None),
+    'step': ('steps.view_step', 'step_id', 'area_id', 'area_id'),
+    'usecase': ('usecases.view_usecase', 'usecase_id', 'process_step_id', 'step_id'),
+}
+_URL_ID_SENTINEL = 987654321
+
+
+def entity_url_template(item_type):
+    """
+    Returns the detail-page URL for item_type with '{id}' in place of the id,
+    built with a single url_for call. Falls back to '#' outside a request.
+    """
+    endpoint, id_arg, _, _ = _JS_ENTITY_TYPES[item_type]
+    try:
+        url = url_for(endpoint, **{id_arg: _URL_ID_SENTINEL})
+    except Exception:
+        return '#'
+    return url.replace(str(_URL_ID_SENTINEL), '{id}')
+
+
 def serialize_for_js(obj_list, item_type):
     """
-    Helper to convert query results to flat dicts for JavaScript.
-    Now lives in utils.py to avoid circular imports.
+    Helper to convert query results to the compact form used by the JavaScript
+    data islands: one URL template plus [id, name, parent_id] rows. The client
+    expands it with window.usecaseExplorer.expandEntities().
     """
-    data = []
+    _, _, parent_attr, parent_key = _JS_ENTITY_TYPES[item_type]
+    rows = []
     for obj in obj_list:
-        item_dict = {
-            'id': obj.id,
-            'name': str(obj.name) if obj.name is not None else '',
-        }
-        # Add URLs dynamically based on type
-        try:
-            if item_type == 'area':
-                item_dict['url'] = url_for('areas.view_area', area_id=obj.id)
-            elif item_type == 'step':
-                item_dict['area_id'] = obj.area_id
-                item_dict['url'] = url_for('steps.view_step', step_id=obj.id)
-            elif item_type == 'usecase':
-                item_dict['step_id'] = obj.process_step_id
-                item_dict['url'] = url_for('usecases.view_usecase', usecase_id=obj.id)
-            data.append(item_dict)
-        except Exception as url_error:
-            print(f"DEBUG: url_for failed for item {obj.id} ({obj.name}) of type {item_type}: {url_error}")
-            item_dict['url'] = '#' # Fallback URL
-            data.append(item_dict)
-    return data
\ No newline at end of file
+        name = str(obj.name) if obj.name is not None else ''
+        parent_id = getattr(obj, parent_attr) if parent_attr else None
+        rows.append([obj.id, name, parent_id])
+    return {
+        'type': item_type,
+        'parent_key': parent_key,
+        'url_template': entity_url_template(item_type),
+        'rows': rows,
+    }
@@ -0,0 +1,55 @@
+"""Add llm_conversations and llm_conversation_messages for server-side chat history
+
+Revision ID: 2c7e5a9f0b13
+Revises: 6f2b8e4d1a37
+Create Date: 2026-10-18 17:41:09.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c7e5a9f0b13'
+down_revision = '6f2b8e4d1a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('llm_conversations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('summary', sa.Text(), nullable=True),
+    sa.Column('summarized_through_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('llm_conversations', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_llm_conversations_user_id'), ['user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_llm_conversations_updated_at'), ['updated_at'], unique=False)
+
+    op.create_table('llm_conversation_messages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('conversation_id', sa.Integer(), nullable=False),
+    sa.Column('role', sa.String(length=20), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('token_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['conversation_id'], ['llm_conversations.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('llm_conversation_messages', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_llm_conversation_messages_conversation_id'), ['conversation_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('llm_conversation_messages', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_llm_conversation_messages_conversation_id'))
+    op.drop_table('llm_conversation_messages')
+    with op.batch_alter_table('llm_conversations', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_llm_conversations_updated_at'))
+        batch_op.drop_index(batch_op.f('ix_llm_conversations_user_id'))
+    op.drop_table('llm_conversations')
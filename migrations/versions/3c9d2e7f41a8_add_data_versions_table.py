@@ -0,0 +1,30 @@
+"""Add data_versions table for cache invalidation
+
+Revision ID: 3c9d2e7f41a8
+Revises: 07a86302fb43
+Create Date: 2026-10-18 09:12:44.310275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d2e7f41a8'
+down_revision = '07a86302fb43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    data_versions = op.create_table('data_versions',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(data_versions, [{'name': 'catalog', 'version': 1}])
+
+
+def downgrade():
+    op.drop_table('data_versions')
@@ -0,0 +1,31 @@
+"""Add llm_token_counts for incremental data prep token estimates
+
+Revision ID: 6f2b8e4d1a37
+Revises: d81c3f6a2b94
+Create Date: 2026-10-18 15:03:26.551840
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f2b8e4d1a37'
+down_revision = 'd81c3f6a2b94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('llm_token_counts',
+    sa.Column('entity_type', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('encoding', sa.String(length=50), nullable=False),
+    sa.Column('source_updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('counts', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('entity_type', 'entity_id')
+    )
+
+
+def downgrade():
+    op.drop_table('llm_token_counts')
@@ -0,0 +1,42 @@
+"""Add areas.updated_at and deleted_records tombstones for delta exports
+
+Revision ID: 8b41f0c2d5e7
+Revises: 3c9d2e7f41a8
+Create Date: 2026-10-18 11:58:03.517204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b41f0c2d5e7'
+down_revision = '3c9d2e7f41a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('areas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True))
+
+    op.create_table('deleted_records',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(length=100), nullable=False),
+    sa.Column('natural_key', sa.Text(), nullable=False),
+    sa.Column('replaced_by', sa.Text(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('deleted_records', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_deleted_records_deleted_at'), ['deleted_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('deleted_records', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_deleted_records_deleted_at'))
+
+    op.drop_table('deleted_records')
+
+    with op.batch_alter_table('areas', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
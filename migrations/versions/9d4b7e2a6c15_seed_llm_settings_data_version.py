@@ -0,0 +1,28 @@
+"""Seed the llm_settings data version
+
+Revision ID: 9d4b7e2a6c15
+Revises: 2c7e5a9f0b13
+Create Date: 2026-10-18 19:02:37.518306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4b7e2a6c15'
+down_revision = '2c7e5a9f0b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Seeded like 'catalog', so concurrent first bumps update a row instead of racing to insert it.
+    op.execute(sa.text(
+        "INSERT INTO data_versions (name, version) "
+        "SELECT 'llm_settings', 1 WHERE NOT EXISTS (SELECT 1 FROM data_versions WHERE name = 'llm_settings')"
+    ))
+
+
+def downgrade():
+    op.execute(sa.text("DELETE FROM data_versions WHERE name = 'llm_settings'"))
@@ -0,0 +1,40 @@
+"""Add drafts for server-side import previews and bulk edits
+
+Revision ID: a4f7d2c91e6b
+Revises: 5e1a9c7b3d20
+Create Date: 2026-10-18 13:02:17.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4f7d2c91e6b'
+down_revision = '5e1a9c7b3d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('drafts',
+    sa.Column('token', sa.String(length=64), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('payload', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('token')
+    )
+    with op.batch_alter_table('drafts', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_drafts_expires_at'), ['expires_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_drafts_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('drafts', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_drafts_user_id'))
+        batch_op.drop_index(batch_op.f('ix_drafts_expires_at'))
+
+    op.drop_table('drafts')
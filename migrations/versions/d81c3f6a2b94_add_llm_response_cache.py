@@ -0,0 +1,41 @@
+"""Add llm_response_cache for repeated LLM prompts
+
+Revision ID: d81c3f6a2b94
+Revises: a4f7d2c91e6b
+Create Date: 2026-10-18 14:11:42.907315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81c3f6a2b94'
+down_revision = 'a4f7d2c91e6b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('llm_response_cache',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('provider', sa.String(length=50), nullable=False),
+    sa.Column('model', sa.String(length=255), nullable=False),
+    sa.Column('response', sa.Text(), nullable=False),
+    sa.Column('hit_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('last_used_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('llm_response_cache', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_llm_response_cache_expires_at'), ['expires_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_llm_response_cache_last_used_at'), ['last_used_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('llm_response_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_llm_response_cache_last_used_at'))
+        batch_op.drop_index(batch_op.f('ix_llm_response_cache_expires_at'))
+
+    op.drop_table('llm_response_cache')